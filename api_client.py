@@ -0,0 +1,105 @@
+# Client HTTP de l'API de scoring, utilisé par le dashboard.
+# Une seule session requests est gardée ouverte (keep-alive) : les connexions, et donc les poignées de main TLS,
+# sont réutilisées d'un appel à l'autre. Chaque requête a un délai maximal (connexion / lecture), et les erreurs
+# passagères (connexion coupée, 429, 5xx) sont réessayées avec un délai croissant (backoff exponentiel).
+#
+# Adresse de l'API : paramètre base_url, sinon variable d'environnement SCORING_API_URL.
+
+import os
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+DEFAULT_API_URL = "https://scorecredit-93521a3704b4.herokuapp.com"
+
+
+class APIError(Exception):
+    """Échec d'un appel à l'API (après les nouvelles tentatives) ; status_code vaut None si l'API n'a pas répondu."""
+
+    def __init__(self, message, status_code=None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class ScoringClient:
+    """Client de l'API de scoring avec session persistante, délais maximaux et nouvelles tentatives."""
+
+    def __init__(self, base_url=None, connect_timeout=3.05, read_timeout=30, retries=3, backoff_factor=0.3, pool_size=10):
+        self.base_url = (base_url or os.environ.get('SCORING_API_URL', DEFAULT_API_URL)).rstrip('/')
+        self.timeout = (connect_timeout, read_timeout)
+
+        # Les routes appelées sont idempotentes : on peut réessayer aussi les POST
+        retry = Retry(total=retries, backoff_factor=backoff_factor, status_forcelist=(429, 500, 502, 503, 504),
+                      allowed_methods=frozenset({'GET', 'POST'}), raise_on_status=False)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        # Passe à False quand l'API ne sait pas appliquer des facteurs relatifs (cf. sensitivity)
+        self.relative_what_if = True
+
+    def _request(self, method, path, **kwargs):
+        try:
+            response = self.session.request(method, f"{self.base_url}{path}", timeout=self.timeout, **kwargs)
+        except requests.RequestException as e:
+            raise APIError(f"API injoignable : {e}") from e
+        if response.status_code != 200:
+            try:
+                detail = response.json().get('detail', response.text)
+            except ValueError:
+                detail = response.text
+            raise APIError(f"Erreur {response.status_code} : {detail}", response.status_code)
+        return response.json()
+
+    def score(self, client_id):
+        """Probabilité de défaut et décision d'un client connu de l'API."""
+        return self._request('GET', f"/clients/{client_id}/score")
+
+    def explain(self, client_id, top_k=None):
+        """Explication SHAP (format compact) d'un client connu de l'API."""
+        params = {'top_k': top_k} if top_k is not None else None
+        return self._request('GET', f"/clients/{client_id}/explain", params=params)
+
+    def score_and_explain(self, client_id, top_k=None):
+        """Score et explication SHAP d'un client en un seul aller-retour."""
+        params = {'top_k': top_k} if top_k is not None else None
+        return self._request('GET', f"/clients/{client_id}/decision", params=params)
+
+    def global_importance(self, segment=None, top_k=None):
+        """Importance globale (moyenne des |SHAP|) des features du modèle servi, sur toute la population ou un segment."""
+        params = {key: value for key, value in {'segment': segment, 'top_k': top_k}.items() if value is not None}
+        return self._request('GET', "/importance/global", params=params or None)
+
+    def predict(self, rows):
+        """Probabilités et décisions pour une liste de clients décrits par leurs features ({colonne: valeur})."""
+        return self._request('POST', "/predict", json={"data": rows})
+
+    def what_if(self, row, perturbations, mode='grid', relative=False, model_version=None):
+        """Probabilités et décisions des variantes d'un client ({feature: valeurs à essayer}), en un seul appel au modèle."""
+        params = {'model_version': model_version} if model_version is not None else None
+        body = {"row": row, "perturbations": perturbations, "mode": mode, "relative": relative}
+        return self._request('POST', "/predict/whatif", json=body, params=params)
+
+    def sensitivity(self, row, features, factors, model_version=None):
+        """
+        Courbes de sensibilité d'un client : chaque feature varie seule. Les facteurs (ex. 0.8 pour -20 %) sont
+        appliqués par l'API aux valeurs d'origine du client. Si l'API ne peut pas les convertir (503 : préparation
+        du modèle absente), chaque feature parcourt à la place [0, 1] en unités du modèle (features mises à
+        l'échelle), autant de valeurs que de facteurs ; ce repli est gardé pour les appels suivants.
+        La réponse de /predict/whatif ("values" : valeurs essayées en unités du modèle) est complétée par "relative".
+        """
+        if self.relative_what_if:
+            try:
+                response = self.what_if(row, {feature: list(factors) for feature in features}, 'independent', True, model_version)
+                return {**response, 'relative': True}
+            except APIError as e:
+                if e.status_code != 503:
+                    raise
+        values = [i / max(len(factors) - 1, 1) for i in range(len(factors))]
+        response = self.what_if(row, {feature: values for feature in features}, 'independent', False, model_version)
+        # L'API répond : le 503 venait bien des facteurs relatifs, pas d'une API indisponible
+        self.relative_what_if = False
+        return {**response, 'relative': False}
+
+    def close(self):
+        self.session.close()
@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Benchmark de latence et de débit de l'API de scoring.
+# L'application FastAPI est lancée dans le processus (TestClient), ou bien une API déjà démarrée est
+# interrogée avec --url. Pour chaque route, taille de lot et niveau de concurrence, on mesure les latences
+# p50/p95/p99 et le débit en lignes par seconde, et les résultats sont écrits en JSON pour comparer les commits
+# (par défaut bench_results/<commit>.json, un fichier par commit mesuré, hors du suivi git).
+#
+# Utilisation :
+#     python benchmark_api.py
+#     python benchmark_api.py --output bench_results/essai.json
+#     python benchmark_api.py --endpoints predict --batch-sizes 1 100 --concurrency 1 8
+#     python benchmark_api.py --url http://127.0.0.1:8000
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+
+# Répertoire des résultats (ignoré par git)
+RESULTS_DIR = 'bench_results'
+
+
+def percentile_ms(latencies, q):
+    return round(float(np.percentile(latencies, q)) * 1000, 3)
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def make_payloads(features, batch_size, n_requests):
+    """Prépare les corps de requête à l'avance (lots successifs, en bouclant sur le jeu de données)."""
+    payloads = []
+    for i in range(n_requests):
+        start = (i * batch_size) % len(features)
+        rows = features.iloc[np.arange(start, start + batch_size) % len(features)]
+        payloads.append({"data": rows.to_dict(orient='records')})
+    return payloads
+
+
+def run_config(post, endpoint, payloads, batch_size, concurrency, warmup=2):
+    """Envoie les requêtes avec `concurrency` clients simultanés et renvoie les statistiques de la configuration."""
+    for payload in payloads[:warmup]:
+        post(endpoint, payload)
+
+    def timed_call(payload):
+        start = time.perf_counter()
+        status = post(endpoint, payload)
+        return time.perf_counter() - start, status
+
+    wall_start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(timed_call, payloads))
+    wall_time = time.perf_counter() - wall_start
+
+    latencies = [latency for latency, status in results if status == 200]
+    errors = sum(1 for _, status in results if status != 200)
+    summary = {"endpoint": endpoint, "batch_size": batch_size, "concurrency": concurrency,
+               "requests": len(payloads), "errors": errors,
+               "rows_per_second": round(len(latencies) * batch_size / wall_time, 2)}
+    if latencies:
+        summary.update({"p50_ms": percentile_ms(latencies, 50), "p95_ms": percentile_ms(latencies, 95),
+                        "p99_ms": percentile_ms(latencies, 99), "mean_ms": round(float(np.mean(latencies)) * 1000, 3)})
+    return summary
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark de latence et de débit de l'API de scoring.")
+    parser.add_argument('--data', default='reconstituted_test_sampled.csv', help="CSV de features (avec SK_ID_CURR)")
+    parser.add_argument('--url', help="adresse d'une API déjà démarrée (sinon l'application est lancée dans le processus)")
+    parser.add_argument('--endpoints', nargs='+', default=['predict', 'explain'], help="routes à mesurer")
+    parser.add_argument('--batch-sizes', nargs='+', type=int, default=[1, 10, 100, 1000], help="nombre de lignes par requête")
+    parser.add_argument('--concurrency', nargs='+', type=int, default=[1, 2, 4, 8, 16, 32], help="nombre de clients simultanés")
+    parser.add_argument('--requests', type=int, default=50, help="nombre de requêtes par configuration")
+    parser.add_argument('--max-rows', type=int, default=20000, help="nombre maximal de lignes envoyées par configuration")
+    parser.add_argument('--with-cache', action='store_true', help="garder les caches de résultats de l'API (désactivés par défaut)")
+    parser.add_argument('--output', help="fichier JSON de résultats (par défaut bench_results/<commit>.json)")
+    args = parser.parse_args()
+
+    features = pd.read_csv(args.data).drop(columns=['SK_ID_CURR'])
+
+    if args.url:
+        import requests
+        session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_maxsize=max(args.concurrency))
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+
+        def post(endpoint, payload):
+            return session.post(f"{args.url.rstrip('/')}/{endpoint}", json=payload).status_code
+    else:
+        # Sans cache, chaque requête mesure bien le calcul et non une relecture
+        if not args.with_cache:
+            os.environ['PREDICT_CACHE_SIZE'] = '0'
+            os.environ['EXPLAIN_CACHE_SIZE'] = '0'
+        from fastapi.testclient import TestClient
+        import main
+        client = TestClient(main.app)
+        client.__enter__()  # déclenche le démarrage de l'application (chargement de l'explainer, warm-up)
+
+        def post(endpoint, payload):
+            return client.post(f"/{endpoint}", json=payload).status_code
+
+    results = []
+    for endpoint in args.endpoints:
+        for batch_size in args.batch_sizes:
+            n_requests = max(5, min(args.requests, args.max_rows // batch_size))
+            payloads = make_payloads(features, batch_size, n_requests)
+            for concurrency in args.concurrency:
+                summary = run_config(post, endpoint, payloads, batch_size, concurrency)
+                results.append(summary)
+                print(f"{endpoint:>8} batch={batch_size:<5} concurrency={concurrency:<3} "
+                      f"p50={summary.get('p50_ms')}ms p95={summary.get('p95_ms')}ms p99={summary.get('p99_ms')}ms "
+                      f"rows/s={summary['rows_per_second']} errors={summary['errors']}")
+
+    commit = git_commit()
+    report = {"meta": {"commit": commit, "timestamp": time.strftime('%Y-%m-%dT%H:%M:%S'),
+                       "python": platform.python_version(), "machine": platform.machine(), "cpus": os.cpu_count(),
+                       "target": args.url or "in-process", "cache": None if args.url else args.with_cache,
+                       "data": args.data},
+              "results": results}
+    output = args.output or os.path.join(RESULTS_DIR, f"{commit or time.strftime('%Y%m%dT%H%M%S')}.json")
+    os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Résultats écrits dans {output}")
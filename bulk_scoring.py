@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Scoring en masse d'un fichier CSV de features (ex. reconstituted_test_sampled.csv).
+# Le fichier est lu par morceaux de taille fixe : la mémoire reste bornée quelle que soit la taille du fichier,
+# et les résultats (SK_ID_CURR, probability, prediction) sont écrits au fil de l'eau en NDJSON ou en CSV.
+#
+# Utilisation :
+#     python bulk_scoring.py reconstituted_test_sampled.csv --output scores.ndjson
+#     python bulk_scoring.py population.csv --format csv --chunksize 50000 > scores.csv
+
+import argparse
+import sys
+import numpy as np
+import pandas as pd
+import model_registry
+
+
+def missing_columns(columns, feature_names):
+    """Colonnes attendues absentes d'un en-tête (LightGBM remplace les espaces des noms par des '_')."""
+    columns = {col.replace(' ', '_') for col in columns}
+    return [col for col in ['SK_ID_CURR'] + list(feature_names) if col not in columns]
+
+
+def check_header(source, feature_names):
+    """Vérifie l'en-tête du CSV sans en lire les lignes ; ValueError si des colonnes manquent."""
+    missing = missing_columns(pd.read_csv(source, nrows=0).columns, feature_names)
+    if missing:
+        raise ValueError(f"Colonnes manquantes : {missing}")
+
+
+def score_chunks(source, version, chunksize=10000, output_format='ndjson'):
+    """
+    Score un fichier CSV morceau par morceau et génère les résultats sous forme de texte.
+
+    Paramètres
+    --------
+        source (str ou fichier) :
+            le CSV à scorer ; il doit contenir SK_ID_CURR et toutes les colonnes du modèle
+        version (ModelVersion) :
+            le modèle chargé avec son seuil de décision (cf. model_registry.load_files) ; le scorer rapide
+            est utilisé s'il existe
+        chunksize (int) :
+            le nombre de lignes lues et scorées à la fois
+        output_format (str) :
+            'ndjson' (un objet JSON par ligne) ou 'csv'
+
+    Retour
+    --------
+        un générateur de blocs de texte, un bloc par morceau (l'en-tête CSV n'est écrit qu'une fois)
+    """
+    if output_format not in ('ndjson', 'csv'):
+        raise ValueError(f"Format de sortie inconnu : {output_format}")
+
+    feature_names = list(version.feature_names)
+    write_header = True
+
+    for chunk in pd.read_csv(source, chunksize=chunksize):
+        # LightGBM remplace les espaces des noms de colonnes par des '_' (cf. test_variable_names)
+        chunk.columns = [col.replace(' ', '_') for col in chunk.columns]
+        missing = missing_columns(chunk.columns, feature_names)
+        if missing:
+            raise ValueError(f"Colonnes manquantes : {missing}")
+
+        # Les features sont remises dans l'ordre attendu par le modèle
+        y_pred_proba = version.predict_proba(chunk[feature_names].to_numpy(dtype=np.float64))
+        y_pred = (y_pred_proba >= version.threshold).astype(int)
+
+        results = pd.DataFrame({'SK_ID_CURR': chunk['SK_ID_CURR'].values,
+                                'probability': y_pred_proba,
+                                'prediction': y_pred})
+
+        if output_format == 'csv':
+            yield results.to_csv(index=False, header=write_header)
+            write_header = False
+        else:
+            yield results.to_json(orient='records', lines=True, double_precision=15).rstrip('\n') + '\n'
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Scoring en masse d'un fichier CSV de features, par morceaux.")
+    parser.add_argument('input', help="CSV de features à scorer (avec SK_ID_CURR)")
+    parser.add_argument('--output', help="fichier de sortie (sortie standard par défaut)")
+    parser.add_argument('--format', choices=['ndjson', 'csv'], default='ndjson', help="format de sortie")
+    parser.add_argument('--chunksize', type=int, default=10000, help="nombre de lignes scorées à la fois")
+    parser.add_argument('--model', default='credit_scoring_new.joblib', help="pipeline sérialisé")
+    parser.add_argument('--threshold', default='optimal_threshold.txt', help="fichier contenant le seuil optimal")
+    args = parser.parse_args()
+
+    # Chargement du modèle (gelé en scorer rapide si possible) et du seuil optimal
+    version = model_registry.load_files(args.model, args.threshold)
+
+    output = open(args.output, 'w', newline='') if args.output else sys.stdout
+    try:
+        for block in score_chunks(args.input, version, args.chunksize, args.format):
+            output.write(block)
+    finally:
+        if args.output:
+            output.close()
@@ -0,0 +1,83 @@
+# Agrégats précalculés pour les graphiques de population du dashboard (page "Feature Visualization").
+# Les distributions ne dépendent que du jeu de données, pas du client sélectionné : elles sont calculées une
+# seule fois par jeu (histogrammes, effectifs par catégorie, statistiques de boîtes à moustaches, grilles 2D
+# pour les couples de variables numériques). À chaque affichage, seul le point du client est ajouté par-dessus ;
+# le coût de dessin ne dépend plus du nombre de clients.
+
+import numpy as np
+import pandas as pd
+from matplotlib import cbook
+
+
+class ChartCache:
+    """Agrégats des distributions de chaque variable (et de chaque couple de variables) d'un jeu de données."""
+
+    def __init__(self, df, bins=30, grid_size=50, max_fliers=200, exclude=('SK_ID_CURR',)):
+        self.bins = bins
+        self.grid_size = grid_size
+        self.max_fliers = max_fliers
+        columns = [col for col in df.columns if col not in exclude]
+        self.numeric = [col for col in columns if pd.api.types.is_numeric_dtype(df[col])]
+        self.categorical = [col for col in columns if col not in self.numeric]
+
+        # Les booléens sont traités comme des 0/1 ; les valeurs manquantes sont ignorées
+        values = {col: df[col].to_numpy(dtype=np.float64, na_value=np.nan) for col in self.numeric}
+
+        self.histograms = {}
+        for col in self.numeric:
+            finite = values[col][np.isfinite(values[col])]
+            self.histograms[col] = np.histogram(finite, bins=bins)
+
+        self.category_counts = {}
+        for col in self.categorical:
+            counts = df[col].value_counts()
+            self.category_counts[col] = counts[counts > 0]
+
+        # Boîtes à moustaches : une série de statistiques (format de Axes.bxp) par variable numérique et catégorielle
+        self.box_stats = {}
+        for col in self.numeric:
+            for by in self.categorical:
+                self.box_stats[(col, by)] = self._box_stats(values[col], df[by])
+
+        # Couples numériques : effectifs sur une grille grid_size x grid_size (histogramme 2D)
+        self.grids = {}
+        for i, x_col in enumerate(self.numeric):
+            for y_col in self.numeric[i:]:
+                x, y = values[x_col], values[y_col]
+                both = np.isfinite(x) & np.isfinite(y)
+                counts, x_edges, y_edges = np.histogram2d(x[both], y[both], bins=grid_size)
+                self.grids[(x_col, y_col)] = (counts, x_edges, y_edges)
+
+    def _box_stats(self, values, groups):
+        stats = []
+        codes, labels = pd.factorize(groups, sort=True)
+        for code, label in enumerate(labels):
+            group = values[(codes == code) & np.isfinite(values)]
+            if len(group) == 0:
+                continue
+            box = cbook.boxplot_stats(group)[0]
+            # Les valeurs extrêmes sont sous-échantillonnées pour garder un dessin de taille bornée
+            if len(box['fliers']) > self.max_fliers:
+                box['fliers'] = np.random.default_rng(0).choice(box['fliers'], self.max_fliers, replace=False)
+            box['label'] = str(label)
+            stats.append(box)
+        return stats
+
+    def histogram(self, col):
+        """(effectifs, bornes des classes) de la variable numérique col."""
+        return self.histograms[col]
+
+    def counts(self, col):
+        """Effectif de chaque catégorie de la variable col (ordre décroissant)."""
+        return self.category_counts[col]
+
+    def boxes(self, col, by):
+        """Statistiques des boîtes à moustaches de col pour chaque catégorie de by."""
+        return self.box_stats[(col, by)]
+
+    def grid(self, x_col, y_col):
+        """(effectifs, bornes en x, bornes en y) de la grille 2D du couple (x_col, y_col)."""
+        if (x_col, y_col) in self.grids:
+            return self.grids[(x_col, y_col)]
+        counts, y_edges, x_edges = self.grids[(y_col, x_col)]
+        return counts.T, x_edges, y_edges
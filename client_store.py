@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Stock précalculé des scores et des explications SHAP par client (SK_ID_CURR).
+# Le job hors ligne score et explique tous les clients d'un jeu de données puis écrit dans un répertoire :
+#     ids.npy          les SK_ID_CURR, dans l'ordre des lignes
+#     probability.npy  la probabilité de défaut de chaque client
+#     shap_values.npy  la matrice SHAP (clients x features) de la classe positive, en float32
+#     meta.json        les noms des features, la valeur de base de l'explainer et l'empreinte du pipeline
+# Les matrices sont relues en mémoire partagée (memory-map) et un dictionnaire SK_ID_CURR -> ligne
+# permet de répondre en temps constant. Le seuil n'est pas stocké : la décision est toujours recalculée avec le
+# seuil courant. L'empreinte du pipeline permet à l'API d'ignorer un stock calculé avec un autre modèle.
+#
+# Utilisation :
+#     python client_store.py reconstituted_test_sampled.csv --store client_store
+
+import argparse
+import json
+import os
+import joblib
+import numpy as np
+import pandas as pd
+import parallel_shap
+from result_cache import file_fingerprint
+
+
+def build_store(data_path, model, store_dir='client_store', chunksize=5000, n_workers=None, pipeline_fingerprint=None):
+    """
+    Score et explique tous les clients d'un CSV de features et écrit le stock dans store_dir.
+
+    Paramètres
+    --------
+        data_path (str) :
+            le CSV de features (SK_ID_CURR puis les colonnes du modèle)
+        model (Pipeline) :
+            le pipeline entraîné
+        store_dir (str) :
+            le répertoire de sortie
+        chunksize (int) :
+            le nombre de clients traités à la fois (la mémoire reste bornée)
+        n_workers (int) :
+            la taille du pool de processus pour SHAP (cf. parallel_shap)
+        pipeline_fingerprint (str) :
+            l'empreinte du fichier du pipeline (cf. result_cache.file_fingerprint), écrite dans meta.json
+
+    Retour
+    --------
+        le nombre de clients écrits dans le stock
+    """
+    os.makedirs(store_dir, exist_ok=True)
+    import shap  # seulement pour le précalcul : l'API lit le stock sans importer shap
+    explainer = shap.Explainer(model.named_steps['model'])
+    feature_names = model.named_steps['model'].feature_name_
+
+    # Premier passage : seulement les identifiants, pour dimensionner les matrices
+    ids = pd.read_csv(data_path, usecols=['SK_ID_CURR'])['SK_ID_CURR'].to_numpy(dtype=np.int64)
+    np.save(os.path.join(store_dir, 'ids.npy'), ids)
+
+    probability = np.lib.format.open_memmap(os.path.join(store_dir, 'probability.npy'), mode='w+',
+                                            dtype=np.float64, shape=(len(ids),))
+    shap_values = np.lib.format.open_memmap(os.path.join(store_dir, 'shap_values.npy'), mode='w+',
+                                            dtype=np.float32, shape=(len(ids), len(feature_names)))
+
+    # Second passage : score et SHAP morceau par morceau, écrits directement dans les fichiers
+    start = 0
+    columns = None
+    for chunk in pd.read_csv(data_path, chunksize=chunksize):
+        features = chunk.drop(columns=['SK_ID_CURR'])
+        columns = features.columns.tolist()
+        stop = start + len(chunk)
+        probability[start:stop] = model.predict_proba(features)[:, 1]
+        shap_values[start:stop] = parallel_shap.explain_batch(features, explainer, n_workers=n_workers)
+        start = stop
+
+    probability.flush()
+    shap_values.flush()
+    parallel_shap.shutdown_pool()
+
+    expected_value = float(np.atleast_1d(explainer.expected_value)[-1])
+    with open(os.path.join(store_dir, 'meta.json'), 'w') as f:
+        json.dump({'feature_names': columns, 'expected_value': expected_value, 'n_clients': len(ids),
+                   'pipeline_fingerprint': pipeline_fingerprint}, f)
+
+    return len(ids)
+
+
+class ClientStore:
+    """Lecture du stock précalculé : recherche d'un client en temps constant via un index SK_ID_CURR -> ligne."""
+
+    def __init__(self, store_dir='client_store'):
+        with open(os.path.join(store_dir, 'meta.json'), 'r') as f:
+            meta = json.load(f)
+        self.feature_names = meta['feature_names']
+        self.expected_value = meta['expected_value']
+        # None pour un stock écrit avant l'ajout de l'empreinte : il n'est alors associé à aucun modèle
+        self.pipeline_fingerprint = meta.get('pipeline_fingerprint')
+
+        # Les matrices ne sont pas chargées en mémoire : seules les lignes lues sont paginées depuis le disque
+        self.probability = np.load(os.path.join(store_dir, 'probability.npy'), mmap_mode='r')
+        self.shap_values = np.load(os.path.join(store_dir, 'shap_values.npy'), mmap_mode='r')
+        ids = np.load(os.path.join(store_dir, 'ids.npy'))
+        self.index = {int(client_id): row for row, client_id in enumerate(ids)}
+
+    def __contains__(self, client_id):
+        return client_id in self.index
+
+    def __len__(self):
+        return len(self.index)
+
+    def probability_of(self, client_id):
+        return float(self.probability[self.index[client_id]])
+
+    def shap_values_of(self, client_id):
+        return np.asarray(self.shap_values[self.index[client_id]], dtype=np.float64)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Précalcule les scores et les valeurs SHAP de tous les clients d'un CSV.")
+    parser.add_argument('input', help="CSV de features (avec SK_ID_CURR)")
+    parser.add_argument('--store', default='client_store', help="répertoire du stock")
+    parser.add_argument('--chunksize', type=int, default=5000, help="nombre de clients traités à la fois")
+    parser.add_argument('--workers', type=int, default=None, help="taille du pool de processus pour SHAP")
+    parser.add_argument('--model', default='credit_scoring_new.joblib', help="pipeline sérialisé")
+    args = parser.parse_args()
+
+    n_clients = build_store(args.input, joblib.load(args.model), args.store, args.chunksize, args.workers,
+                            file_fingerprint(args.model))
+    print(f"{n_clients} clients écrits dans {args.store}")
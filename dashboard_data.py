@@ -0,0 +1,148 @@
+# Couche de chargement des données du dashboard (script_streamlit_plus_v7.py).
+# Chaque CSV est converti une seule fois en fichier Feather (format colonnaire Arrow, non compressé) avec des
+# types réduits, choisis par dtype_optimizer.py (mêmes règles que convert_types dans le notebook de feature engineering)
+# et enregistrés à côté du fichier Feather (<nom>.dtypes.json) : une reconstruction après modification du CSV garde
+# les mêmes types et les mêmes catégories. Pour les features du modèle, les seuils des arbres sont pris en compte
+# si le modèle est disponible (une colonne reste en float64 si le float32 changeait une prédiction).
+# Les lancements suivants relisent le fichier Feather en memory-map au lieu de reparser le CSV ; il est régénéré
+# automatiquement si le CSV est plus récent.
+# La vue réduite du jeu initial (colonnes affichées, AGE et EMPLOYMENT_LENGTH en années) est elle aussi précalculée.
+# ClientIndex retrouve la ligne d'un client (SK_ID_CURR) dans les deux jeux en temps constant.
+#
+# Préparation des fichiers (facultative, sinon faite au premier chargement) :
+#     python dashboard_data.py
+
+import os
+import pandas as pd
+import pyarrow.feather as feather
+import dtype_optimizer
+
+CACHE_DIR = os.environ.get('DASHBOARD_CACHE_DIR', 'dashboard_cache')
+
+TEST_DATA_PATH = 'reconstituted_test_sampled.csv'
+INITIAL_DATA_PATH = 'application_test_sampled.csv'
+GLOBAL_IMPORTANCE_PATH = 'global_feature_importance.csv'
+MODEL_PATH = 'credit_scoring_new.joblib'
+
+# Colonnes du jeu initial affichées dans le dashboard
+REDUCED_COLUMNS = ['SK_ID_CURR', 'CODE_GENDER', 'DAYS_BIRTH', 'NAME_FAMILY_STATUS', 'CNT_CHILDREN', 'CNT_FAM_MEMBERS',
+                   'NAME_HOUSING_TYPE', 'DAYS_EMPLOYED', 'AMT_INCOME_TOTAL', 'AMT_CREDIT', 'AMT_ANNUITY', 'AMT_GOODS_PRICE']
+
+
+def feature_thresholds():
+    """Seuils des arbres du modèle (None si le modèle n'est pas disponible), pour le choix des types des features."""
+    if not os.path.exists(MODEL_PATH):
+        return None
+    import joblib
+    return dtype_optimizer.model_thresholds(joblib.load(MODEL_PATH))
+
+
+def convert_types(df, name, cache_dir=CACHE_DIR, thresholds=None):
+    """Convertit les types de données pour réduire la mémoire, avec le schéma enregistré de la table `name`."""
+    df, report = dtype_optimizer.optimize(df, dtypes_path(name, cache_dir), thresholds)
+    print(f"{name} : {dtype_optimizer.format_report(report)}")
+    return df
+
+
+def reduce_initial_data(initial_data):
+    """Vue réduite du jeu initial : colonnes affichées, âge et durée d'emploi convertis en années."""
+    reduced = initial_data[REDUCED_COLUMNS].copy()
+    reduced['AGE'] = round(reduced['DAYS_BIRTH'] / -365, 2)
+    reduced['EMPLOYMENT_LENGTH'] = round(reduced['DAYS_EMPLOYED'] / -365, 2)
+    return reduced.drop(['DAYS_BIRTH', 'DAYS_EMPLOYED'], axis=1)
+
+
+def columnar_path(name, cache_dir=CACHE_DIR):
+    return os.path.join(cache_dir, f'{name}.feather')
+
+
+def dtypes_path(name, cache_dir=CACHE_DIR):
+    return os.path.join(cache_dir, f'{name}.dtypes.json')
+
+
+def is_up_to_date(path, source_path):
+    return os.path.exists(path) and os.path.getmtime(path) >= os.path.getmtime(source_path)
+
+
+def write_columnar(df, path):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    # Écriture dans un fichier temporaire puis renommage : une autre session ne lit jamais un fichier à moitié écrit
+    tmp_path = f'{path}.tmp'
+    feather.write_feather(df, tmp_path, compression='uncompressed')
+    os.replace(tmp_path, path)
+
+
+def read_columnar(path):
+    # Sans compression, les colonnes sont lues directement depuis le fichier projeté en mémoire
+    return feather.read_table(path, memory_map=True).to_pandas()
+
+
+def load_table(name, source_path, build, cache_dir=CACHE_DIR):
+    """Relit la table `name` depuis son fichier Feather, ou la construit avec build() et l'écrit si le CSV a changé."""
+    path = columnar_path(name, cache_dir)
+    if not is_up_to_date(path, source_path):
+        write_columnar(build(), path)
+    return read_columnar(path)
+
+
+def load_datasets(cache_dir=CACHE_DIR):
+    """
+    Charge les jeux de données du dashboard.
+
+    Retour
+    --------
+        test_data : les features du modèle par client (SK_ID_CURR en première colonne)
+        initial_test_data_reduced : la vue réduite du jeu initial (informations client affichées)
+        global_importance : les importances globales des features (Feature, MeanAbsSHAP)
+    """
+    test_data = load_table('test_data', TEST_DATA_PATH,
+                           lambda: convert_types(pd.read_csv(TEST_DATA_PATH, index_col=False), 'test_data', cache_dir,
+                                                 feature_thresholds), cache_dir)
+    initial_test_data_reduced = load_table('initial_test_data_reduced', INITIAL_DATA_PATH,
+                                           lambda: convert_types(reduce_initial_data(pd.read_csv(INITIAL_DATA_PATH)),
+                                                                 'initial_test_data_reduced', cache_dir), cache_dir)
+    global_importance = pd.read_csv(GLOBAL_IMPORTANCE_PATH)
+    return test_data, initial_test_data_reduced, global_importance
+
+
+class ClientIndex:
+    """
+    Index SK_ID_CURR -> position de ligne, commun aux features du modèle et à la vue réduite du jeu initial.
+    La recherche passe par la table de hachage d'un pd.Index : elle se fait en temps constant quelle que soit
+    la taille de la population, et ne renvoie qu'une ligne au lieu de parcourir toute la colonne.
+    """
+
+    def __init__(self, test_data, initial_data):
+        self.test_data = test_data
+        self.initial_data = initial_data
+        self.ids = pd.Index(test_data['SK_ID_CURR'])
+        if not self.ids.is_unique:
+            raise ValueError("SK_ID_CURR doit être unique dans le jeu de test")
+        # Position de chaque client dans la vue réduite (-1 s'il en est absent)
+        self.initial_positions = pd.Index(initial_data['SK_ID_CURR']).get_indexer(self.ids)
+
+    def __contains__(self, client_id):
+        return client_id in self.ids
+
+    def __len__(self):
+        return len(self.ids)
+
+    def position(self, client_id):
+        return self.ids.get_loc(client_id)
+
+    def features(self, client_id):
+        """Features du modèle du client (DataFrame d'une ligne, sans SK_ID_CURR)."""
+        i = self.position(client_id)
+        return self.test_data.iloc[i:i + 1, 1:].reset_index(drop=True)
+
+    def initial_info(self, client_id):
+        """Informations du client dans la vue réduite (DataFrame d'une ligne, vide si le client en est absent)."""
+        i = self.initial_positions[self.position(client_id)]
+        if i < 0:
+            return self.initial_data.iloc[0:0]
+        return self.initial_data.iloc[i:i + 1].reset_index(drop=True)
+
+
+if __name__ == '__main__':
+    for name, df in zip(['test_data', 'initial_test_data_reduced', 'global_importance'], load_datasets()):
+        print(f"{name} : {df.shape[0]} lignes x {df.shape[1]} colonnes, {df.memory_usage(deep=True).sum() / 1e6:.1f} Mo")
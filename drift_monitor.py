@@ -0,0 +1,271 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Surveillance de la dérive des données (cf. notebook 05 "sans drift" et le rapport Evidently).
+# La population de référence est résumée par un histogramme à classes fixes par feature : bornes aux quantiles
+# de la référence pour les variables numériques, catégories les plus fréquentes (+ "autres") pour les variables
+# catégorielles, et une classe pour les valeurs manquantes. Les données observées ensuite (requêtes /predict de
+# l'API, ou un CSV) sont comptées dans les mêmes classes : la mémoire est fixe par feature, aucune ligne n'est
+# gardée, et deux histogrammes de mêmes classes s'additionnent (morceaux d'un fichier, workers).
+# La dérive de chaque feature est mesurée à la demande par le PSI (Population Stability Index) et par la
+# statistique de Kolmogorov-Smirnov calculée sur les classes (variables numériques).
+#
+# Utilisation :
+#     python drift_monitor.py build reconstituted_test_sampled.csv --output drift_reference.json
+#     python drift_monitor.py compare drift_reference.json nouveaux_clients.csv --top 20
+
+import argparse
+import json
+import os
+import threading
+import numpy as np
+import pandas as pd
+
+# Seuils usuels du PSI : < 0.1 stable, 0.1 à 0.25 dérive modérée, > 0.25 dérive significative
+PSI_MODERATE = 0.1
+PSI_SIGNIFICANT = 0.25
+
+# Nombre de lignes comptées à la fois (borne la mémoire de la comparaison aux bornes)
+UPDATE_ROWS = 4096
+
+
+class DriftSketch:
+    """
+    Histogrammes à classes fixes de toutes les features.
+
+    edges : bornes intérieures de chaque feature (une valeur v va dans la classe du nombre de bornes <= v)
+    categories : {feature: catégories retenues} pour les features catégorielles, codées 0..k-1 (k = "autres")
+    counts : matrice features x (classes + 1) ; la dernière colonne compte les valeurs manquantes
+    """
+
+    def __init__(self, features, edges, categories=None, counts=None):
+        self.features = list(features)
+        self.edges = [np.asarray(e, dtype=np.float64) for e in edges]
+        self.categories = dict(categories or {})
+        self.n_bins = np.array([len(e) + 1 for e in self.edges])
+        width = int(self.n_bins.max()) if len(self.features) else 1
+
+        # Bornes complétées par +inf pour compter toutes les features en une seule comparaison vectorisée
+        self._padded = np.full((len(self.features), width - 1), np.inf)
+        for j, e in enumerate(self.edges):
+            self._padded[j, :len(e)] = e
+        self._offsets = np.arange(len(self.features)) * (width + 1)
+        self.counts = np.zeros((len(self.features), width + 1), dtype=np.int64) if counts is None else np.asarray(counts, dtype=np.int64)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_reference(cls, df, bins=20, exclude=('SK_ID_CURR', 'TARGET')):
+        """Classes choisies sur la population de référence, qui est ensuite comptée."""
+        features, edges, categories = [], [], {}
+        for col in df.columns:
+            if col in exclude:
+                continue
+            values = df[col]
+            if pd.api.types.is_numeric_dtype(values) or pd.api.types.is_bool_dtype(values):
+                numeric = values.to_numpy(dtype=np.float64, na_value=np.nan)
+                numeric = numeric[~np.isnan(numeric)]
+                quantiles = np.quantile(numeric, np.linspace(0, 1, bins + 1)[1:-1]) if len(numeric) else []
+                edges.append(np.unique(quantiles))
+            else:
+                kept = values.value_counts().index[:bins - 1].astype(str).tolist()
+                categories[col] = kept
+                edges.append(np.arange(len(kept)) + 0.5)
+            features.append(col)
+        sketch = cls(features, edges, categories)
+        sketch.update_frame(df)
+        return sketch
+
+    def empty_like(self):
+        """Histogrammes vides avec les mêmes classes (pour les données observées)."""
+        return DriftSketch(self.features, self.edges, self.categories)
+
+    def encode(self, df):
+        """Matrice des features (ordre du sketch) : valeurs numériques, codes pour les features catégorielles."""
+        X = np.empty((len(df), len(self.features)), dtype=np.float64)
+        for j, col in enumerate(self.features):
+            if col in self.categories:
+                values = df[col]
+                codes = pd.Categorical(values.astype(str).where(values.notna()), categories=self.categories[col]).codes
+                X[:, j] = np.where(values.isna(), np.nan, np.where(codes < 0, len(self.categories[col]), codes))
+            else:
+                X[:, j] = df[col].to_numpy(dtype=np.float64, na_value=np.nan)
+        return X
+
+    def update(self, X):
+        """Compte une matrice (lignes x features, dans l'ordre du sketch) ; sûr entre threads."""
+        X = np.array(X, dtype=np.float64, ndmin=2, copy=False)
+        width = self.counts.shape[1]
+        delta = np.zeros(self.counts.size, dtype=np.int64)
+        for start in range(0, len(X), UPDATE_ROWS):
+            # Features x lignes : chaque comparaison à une borne porte sur des valeurs contiguës en mémoire
+            block = np.ascontiguousarray(X[start:start + UPDATE_ROWS].T)
+            bins = np.zeros(block.shape, dtype=np.int16)
+            for k in range(self._padded.shape[1]):
+                bins += block >= self._padded[:, k:k + 1]
+            bins = np.minimum(bins, self.n_bins[:, None] - 1)
+            bins[np.isnan(block)] = width - 1
+            delta += np.bincount((bins + self._offsets[:, None]).ravel(), minlength=self.counts.size)
+        with self._lock:
+            self.counts += delta.reshape(self.counts.shape)
+        return self
+
+    def update_frame(self, df):
+        return self.update(self.encode(df))
+
+    def merge(self, other):
+        if other.features != self.features:
+            raise ValueError("Les deux sketches n'ont pas les mêmes features")
+        with self._lock:
+            self.counts += other.counts
+        return self
+
+    def reset(self):
+        with self._lock:
+            self.counts[:] = 0
+
+    @property
+    def n_rows(self):
+        return int(self.counts[0].sum()) if len(self.features) else 0
+
+    def histogram(self, j):
+        """Effectifs de la feature j : ses classes puis les valeurs manquantes."""
+        return np.append(self.counts[j, :self.n_bins[j]], self.counts[j, -1])
+
+    def to_dict(self):
+        return {'features': self.features, 'edges': [e.tolist() for e in self.edges],
+                'categories': self.categories, 'counts': self.counts.tolist()}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data['features'], data['edges'], data['categories'], data['counts'])
+
+    def save(self, path):
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self.to_dict(), f)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'r') as f:
+            return cls.from_dict(json.load(f))
+
+
+class DriftRecorder:
+    """
+    Comptage différé des lignes reçues par l'API : observe() ne fait que mettre la matrice en file (aucun calcul
+    sur le chemin du scoring) ; un thread la compte par lots toutes les interval secondes, ou dès que max_rows
+    lignes attendent. Au-delà de 4 x max_rows lignes en attente, l'appelant compte lui-même : la mémoire reste bornée.
+    """
+
+    def __init__(self, sketch, interval=1.0, max_rows=UPDATE_ROWS):
+        self.sketch = sketch
+        self.interval = interval
+        self.max_rows = max_rows
+        self._pending = []
+        self._pending_rows = 0
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+
+    def observe(self, X):
+        with self._lock:
+            self._pending.append(X)
+            self._pending_rows += len(X)
+            overflow = self._pending_rows >= 4 * self.max_rows
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+        if overflow:
+            self.flush()
+        elif self._pending_rows >= self.max_rows:
+            self._wake.set()
+
+    def flush(self):
+        """Compte toutes les lignes en attente (appelé avant chaque rapport)."""
+        # Un seul comptage à la fois : au retour, les lignes prises par le thread sont elles aussi comptées
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending, self._pending_rows = self._pending, [], 0
+            if pending:
+                self.sketch.update(np.vstack(pending))
+        return self.sketch
+
+    def reset(self):
+        with self._flush_lock:
+            with self._lock:
+                self._pending, self._pending_rows = [], 0
+            self.sketch.reset()
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            self.flush()
+
+
+def psi(expected, actual, epsilon=1e-4):
+    """Population Stability Index entre deux histogrammes de mêmes classes (proportions bornées par epsilon)."""
+    p = np.maximum(expected / max(expected.sum(), 1), epsilon)
+    q = np.maximum(actual / max(actual.sum(), 1), epsilon)
+    return float(np.sum((q - p) * np.log(q / p)))
+
+
+def binned_ks(expected, actual):
+    """Écart maximal entre les fonctions de répartition des deux histogrammes (valeurs manquantes exclues)."""
+    if expected.sum() == 0 or actual.sum() == 0:
+        return np.nan
+    return float(np.max(np.abs(np.cumsum(expected) / expected.sum() - np.cumsum(actual) / actual.sum())))
+
+
+def drift_report(reference, current):
+    """
+    Dérive de chaque feature entre la référence et les données observées (mêmes classes).
+
+    Retour : DataFrame (feature, psi, ks, missing_reference, missing_current, status), par PSI décroissant
+    """
+    rows = []
+    for j, feature in enumerate(reference.features):
+        expected, actual = reference.histogram(j), current.histogram(j)
+        n_expected, n_actual = max(expected.sum(), 1), max(actual.sum(), 1)
+        value = psi(expected, actual) if actual.sum() else np.nan
+        ks = np.nan if feature in reference.categories else binned_ks(expected[:-1], actual[:-1])
+        rows.append({'feature': feature, 'psi': value, 'ks': ks,
+                     'missing_reference': expected[-1] / n_expected, 'missing_current': actual[-1] / n_actual})
+    report = pd.DataFrame(rows, columns=['feature', 'psi', 'ks', 'missing_reference', 'missing_current'])
+    report['status'] = np.select([report['psi'] >= PSI_SIGNIFICANT, report['psi'] >= PSI_MODERATE, report['psi'].notna()],
+                                 ['significant', 'moderate', 'stable'], 'no data')
+    return report.sort_values('psi', ascending=False, na_position='last').reset_index(drop=True)
+
+
+def sketch_csv(reference, path, chunksize=10000):
+    """Histogrammes d'un CSV lu par morceaux, dans les classes de la référence."""
+    current = reference.empty_like()
+    for chunk in pd.read_csv(path, chunksize=chunksize):
+        current.update_frame(chunk)
+    return current
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Histogrammes de référence et mesure de la dérive des données.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    build = subparsers.add_parser('build', help="construit les histogrammes de la population de référence")
+    build.add_argument('input', help="CSV de la population de référence")
+    build.add_argument('--output', default='drift_reference.json', help="fichier des histogrammes de référence")
+    build.add_argument('--bins', type=int, default=20, help="nombre de classes par feature")
+    compare = subparsers.add_parser('compare', help="mesure la dérive d'un CSV par rapport à la référence")
+    compare.add_argument('reference', help="fichier des histogrammes de référence")
+    compare.add_argument('input', help="CSV des données à comparer")
+    compare.add_argument('--top', type=int, default=20, help="nombre de features affichées")
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        sketch = DriftSketch.from_reference(pd.read_csv(args.input), args.bins)
+        sketch.save(args.output)
+        print(f"Histogrammes de {len(sketch.features)} features ({sketch.n_rows} lignes) écrits dans {args.output}")
+    else:
+        reference = DriftSketch.load(args.reference)
+        report = drift_report(reference, sketch_csv(reference, args.input))
+        print(report['status'].value_counts().to_string())
+        print(report.head(args.top).to_string(index=False))
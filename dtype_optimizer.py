@@ -0,0 +1,193 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Optimisation des types de données, à partir d'un schéma enregistré.
+# Les règles sont celles de convert_types dans le notebook de feature engineering : identifiants en int32, textes
+# en catégories, colonnes 0/1 en booléens, flottants en float32, entiers en int32. Le premier passage choisit les
+# types et les écrit dans un fichier JSON ; les chargements suivants appliquent le même schéma, pour que le jeu
+# ait toujours les mêmes types (mêmes catégories, mêmes colonnes en float32) d'un lancement et d'un jeu à l'autre.
+#
+# Les seuils des arbres LightGBM sont en double : arrondir une feature en float32 peut faire passer une valeur de
+# l'autre côté d'un seuil et changer la prédiction. Quand les seuils du modèle sont fournis, une colonne n'est
+# passée en float32 que si aucune de ses valeurs ne change de côté d'un seuil ; sinon elle reste en float64.
+# Ce choix dépend du modèle : le schéma est donc enregistré par empreinte du pipeline (dtypes_path), et un nouveau
+# modèle choisit le sien au lieu de réutiliser des colonnes float32 sûres pour l'ancien.
+#
+# Une colonne entière ou 0/1 dans le schéma mais avec des valeurs manquantes dans le jeu chargé n'est pas convertie
+# (astype(bool) ferait de NaN un True, et un identifiant manquant deviendrait 0) : elle garde son type flottant.
+#
+# Enregistrement du schéma et comparaison de la mémoire / des prédictions :
+#     python dtype_optimizer.py reconstituted_test_sampled.csv --model credit_scoring_new.joblib --output feature_dtypes.json
+
+import argparse
+import json
+import os
+import numpy as np
+import pandas as pd
+
+INT32 = np.iinfo(np.int32)
+
+
+def split_thresholds(booster):
+    """Seuils numériques des arbres d'un Booster LightGBM, triés, par nom de feature."""
+    dump = booster.dump_model()
+    names = dump['feature_names']
+    thresholds = {name: set() for name in names}
+
+    def walk(node):
+        if 'split_feature' not in node:
+            return
+        if node.get('decision_type') == '<=':
+            thresholds[names[node['split_feature']]].add(float(node['threshold']))
+        walk(node['left_child'])
+        walk(node['right_child'])
+
+    for tree in dump['tree_info']:
+        walk(tree['tree_structure'])
+    return {name: np.array(sorted(values)) for name, values in thresholds.items()}
+
+
+def model_thresholds(model):
+    """Seuils du modèle de scoring (pipeline imblearn/sklearn ou estimateur LightGBM)."""
+    estimator = model.steps[-1][1] if hasattr(model, 'steps') else model
+    return split_thresholds(estimator.booster_)
+
+
+def float32_is_safe(values, thresholds):
+    """Vrai si l'arrondi en float32 ne fait changer aucune valeur de côté par rapport aux seuils (x <= seuil)."""
+    if thresholds is None or len(thresholds) == 0:
+        return True
+    values = values[~np.isnan(values)]
+    rounded = values.astype(np.float32).astype(np.float64)
+    return np.array_equal(np.searchsorted(thresholds, values, 'left'), np.searchsorted(thresholds, rounded, 'left'))
+
+
+def infer_dtypes(df, thresholds=None):
+    """
+    Choisit le type de chaque colonne (mêmes règles que convert_types).
+
+    thresholds : seuils des arbres par colonne (cf. model_thresholds) ; les colonnes dont l'arrondi en float32
+    changerait un côté de seuil restent en float64. LightGBM remplace les espaces des noms par des '_'.
+
+    Retour : {colonne: {'dtype': ..., 'categories': [...] pour les catégories}}
+    """
+    dtypes = {}
+    for c in df:
+        column = df[c]
+        if 'SK_ID' in c:
+            dtypes[c] = {'dtype': 'int32'}
+        elif column.dtype == 'object' and column.nunique() < df.shape[0]:
+            dtypes[c] = {'dtype': 'category', 'categories': sorted(column.dropna().astype(str).unique())}
+        elif set(column.unique()) == {0, 1}:
+            dtypes[c] = {'dtype': 'bool'}
+        elif pd.api.types.is_float_dtype(column):
+            limits = None if thresholds is None else thresholds.get(c.replace(' ', '_'))
+            safe = float32_is_safe(column.to_numpy(dtype=np.float64), limits)
+            dtypes[c] = {'dtype': 'float32' if safe else 'float64'}
+        elif pd.api.types.is_integer_dtype(column) and (column.empty or (INT32.min <= column.min() and column.max() <= INT32.max)):
+            dtypes[c] = {'dtype': 'int32'}
+        else:
+            dtypes[c] = {'dtype': str(column.dtype)}
+    return dtypes
+
+
+def apply_dtypes(df, dtypes):
+    """
+    Applique un schéma de types ; les colonnes absentes du schéma gardent leur type, de même que les colonnes
+    int32 ou bool qui ont des valeurs manquantes (aucune valeur n'est inventée).
+    """
+    for c, spec in dtypes.items():
+        if c not in df:
+            continue
+        if spec['dtype'] in ('int32', 'bool') and df[c].isna().any():
+            continue
+        if spec['dtype'] == 'int32':
+            df[c] = df[c].astype(np.int32)
+        elif spec['dtype'] == 'category':
+            # Catégories enregistrées, puis les valeurs jamais vues ajoutées à la fin
+            values = df[c].astype('string').astype(object).where(df[c].notna())
+            unseen = sorted(set(values.dropna()) - set(spec['categories']))
+            df[c] = pd.Categorical(values, categories=spec['categories'] + unseen)
+        else:
+            df[c] = df[c].astype(spec['dtype'])
+    return df
+
+
+def memory_usage(df):
+    """Mémoire occupée par un DataFrame, en octets (textes compris)."""
+    return int(df.memory_usage(deep=True).sum())
+
+
+def dtypes_path(path, fingerprint):
+    """Fichier du schéma propre à un pipeline : feature_dtypes.json -> feature_dtypes.<empreinte>.json"""
+    root, ext = os.path.splitext(path)
+    return f'{root}.{fingerprint}{ext}'
+
+
+def save_dtypes(dtypes, path):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(dtypes, f, indent=1)
+    os.replace(tmp_path, path)
+
+
+def load_dtypes(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def optimize(df, path=None, thresholds=None):
+    """
+    Réduit la mémoire d'un DataFrame avec le schéma enregistré dans path.
+    Si path n'existe pas (ou vaut None), le schéma est choisi sur df (infer_dtypes) puis enregistré.
+    thresholds peut être une fonction sans argument, appelée seulement quand le schéma doit être choisi.
+
+    Retour : (DataFrame optimisé, rapport {'before', 'after'} en octets)
+    """
+    before = memory_usage(df)
+    if path is not None and os.path.exists(path):
+        dtypes = load_dtypes(path)
+    else:
+        dtypes = infer_dtypes(df, thresholds() if callable(thresholds) else thresholds)
+        if path is not None:
+            save_dtypes(dtypes, path)
+    df = apply_dtypes(df, dtypes)
+    return df, {'before': before, 'after': memory_usage(df)}
+
+
+def format_report(report):
+    return f"{report['before'] / 1e6:.1f} Mo -> {report['after'] / 1e6:.1f} Mo ({1 - report['after'] / report['before']:.0%} de moins)"
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Choisit et enregistre les types réduits d'un jeu de données")
+    parser.add_argument('data', help="CSV à optimiser")
+    parser.add_argument('--model', help="modèle joblib : ses seuils protègent les prédictions, qui sont comparées")
+    parser.add_argument('--output', default='feature_dtypes.json',
+                        help="fichier JSON du schéma de types (avec --model, l'empreinte du modèle est ajoutée au nom)")
+    args = parser.parse_args()
+
+    data = pd.read_csv(args.data)
+    model = None
+    if args.model:
+        import joblib
+        from result_cache import file_fingerprint
+        model = joblib.load(args.model)
+        # Même fichier que celui relu par l'API pour ce modèle
+        args.output = dtypes_path(args.output, file_fingerprint(args.model))
+    original = data.copy() if model is not None else None
+
+    # Le schéma est toujours recalculé ici (le fichier existant est remplacé)
+    if os.path.exists(args.output):
+        os.remove(args.output)
+    optimized, report = optimize(data, args.output, model_thresholds(model) if model is not None else None)
+    print(f"Schéma écrit dans {args.output} : {format_report(report)}")
+    print(pd.Series({c: spec['dtype'] for c, spec in load_dtypes(args.output).items()}).value_counts().to_string())
+
+    if model is not None:
+        columns = model.steps[-1][1].feature_name_
+        def probabilities(df):
+            X = df.drop(columns='SK_ID_CURR', errors='ignore').to_numpy(dtype=np.float64)
+            return model.predict_proba(pd.DataFrame(X, columns=columns))[:, 1]
+        print(f"Écart maximal des probabilités : {np.abs(probabilities(optimized) - probabilities(original)).max():.3g}")
@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Chemin d'inférence allégé pour le pipeline de scoring.
+# Le pipeline imblearn (SMOTE puis LightGBM) est « gelé » : les étapes de rééchantillonnage sont ignorées
+# (elles n'agissent qu'à l'entraînement), les éventuelles étapes de prétraitement ajustées (imputation,
+# mise à l'échelle) sont converties en vecteurs NumPy, et le Booster LightGBM est appelé directement
+# sur une matrice contiguë, sans validation DataFrame ni passage par les wrappers sklearn/imblearn.
+#
+# Export / validation :
+#     python fast_scorer.py --export fast_model --validate reconstituted_test_sampled.csv
+#
+# L'export sert aussi d'artefact allégé pour le démarrage de l'API : relire le modèle natif et le JSON évite de
+# désérialiser le pipeline complet (et d'importer imblearn). L'empreinte du pipeline d'origine est enregistrée
+# dans preprocessing.json, pour que l'API ne l'utilise que s'il correspond au credit_scoring_new.joblib courant.
+
+import argparse
+import json
+import os
+import time
+import joblib
+import lightgbm as lgb
+import numpy as np
+import pandas as pd
+from result_cache import file_fingerprint
+
+
+def _freeze_step(name, step):
+    """Convertit une étape ajustée du pipeline en spécification NumPy (None si elle est sans effet à l'inférence)."""
+    # Les samplers imblearn (SMOTE...) ne transforment pas les données à la prédiction
+    if hasattr(step, 'fit_resample'):
+        return None
+    kind = type(step).__name__
+    if kind == 'SimpleImputer':
+        return {'name': name, 'kind': 'impute', 'fill': np.asarray(step.statistics_, dtype=np.float64)}
+    if kind == 'MinMaxScaler':
+        return {'name': name, 'kind': 'affine', 'scale': np.asarray(step.scale_, dtype=np.float64),
+                'offset': np.asarray(step.min_, dtype=np.float64)}
+    if kind == 'StandardScaler':
+        n_features = step.n_features_in_
+        mean = np.zeros(n_features) if step.mean_ is None else np.asarray(step.mean_, dtype=np.float64)
+        scale = np.ones(n_features) if step.scale_ is None else np.asarray(step.scale_, dtype=np.float64)
+        return {'name': name, 'kind': 'affine', 'scale': 1.0 / scale, 'offset': -mean / scale}
+    raise NotImplementedError(f"Étape '{name}' ({kind}) non prise en charge par le scorer rapide")
+
+
+class FastScorer:
+    """Scorer LightGBM direct : prétraitements gelés en tableaux NumPy + Booster natif."""
+
+    def __init__(self, booster, feature_names, steps, dtype=np.float64, source_fingerprint=None):
+        self.booster = booster
+        self.feature_names = list(feature_names)
+        self.steps = steps
+        # Empreinte du pipeline dont le scorer est issu (renseignée à l'export, None sinon)
+        self.source_fingerprint = source_fingerprint
+        # float64 par défaut : les seuils des arbres sont en double, le float32 peut faire basculer une valeur
+        # proche d'un seuil et ne garantit donc pas l'égalité à 1e-9 avec le pipeline
+        self.dtype = dtype
+
+    @classmethod
+    def from_pipeline(cls, pipeline, dtype=np.float64):
+        steps = [frozen for frozen in (_freeze_step(name, step) for name, step in pipeline.steps[:-1]) if frozen]
+        estimator = pipeline.steps[-1][1]
+        booster = estimator.booster_
+        if booster.pandas_categorical:
+            raise NotImplementedError("Les features catégorielles pandas ne sont pas prises en charge par le scorer rapide")
+        return cls(booster, estimator.feature_name_, steps, dtype)
+
+    def to_matrix(self, df):
+        """Matrice contiguë dans l'ordre des colonnes du modèle (noms avec espaces ou '_' acceptés)."""
+        df = df.rename(columns=lambda col: col.replace(' ', '_'))
+        return np.ascontiguousarray(df[self.feature_names].to_numpy(dtype=np.float64))
+
+    def predict_proba(self, X):
+        """Probabilité de la classe positive pour une matrice déjà ordonnée (lignes x features)."""
+        X = np.array(X, dtype=np.float64, order='C', ndmin=2)
+        for step in self.steps:
+            if step['kind'] == 'impute':
+                missing = np.isnan(X)
+                if missing.any():
+                    X[missing] = np.take(step['fill'], np.nonzero(missing)[1])
+            elif step['kind'] == 'affine':
+                X *= step['scale']
+                X += step['offset']
+        if self.dtype != np.float64:
+            X = X.astype(self.dtype)
+        return self.booster.predict(X)
+
+    def export(self, directory, source_fingerprint=None):
+        """Écrit le Booster au format texte natif de LightGBM et les prétraitements gelés en JSON."""
+        os.makedirs(directory, exist_ok=True)
+        self.booster.save_model(os.path.join(directory, 'model.txt'))
+        spec = {'feature_names': self.feature_names,
+                'dtype': np.dtype(self.dtype).name,
+                'source_fingerprint': source_fingerprint or self.source_fingerprint,
+                'steps': [{key: (value.tolist() if isinstance(value, np.ndarray) else value) for key, value in step.items()}
+                          for step in self.steps]}
+        with open(os.path.join(directory, 'preprocessing.json'), 'w') as f:
+            json.dump(spec, f)
+
+    @classmethod
+    def load(cls, directory):
+        with open(os.path.join(directory, 'preprocessing.json'), 'r') as f:
+            spec = json.load(f)
+        steps = [{key: (np.asarray(value, dtype=np.float64) if isinstance(value, list) else value) for key, value in step.items()}
+                 for step in spec['steps']]
+        booster = lgb.Booster(model_file=os.path.join(directory, 'model.txt'))
+        return cls(booster, spec['feature_names'], steps, np.dtype(spec['dtype']), spec.get('source_fingerprint'))
+
+
+def read_source_fingerprint(directory):
+    """Empreinte du pipeline d'origine d'un scorer exporté (None si l'export est absent ou n'en a pas)."""
+    path = os.path.join(directory, 'preprocessing.json')
+    if not os.path.exists(path) or not os.path.exists(os.path.join(directory, 'model.txt')):
+        return None
+    with open(path, 'r') as f:
+        return json.load(f).get('source_fingerprint')
+
+
+def max_abs_difference(pipeline, scorer, df):
+    """Écart maximal entre les probabilités du pipeline et celles du scorer rapide sur un jeu de features."""
+    reference = pipeline.predict_proba(df)[:, 1]
+    fast = scorer.predict_proba(scorer.to_matrix(df))
+    return float(np.max(np.abs(reference - fast)))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Export et validation du scorer LightGBM rapide.")
+    parser.add_argument('--model', default='credit_scoring_new.joblib', help="pipeline sérialisé")
+    parser.add_argument('--export', help="répertoire où écrire le scorer rapide")
+    parser.add_argument('--validate', help="CSV de features (avec SK_ID_CURR) sur lequel comparer au pipeline")
+    parser.add_argument('--tolerance', type=float, default=1e-9, help="écart maximal accepté")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    pipeline = joblib.load(args.model)
+    pipeline_seconds = time.perf_counter() - start
+    scorer = FastScorer.from_pipeline(pipeline)
+
+    if args.validate:
+        features = pd.read_csv(args.validate).drop(columns=['SK_ID_CURR'])
+        difference = max_abs_difference(pipeline, scorer, features)
+        print(f"Écart maximal avec le pipeline : {difference:.3e}")
+        if difference > args.tolerance:
+            raise SystemExit(f"Écart supérieur à la tolérance {args.tolerance}")
+
+    if args.export:
+        # Même empreinte que celle calculée par l'API (contenu du fichier)
+        scorer.export(args.export, file_fingerprint(args.model))
+        print(f"Scorer rapide exporté dans {args.export}")
+        start = time.perf_counter()
+        FastScorer.load(args.export)
+        print(f"Chargement : pipeline {pipeline_seconds:.3f} s, modèle allégé {time.perf_counter() - start:.3f} s")
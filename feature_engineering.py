@@ -0,0 +1,697 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Feature engineering du notebook 01_Feature_Engineering.ipynb sous forme de module importable.
+# Les fonctions du notebook (agg_numeric, agg_categorical, aggregate_client, merge_with_main, ratios) sont reprises
+# telles quelles et servent aux deux modes de calcul :
+#   - engineer_features : le notebook sur des tables chargées en mémoire (référence, petits jeux de données) ;
+#   - build_features : le même calcul sans jamais charger une table enfant en entier.
+#
+# Dans build_features, chaque CSV est lu par morceaux et réparti sur disque en partitions de SK_ID_CURR (un prêt
+# SK_ID_BUREAU / SK_ID_PREV appartient à un seul client : toutes ses lignes tombent dans la même partition).
+# Les agrégats d'un client ne dépendent que de ses propres lignes : chaque partition est agrégée séparément,
+# dans un pool de processus, avec les fonctions du notebook. La mémoire de pointe dépend de la taille d'un
+# morceau et d'une partition, pas de celle des tables.
+#
+# Deux décisions du notebook portent sur une table entière et sont reproduites à l'identique :
+#   - les types (convert_types, colonnes catégorielles de get_dummies) sont décidés lors d'un premier passage
+#     sur tout le fichier, puis appliqués à chaque morceau ;
+#   - la suppression des colonnes redondantes (np.unique(agg, axis=1)), qui trie aussi les colonnes par valeurs,
+#     est calculée à partir d'un résumé de chaque partition (voir column_summary) : la sortie a les mêmes
+#     colonnes, dans le même ordre et avec les mêmes valeurs que celle du notebook.
+# Les colonnes retenues pour chaque agrégat sont enregistrées dans feature_plan.json.
+#
+# Utilisation (fichiers d'entrée du notebook dans --data-dir) :
+#     python feature_engineering.py --data-dir data --partitions 16 --workers 4
+
+import argparse
+import contextlib
+import glob
+import heapq
+import json
+import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from functools import cmp_to_key
+import numpy as np
+import pandas as pd
+
+# Tables principales (une ligne par client) et fichiers produits
+MAIN_FILES = {'train': 'app_train_domain.csv', 'test': 'app_test_domain.csv'}
+OUTPUT_FILES = {'train': 'train_after_fe.csv', 'test': 'test_after_fe.csv'}
+
+# Tables enfants
+TABLE_FILES = {'bureau': 'bureaux.csv', 'bureau_balance': 'bureau_balances.csv', 'previous': 'previous_applications.csv',
+               'cash': 'POS_CASH_balances.csv', 'credit': 'credit_card_balances.csv', 'installments': 'installments_payment.csv'}
+
+# Tables passées par convert_types dans le notebook
+CONVERTED_TABLES = ('previous', 'cash', 'credit', 'installments')
+
+# Tables agrégées par prêt (SK_ID_PREV) puis par client, avec aggregate_client
+LOAN_TABLES = ('cash', 'credit', 'installments')
+
+# Agrégats fusionnés avec les tables principales, dans l'ordre du notebook
+CLIENT_BLOCKS = ['bureau_counts', 'bureau_agg', 'bureau_balance_by_client', 'previous_counts', 'previous_agg',
+                 'cash_by_client', 'credit_by_client', 'installments_by_client']
+
+PLAN_FILE = 'feature_plan.json'
+
+# Première ligne (valeur de clé) où deux colonnes diffèrent : valeur utilisée quand elles ne diffèrent jamais
+NO_DIFFERENCE = np.iinfo(np.int64).max
+
+
+######################################################################################################################
+# Fonctions du notebook
+######################################################################################################################
+
+def application_domain(df):
+    """
+    Étapes du notebook 00 qui donnent app_train_domain.csv / app_test_domain.csv à partir d'une table application :
+    indicateur DAYS_EMPLOYED_ANOM, valeur aberrante 365243 remplacée par NaN, DAYS_BIRTH en valeur absolue.
+    """
+    df['DAYS_EMPLOYED_ANOM'] = df['DAYS_EMPLOYED'] == 365243
+    df['DAYS_EMPLOYED'] = df['DAYS_EMPLOYED'].replace({365243: np.nan})
+    df['DAYS_BIRTH'] = abs(df['DAYS_BIRTH'])
+    return df
+
+
+def add_ratio_features(df):
+    """Ajoute les variables de ratio du notebook à une table principale (train ou test)."""
+    df['CREDIT_INCOME_PERCENT'] = df['AMT_CREDIT'] / df['AMT_INCOME_TOTAL']
+    df['INCOME_CREDIT_PERC'] = df['AMT_INCOME_TOTAL'] / df['AMT_CREDIT']
+    df['ANNUITY_INCOME_PERCENT'] = df['AMT_ANNUITY'] / df['AMT_INCOME_TOTAL']
+    df['CREDIT_TERM'] = df['AMT_ANNUITY'] / df['AMT_CREDIT']
+    df['DAYS_EMPLOYED_PERCENT'] = df['DAYS_EMPLOYED'] / df['DAYS_BIRTH']
+    df['INCOME_PER_PERSON'] = df['AMT_INCOME_TOTAL'] / df['CNT_FAM_MEMBERS']
+    return df
+
+
+def convert_types(df):
+    """Convertit les types de données pour optimiser l'utilisation de la mémoire (règles du notebook)."""
+    for c in df:
+        if ('SK_ID' in c):
+            df[c] = df[c].fillna(0).astype(np.int32)
+        elif (df[c].dtype == 'object') and (df[c].nunique() < df.shape[0]):
+            df[c] = df[c].astype('category')
+        elif list(df[c].unique()) == [1, 0]:
+            df[c] = df[c].astype(bool)
+        elif df[c].dtype == float:
+            df[c] = df[c].astype(np.float32)
+        elif df[c].dtype == int:
+            df[c] = df[c].astype(np.int32)
+    return df
+
+
+def numeric_stats(df, group_var, df_name):
+    """Statistiques de agg_numeric (count, mean, max, min, sum), avant la suppression des colonnes redondantes."""
+    # Supprimer les variables d'identification autres que la variable de groupement
+    for col in df:
+        if col != group_var and 'SK_ID' in col:
+            df = df.drop(columns=col)
+
+    group_ids = df[group_var]
+    numeric_df = df.select_dtypes('number')
+    numeric_df[group_var] = group_ids
+
+    agg = numeric_df.groupby(group_var).agg(['count', 'mean', 'max', 'min', 'sum']).reset_index()
+
+    columns = [group_var]
+    for var in agg.columns.levels[0]:
+        if var != group_var:
+            for stat in agg.columns.levels[1][:-1]:
+                columns.append(f'{df_name}_{var}_{stat}')
+
+    agg.columns = columns
+    return agg
+
+
+def categorical_stats(df, parent_var, df_name):
+    """Statistiques de agg_categorical (sum, count, mean des indicatrices), avant la suppression des colonnes redondantes."""
+    categorical = pd.get_dummies(df.select_dtypes(include=['object', 'category']))
+
+    # Test sur les colonnes (et non categorical.empty) : une partition sans ligne garde les mêmes colonnes que les autres
+    if len(categorical.columns) == 0:
+        return pd.DataFrame({parent_var: df[parent_var]}).groupby(parent_var).size().reset_index(name='count')
+
+    categorical[parent_var] = df[parent_var]
+    categorical = categorical.groupby(parent_var).agg(['sum', 'count', 'mean'])
+
+    noms_colonnes = []
+    for var in categorical.columns.levels[0]:
+        for stat in ['sum', 'count', 'mean']:
+            noms_colonnes.append(f'{df_name}_{var}_{stat}')
+
+    categorical.columns = noms_colonnes
+    return categorical
+
+
+def is_count_only(agg):
+    # Sans variable catégorielle, agg_categorical renvoie un simple décompte, que le notebook ne dédoublonne pas
+    return agg.index.name is None and len(agg.columns) == 2 and agg.columns[1] == 'count'
+
+
+def unique_columns(agg):
+    """Positions des colonnes gardées par le notebook (np.unique : colonnes triées par valeurs, doublons supprimés)."""
+    if is_count_only(agg):
+        return np.arange(agg.shape[1])
+    _, idx = np.unique(agg, axis=1, return_index=True)
+    return idx
+
+
+def drop_duplicate_columns(agg):
+    return agg.iloc[:, unique_columns(agg)]
+
+
+def agg_numeric(df, group_var, df_name):
+    """
+    Agrège les valeurs numériques d'un dataframe pour chaque valeur de group_var (count, mean, max, min, sum),
+    renomme les colonnes '{df_name}_{variable}_{statistique}' et supprime les colonnes redondantes.
+    """
+    return drop_duplicate_columns(numeric_stats(df, group_var, df_name))
+
+
+def agg_categorical(df, parent_var, df_name):
+    """
+    Agrège les variables catégorielles d'un dataframe enfant (sum, count, mean des indicatrices) pour chaque
+    valeur de parent_var, renomme les colonnes et supprime les colonnes redondantes.
+    """
+    return drop_duplicate_columns(categorical_stats(df, parent_var, df_name))
+
+
+def has_categorical(df):
+    return any(df.dtypes == 'object') or any(df.dtypes == 'category')
+
+
+def loans_to_client(df, df_agg, df_counts, group_vars, df_name):
+    """Second niveau de aggregate_client : les statistiques par prêt sont agrégées par client."""
+    if df_counts is not None:
+        df_by_loan = df_counts.merge(df_agg, on=group_vars[0], how='outer')
+    else:
+        df_by_loan = df_agg
+    df_by_loan = df_by_loan.merge(df[[group_vars[0], group_vars[1]]], on=group_vars[0], how='left')
+    df_by_loan = df_by_loan.drop(columns=[group_vars[0]])
+    return numeric_stats(df_by_loan, group_vars[1], df_name)
+
+
+def aggregate_client(df, group_vars, df_names):
+    """Agrège les données au niveau des prêts au niveau des clients."""
+    df_agg = agg_numeric(df, group_var=group_vars[0], df_name=df_names[0])
+    df_counts = agg_categorical(df, parent_var=group_vars[0], df_name=df_names[0]) if has_categorical(df) else None
+    return drop_duplicate_columns(loans_to_client(df, df_agg, df_counts, group_vars, df_names[1]))
+
+
+def merge_with_main(df_main, df_to_merge):
+    df_main = df_main.merge(df_to_merge, on='SK_ID_CURR', how='left')
+    return df_main
+
+
+######################################################################################################################
+# Agrégats de chaque table, communs aux deux modes de calcul
+######################################################################################################################
+
+def table_blocks(name, df):
+    """Agrégats de premier niveau d'une table enfant (par client, ou par prêt pour les tables à deux niveaux)."""
+    if name == 'bureau':
+        return {'bureau_counts': categorical_stats(df, 'SK_ID_CURR', 'bureau'),
+                'bureau_agg': numeric_stats(df.drop(columns=['SK_ID_BUREAU']), 'SK_ID_CURR', 'bureau')}
+    if name == 'bureau_balance':
+        return {'bureau_balance_counts': categorical_stats(df, 'SK_ID_BUREAU', 'bureau_balance'),
+                'bureau_balance_agg': numeric_stats(df, 'SK_ID_BUREAU', 'bureau_balance')}
+    if name == 'previous':
+        return {'previous_agg': numeric_stats(df, 'SK_ID_CURR', 'previous'),
+                'previous_counts': categorical_stats(df, 'SK_ID_CURR', 'previous')}
+    blocks = {f'{name}_agg': numeric_stats(df, 'SK_ID_PREV', name)}
+    if has_categorical(df):
+        blocks[f'{name}_counts'] = categorical_stats(df, 'SK_ID_PREV', name)
+    return blocks
+
+
+def loan_blocks():
+    """Noms des agrégats par prêt, utilisés par client_blocks."""
+    return ['bureau_balance_counts', 'bureau_balance_agg'] + [f'{name}_{kind}' for name in LOAN_TABLES for kind in ('agg', 'counts')]
+
+
+def client_blocks(tables, blocks):
+    """Agrégats par client des tables à deux niveaux, à partir des agrégats par prêt déjà dédoublonnés."""
+    # bureau_balance : par prêt, puis SK_ID_CURR retrouvé dans bureau
+    bureau_by_loan = blocks['bureau_balance_agg'].merge(blocks['bureau_balance_counts'], right_index=True,
+                                                        left_on='SK_ID_BUREAU', how='outer')
+    bureau_by_loan = tables['bureau'][['SK_ID_BUREAU', 'SK_ID_CURR']].merge(bureau_by_loan, on='SK_ID_BUREAU', how='left')
+    result = {'bureau_balance_by_client': numeric_stats(bureau_by_loan.drop(columns=['SK_ID_BUREAU']), 'SK_ID_CURR', 'client')}
+
+    for name in LOAN_TABLES:
+        result[f'{name}_by_client'] = loans_to_client(tables[name], blocks[f'{name}_agg'], blocks.get(f'{name}_counts'),
+                                                      ['SK_ID_PREV', 'SK_ID_CURR'], 'client')
+    return result
+
+
+def load_tables(data_dir='.'):
+    """Lit les tables enfants en entier, comme le notebook (convert_types sur previous, cash, credit, installments)."""
+    tables = {}
+    for name, file in TABLE_FILES.items():
+        df = pd.read_csv(os.path.join(data_dir, file))
+        tables[name] = convert_types(df) if name in CONVERTED_TABLES else df
+    return tables
+
+
+def engineer_features(main, tables):
+    """
+    Calcul du notebook sur des tables en mémoire.
+
+    Paramètres
+    --------
+        main (DataFrame) :
+            la table principale (app_train_domain.csv ou app_test_domain.csv)
+        tables (dict) :
+            les tables enfants par nom (voir load_tables)
+
+    Retour
+    --------
+        la table principale avec les ratios et les agrégats de toutes les tables enfants
+    """
+    blocks = {}
+    for name, df in tables.items():
+        blocks.update({block: drop_duplicate_columns(agg) for block, agg in table_blocks(name, df).items()})
+    blocks.update({block: drop_duplicate_columns(agg) for block, agg in client_blocks(tables, blocks).items()})
+
+    main = add_ratio_features(main)
+    for block in CLIENT_BLOCKS:
+        main = merge_with_main(main, blocks[block])
+    return main
+
+
+######################################################################################################################
+# Suppression des colonnes redondantes à partir de résumés par partition
+######################################################################################################################
+#
+# np.unique(agg, axis=1) trie les colonnes dans l'ordre lexicographique de leurs valeurs (lignes triées par clé,
+# NaN après tous les nombres), garde la première de chaque groupe de colonnes égales et ne fusionne jamais deux
+# colonnes qui contiennent des NaN (NaN != NaN). La comparaison de deux colonnes est donc décidée par la première
+# clé où elles diffèrent. Chaque partition en donne, pour chaque couple de colonnes, la première clé de différence
+# et le sens de la comparaison ; sur la table entière, c'est la partition dont la clé est la plus petite qui décide.
+
+def _sortable(values):
+    """Entiers non signés qui se comparent comme les flottants dans le tri de np.unique (-0.0 = 0.0, NaN en dernier)."""
+    bits = (values.astype(np.float64) + 0.0).view(np.uint64)
+    keys = np.where(bits >> np.uint64(63) == 1, ~bits, bits | np.uint64(1 << 63))
+    keys[np.isnan(values)] = np.iinfo(np.uint64).max
+    return keys
+
+
+def column_summary(values, keys):
+    """
+    Résumé d'une partition d'un agrégat pour la suppression des colonnes redondantes.
+
+    Paramètres
+    --------
+        values (ndarray) :
+            les valeurs de l'agrégat (lignes triées par clé) en float64
+        keys (ndarray) :
+            la clé de chaque ligne (SK_ID_CURR, SK_ID_BUREAU ou SK_ID_PREV)
+
+    Retour
+    --------
+        first : matrice (colonnes x colonnes) de la première clé où deux colonnes diffèrent (NO_DIFFERENCE sinon)
+        sign : matrice du sens de la comparaison à cette clé (-1, 0 ou 1)
+        has_nan : présence de NaN dans chaque colonne
+    """
+    n_rows, n_columns = values.shape
+    first = np.full((n_columns, n_columns), NO_DIFFERENCE, dtype=np.int64)
+    sign = np.zeros((n_columns, n_columns), dtype=np.int8)
+    has_nan = np.isnan(values).any(axis=0)
+    if n_rows == 0 or n_columns < 2:
+        return first, sign, has_nan
+
+    # Tri lexicographique des colonnes (la première ligne est la clé de tri principale)
+    sortable = _sortable(values)
+    order = np.lexsort(sortable[::-1])
+    ordered = sortable[:, order]
+
+    # Première ligne de différence entre colonnes voisines dans l'ordre trié ; pour deux colonnes quelconques,
+    # c'est le minimum sur les voisines qui les séparent
+    differ = ordered[:, 1:] != ordered[:, :-1]
+    first_row = np.where(differ.any(axis=0), differ.argmax(axis=0), n_rows)
+    keys = np.asarray(keys, dtype=np.int64)
+    for i in range(n_columns - 1):
+        rows = np.minimum.accumulate(first_row[i:])
+        found = rows < n_rows
+        a, b = order[i], order[i + 1:]
+        first[a, b] = first[b, a] = np.where(found, keys[np.minimum(rows, n_rows - 1)], NO_DIFFERENCE)
+        sign[a, b] = np.where(found, -1, 0)
+        sign[b, a] = -sign[a, b]
+    return first, sign, has_nan
+
+
+def merge_summaries(summary, other):
+    """Résumé de deux partitions disjointes."""
+    first, sign, has_nan = summary
+    other_first, other_sign, other_has_nan = other
+    return (np.minimum(first, other_first), np.where(first <= other_first, sign, other_sign), has_nan | other_has_nan)
+
+
+def unique_columns_from_summary(summary):
+    """Positions des colonnes gardées par np.unique(agg, axis=1), dans le même ordre, à partir du résumé de toute la table."""
+    first, sign, has_nan = summary
+    # Tri stable, comme le tri fusion utilisé par np.unique avec return_index
+    order = sorted(range(len(has_nan)), key=cmp_to_key(lambda a, b: int(sign[a, b])))
+    positions = order[:1]
+    for previous, column in zip(order, order[1:]):
+        if first[previous, column] == NO_DIFFERENCE and not has_nan[column]:
+            continue
+        positions.append(column)
+    return np.array(positions, dtype=np.int64)
+
+
+######################################################################################################################
+# Lecture par morceaux et partitions sur disque
+######################################################################################################################
+
+def _global_dtype(kinds):
+    """Type d'une colonne sur tout le fichier, à partir des types lus dans chaque morceau (comme read_csv en entier)."""
+    if 'O' in kinds or ('b' in kinds and kinds != {'b'}):
+        return 'object'
+    if kinds == {'b'}:
+        return 'bool'
+    return 'float64' if 'f' in kinds else 'int64'
+
+
+def scan_table(path, chunksize, collect_ids=False):
+    """
+    Premier passage sur un CSV : type de chaque colonne sur tout le fichier, catégories des colonnes de texte
+    et premières valeurs distinctes (règle [1, 0] de convert_types).
+    """
+    kinds, categories, first_values, ids = {}, {}, {}, []
+    for chunk in pd.read_csv(path, chunksize=chunksize):
+        for c in chunk:
+            kinds.setdefault(c, set()).add(chunk[c].dtype.kind)
+            if chunk[c].dtype == object:
+                categories.setdefault(c, set()).update(chunk[c].dropna().unique())
+            elif len(first_values.get(c, [])) < 3:
+                values = np.concatenate([first_values.get(c, []), chunk[c].unique().astype(np.float64)])
+                first_values[c] = list(pd.unique(values)[:3])
+        if collect_ids:
+            ids.append(chunk['SK_ID_CURR'].to_numpy())
+
+    info = {'columns': list(kinds), 'dtypes': {c: _global_dtype(kind) for c, kind in kinds.items()},
+            'categories': {c: sorted(values) for c, values in categories.items()},
+            'first_values': {c: [float(v) for v in values] for c, values in first_values.items()}}
+    if collect_ids:
+        info['ids'] = np.concatenate(ids) if ids else np.array([], dtype=np.int64)
+    return info
+
+
+def column_types(info, converted):
+    """
+    Conversions appliquées à chaque morceau, décidées sur la table entière : celles de convert_types pour les
+    tables converties ; les colonnes de texte deviennent des catégories (toutes celles du fichier), ce qui donne
+    les mêmes indicatrices que get_dummies sur la table entière.
+    """
+    types = {}
+    for c in info['columns']:
+        dtype = info['dtypes'][c]
+        if converted and 'SK_ID' in c:
+            types[c] = 'id'
+        elif dtype == 'object':
+            types[c] = info['categories'].get(c, [])
+        elif not converted:
+            continue
+        elif info['first_values'].get(c) == [1, 0]:
+            types[c] = 'bool'
+        elif dtype == 'float64':
+            types[c] = 'float32'
+        elif dtype == 'int64':
+            types[c] = 'int32'
+    return types
+
+
+def apply_types(df, types):
+    for c, kind in types.items():
+        if kind == 'id':
+            df[c] = df[c].fillna(0).astype(np.int32)
+        elif isinstance(kind, list):
+            df[c] = df[c].astype(pd.CategoricalDtype(kind))
+        else:
+            df[c] = df[c].astype(kind)
+    return df
+
+
+def _partition_dir(spill_dir, name):
+    return os.path.join(spill_dir, 'tables', name)
+
+
+def spill_table(path, name, spill_dir, boundaries, dtypes, types, chunksize, loan_owners=None):
+    """
+    Lit un CSV par morceaux et écrit chaque morceau, réparti par partition de SK_ID_CURR, sur disque.
+    Pour bureau_balance, le client de chaque ligne est retrouvé par SK_ID_BUREAU (loan_owners, trié) ; les lignes
+    dont le prêt est absent de bureau vont dans une partition supplémentaire (utile seulement au dédoublonnage).
+    Renvoie, pour bureau, les couples (SK_ID_BUREAU, SK_ID_CURR) triés.
+    """
+    directory = _partition_dir(spill_dir, name)
+    os.makedirs(directory, exist_ok=True)
+    owners = []
+    for i, chunk in enumerate(pd.read_csv(path, dtype=dtypes, chunksize=chunksize)):
+        chunk = apply_types(chunk, types)
+        if i == 0:
+            # Table vide avec les bons types, pour les partitions sans aucune ligne
+            chunk.iloc[:0].to_pickle(os.path.join(directory, 'empty.pkl'))
+        if loan_owners is None:
+            parts = np.searchsorted(boundaries, chunk['SK_ID_CURR'].to_numpy(), side='right')
+        else:
+            loans, clients = loan_owners
+            loan_ids = chunk['SK_ID_BUREAU'].to_numpy()
+            positions = np.minimum(np.searchsorted(loans, loan_ids), max(len(loans) - 1, 0))
+            known = (loans[positions] == loan_ids) if len(loans) else np.zeros(len(chunk), dtype=bool)
+            parts = np.where(known, np.searchsorted(boundaries, clients[positions], side='right'), len(boundaries) + 1)
+        for p in np.unique(parts):
+            chunk[parts == p].to_pickle(os.path.join(directory, f'{p:04d}_{i:06d}.pkl'))
+        if name == 'bureau':
+            owners.append(chunk[['SK_ID_BUREAU', 'SK_ID_CURR']].to_numpy())
+
+    if name == 'bureau':
+        owners = np.concatenate(owners) if owners else np.empty((0, 2), dtype=np.int64)
+        owners = owners[np.argsort(owners[:, 0], kind='stable')]
+        return owners[:, 0], owners[:, 1]
+    return None
+
+
+def read_partition(spill_dir, name, p):
+    """Lignes d'une table dans la partition p, dans l'ordre du fichier."""
+    directory = _partition_dir(spill_dir, name)
+    files = sorted(glob.glob(os.path.join(directory, f'{p:04d}_*.pkl')))
+    if not files:
+        return pd.read_pickle(os.path.join(directory, 'empty.pkl'))
+    return pd.concat([pd.read_pickle(file) for file in files]) if len(files) > 1 else pd.read_pickle(files[0])
+
+
+def _block_path(spill_dir, block, p):
+    return os.path.join(spill_dir, 'blocks', block, f'{p:04d}.pkl')
+
+
+def _block_keys(agg):
+    return agg.index.to_numpy() if agg.index.name is not None else agg.iloc[:, 0].to_numpy()
+
+
+def _save_block(spill_dir, block, p, agg, main_ids):
+    """Écrit l'agrégat d'une partition et renvoie de quoi décider globalement des colonnes gardées et de leurs types."""
+    path = _block_path(spill_dir, block, p)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    agg.to_pickle(path)
+    keys = _block_keys(agg)
+    return {'columns': list(agg.columns), 'rows': len(agg), 'dtypes': [str(dtype) for dtype in agg.dtypes],
+            'summary': column_summary(agg.to_numpy(dtype=np.float64, na_value=np.nan), keys),
+            # Clients de la table principale sans ligne dans l'agrégat (la fusion y mettra des NaN)
+            'missing': {main: bool((~np.isin(ids, keys)).any()) for main, ids in main_ids.items()}}
+
+
+def _main_ids(spill_dir, mains, p):
+    return {main: read_partition(spill_dir, main, p)['SK_ID_CURR'].to_numpy() for main in mains}
+
+
+def _table_task(spill_dir, name, p, mains):
+    """Agrégats de premier niveau d'une table sur une partition."""
+    df = read_partition(spill_dir, name, p)
+    main_ids = _main_ids(spill_dir, mains, p) if name != 'bureau_balance' else {}
+    return name, p, {block: _save_block(spill_dir, block, p, agg, main_ids) for block, agg in table_blocks(name, df).items()}
+
+
+def _select(agg, positions):
+    return agg if positions is None else agg.iloc[:, positions]
+
+
+def _client_task(spill_dir, p, plan, mains):
+    """Agrégats par client des tables à deux niveaux sur une partition."""
+    tables = {name: read_partition(spill_dir, name, p) for name in ('bureau',) + LOAN_TABLES}
+    blocks = {block: _select(pd.read_pickle(_block_path(spill_dir, block, p)), plan[block]['positions'])
+              for block in loan_blocks() if block in plan}
+    main_ids = _main_ids(spill_dir, mains, p)
+    return p, {block: _save_block(spill_dir, block, p, agg, main_ids) for block, agg in client_blocks(tables, blocks).items()}
+
+
+def _assemble_task(spill_dir, main, p, plan):
+    """Table principale d'une partition avec les ratios et tous les agrégats, écrite en CSV (sans en-tête)."""
+    df = add_ratio_features(read_partition(spill_dir, main, p))
+    rows = df.index.to_numpy()
+    dtypes = list(df.dtypes)
+    for block in CLIENT_BLOCKS:
+        agg = _select(pd.read_pickle(_block_path(spill_dir, block, p)), plan[block]['positions'])
+        df = merge_with_main(df, agg)
+        # Types de la table entière : un entier devient flottant si un client de la table principale n'a pas de ligne
+        for column, dtype in zip(plan[block]['names'], plan[block]['dtypes']):
+            if column != 'SK_ID_CURR':
+                dtypes.append(np.float64 if plan[block]['missing'][main] and np.dtype(dtype).kind in 'iu' else np.dtype(dtype))
+    df = df.astype(dict(zip(df.columns, dtypes)))
+
+    path = os.path.join(spill_dir, 'output', main, f'{p:04d}')
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    df.to_csv(f'{path}.csv', header=False, index=False)
+    np.save(f'{path}.npy', rows)
+    return df.iloc[:0].to_csv(index=False)
+
+
+def _combine(plan, block, info):
+    """Ajoute le résultat d'une partition au plan d'un agrégat."""
+    entry = plan.setdefault(block, {'columns': info['columns'], 'summary': None, 'dtypes': [], 'empty_dtypes': info['dtypes'],
+                                    'missing': {}})
+    entry['summary'] = info['summary'] if entry['summary'] is None else merge_summaries(entry['summary'], info['summary'])
+    if info['rows']:
+        entry['dtypes'].append(info['dtypes'])
+    for main, missing in info['missing'].items():
+        entry['missing'][main] = entry['missing'].get(main, False) or missing
+
+
+def _finalize(entry):
+    """Colonnes gardées (dans l'ordre de np.unique) et types de l'agrégat sur la table entière."""
+    summary = entry.pop('summary')
+    partition_dtypes = entry.pop('dtypes') or [entry['empty_dtypes']]
+    entry.pop('empty_dtypes')
+    if entry['columns'][1:] == ['count'] and len(entry['columns']) == 2:
+        positions = np.arange(2)
+    else:
+        positions = unique_columns_from_summary(summary)
+    dtypes = [str(np.result_type(*column)) for column in zip(*partition_dtypes)]
+    entry['positions'] = [int(i) for i in positions]
+    entry['names'] = [entry['columns'][i] for i in positions]
+    entry['dtypes'] = [dtypes[i] for i in positions]
+    return entry
+
+
+def _merge_outputs(spill_dir, main, n_partitions, header, output_path):
+    """Réunit les partitions dans l'ordre des lignes de la table principale."""
+    directory = os.path.join(spill_dir, 'output', main)
+    with contextlib.ExitStack() as stack, open(output_path, 'w', newline='') as output:
+        output.write(header)
+        streams = []
+        for p in range(n_partitions):
+            rows = np.load(os.path.join(directory, f'{p:04d}.npy'))
+            lines = stack.enter_context(open(os.path.join(directory, f'{p:04d}.csv'), newline=''))
+            streams.append(zip(rows.tolist(), lines))
+        for _, line in heapq.merge(*streams):
+            output.write(line)
+
+
+def build_features(data_dir='.', output_dir=None, mains=('train', 'test'), n_partitions=16, workers=None,
+                   chunksize=200_000, tmp_dir=None):
+    """
+    Calcule les features du notebook sans charger les tables enfants en entier.
+
+    Paramètres
+    --------
+        data_dir (str) :
+            le dossier des CSV d'entrée (MAIN_FILES et TABLE_FILES)
+        output_dir (str) :
+            le dossier des CSV produits (OUTPUT_FILES) et de feature_plan.json (data_dir par défaut)
+        mains (tuple) :
+            les tables principales à traiter ('train', 'test')
+        n_partitions (int) :
+            le nombre de partitions de SK_ID_CURR (plus il est grand, plus la mémoire d'une tâche est petite)
+        workers (int) :
+            le nombre de processus (nombre de cœurs par défaut)
+        chunksize (int) :
+            le nombre de lignes lues à la fois dans chaque CSV
+        tmp_dir (str) :
+            le dossier des fichiers intermédiaires (dossier temporaire du système par défaut)
+
+    Retour
+    --------
+        le plan des agrégats : pour chacun, les colonnes calculées, les positions et noms des colonnes gardées
+        et leurs types ; il est aussi écrit dans feature_plan.json
+    """
+    output_dir = output_dir or data_dir
+    spill_dir = tempfile.mkdtemp(prefix='feature_engineering_', dir=tmp_dir)
+    main_paths = {main: os.path.join(data_dir, MAIN_FILES[main]) for main in mains}
+    table_paths = {name: os.path.join(data_dir, file) for name, file in TABLE_FILES.items()}
+    try:
+        with ProcessPoolExecutor(workers) as pool:
+            # 1. Types de chaque colonne sur les fichiers entiers
+            scans = {name: pool.submit(scan_table, path, chunksize, name in main_paths)
+                     for name, path in {**main_paths, **table_paths}.items()}
+            infos = {name: future.result() for name, future in scans.items()}
+
+            # Partitions de tailles comparables : quantiles des SK_ID_CURR des tables principales
+            ids = np.sort(np.concatenate([infos[main].pop('ids') for main in mains]))
+            boundaries = np.unique(ids[(np.arange(1, n_partitions) * len(ids)) // n_partitions]) if len(ids) else np.array([])
+            n_partitions = len(boundaries) + 1
+            types = {name: column_types(infos[name], name in CONVERTED_TABLES) for name in table_paths}
+
+            # 2. Répartition des lignes sur disque (bureau_balance après bureau, qui donne le client de chaque prêt)
+            def spill(name, path, loan_owners=None):
+                return pool.submit(spill_table, path, name, spill_dir, boundaries, infos[name]['dtypes'],
+                                   types.get(name, {}), chunksize, loan_owners)
+            spills = {name: spill(name, path) for name, path in {**main_paths, **table_paths}.items() if name != 'bureau_balance'}
+            spills['bureau_balance'] = spill('bureau_balance', table_paths['bureau_balance'], spills['bureau'].result())
+            for future in spills.values():
+                future.result()
+
+            # 3. Agrégats de premier niveau, partition par partition
+            plan = {}
+            tasks = [pool.submit(_table_task, spill_dir, name, p, mains) for name in table_paths for p in range(n_partitions)]
+            tasks.append(pool.submit(_table_task, spill_dir, 'bureau_balance', n_partitions, mains))
+            for future in as_completed(tasks):
+                _, _, blocks = future.result()
+                for block, info in blocks.items():
+                    _combine(plan, block, info)
+            for block in plan:
+                _finalize(plan[block])
+
+            # 4. Agrégats par client des tables à deux niveaux
+            tasks = [pool.submit(_client_task, spill_dir, p, plan, mains) for p in range(n_partitions)]
+            second_level = {}
+            for future in as_completed(tasks):
+                _, blocks = future.result()
+                for block, info in blocks.items():
+                    _combine(second_level, block, info)
+            for block in second_level:
+                plan[block] = _finalize(second_level[block])
+
+            # 5. Tables principales complètes, partition par partition, puis réunies dans l'ordre d'origine
+            os.makedirs(output_dir, exist_ok=True)
+            for main in mains:
+                tasks = [pool.submit(_assemble_task, spill_dir, main, p, plan) for p in range(n_partitions)]
+                headers = [future.result() for future in tasks]
+                _merge_outputs(spill_dir, main, n_partitions, headers[0], os.path.join(output_dir, OUTPUT_FILES[main]))
+    finally:
+        shutil.rmtree(spill_dir, ignore_errors=True)
+
+    plan = {'tables': {name: {'dtypes': infos[name]['dtypes'], 'types': types.get(name, {})} for name in infos},
+            'blocks': plan}
+    with open(os.path.join(output_dir, PLAN_FILE), 'w') as f:
+        json.dump(plan, f, indent=1)
+    return plan
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Feature engineering du notebook 01 par morceaux et partitions de SK_ID_CURR.")
+    parser.add_argument('--data-dir', default='.', help="dossier des CSV d'entrée")
+    parser.add_argument('--output-dir', help="dossier des CSV produits (par défaut : --data-dir)")
+    parser.add_argument('--mains', nargs='+', default=['train', 'test'], choices=sorted(MAIN_FILES), help="tables principales à traiter")
+    parser.add_argument('--partitions', type=int, default=16, help="nombre de partitions de SK_ID_CURR")
+    parser.add_argument('--workers', type=int, help="nombre de processus (par défaut : nombre de cœurs)")
+    parser.add_argument('--chunksize', type=int, default=200_000, help="nombre de lignes lues à la fois")
+    parser.add_argument('--tmp-dir', help="dossier des fichiers intermédiaires")
+    args = parser.parse_args()
+
+    plan = build_features(args.data_dir, args.output_dir, tuple(args.mains), args.partitions, args.workers,
+                          args.chunksize, args.tmp_dir)
+    for main in args.mains:
+        print(f"{OUTPUT_FILES[main]} écrit ({sum(len(plan['blocks'][block]['names']) for block in CLIENT_BLOCKS)} colonnes d'agrégats)")
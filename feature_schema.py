@@ -0,0 +1,192 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Contrat des features attendues par le modèle, généré à partir du pipeline entraîné.
+# Le schéma donne, dans l'ordre des colonnes du modèle, le nom de chaque feature, son type et, pour les
+# features catégorielles, les catégories autorisées : c'est le contrat vérifié par unit_testing.py
+# (test_variable_names / test_variable_formats). Il permet de valider une requête avant le scoring,
+# avec des erreurs qui désignent précisément la ligne et la colonne fautives, et de décoder des lignes
+# envoyées sous forme de tableaux directement dans une matrice NumPy préallouée.
+#
+# Sans jeu de référence, le schéma ne connaît que le Booster : toutes les features sont en float64 et leurs noms
+# d'origine sont perdus (LightGBM remplace les espaces par des '_'). Le registre (model_registry.py) et l'API
+# construisent donc le schéma à partir du jeu de référence et l'enregistrent avec l'empreinte du pipeline.
+#
+# Génération du fichier de schéma (les types sont relevés sur un jeu de référence s'il est fourni) :
+#     python feature_schema.py --data reconstituted_test_sampled.csv --output feature_schema.json
+
+import argparse
+import json
+import joblib
+import numpy as np
+import pandas as pd
+from result_cache import file_fingerprint
+
+# Nombre maximal d'erreurs renvoyées pour une requête (les suivantes ne sont pas détaillées)
+MAX_ERRORS = 20
+
+
+class SchemaError(ValueError):
+    """Requête non conforme au schéma ; errors est une liste {loc, msg, type} au format des erreurs FastAPI."""
+
+    def __init__(self, errors):
+        self.errors = errors
+        super().__init__('; '.join(error['msg'] for error in errors))
+
+
+def build_schema(pipeline, reference=None):
+    """
+    Construit le schéma des features à partir du pipeline entraîné.
+
+    Paramètres
+    --------
+        pipeline (Pipeline) :
+            le pipeline entraîné (dernière étape : LGBMClassifier)
+        reference (DataFrame) :
+            un jeu de features facultatif (sans SK_ID_CURR), dont on relève les noms d'origine et les types
+
+    Retour
+    --------
+        un dictionnaire {"n_features": ..., "features": [{"name", "source_name", "dtype", "categories"}, ...]}
+    """
+    estimator = pipeline.steps[-1][1]
+    return booster_schema(estimator.booster_, estimator.feature_name_, reference)
+
+
+def booster_schema(booster, feature_names, reference=None):
+    """Même schéma que build_schema, à partir du Booster LightGBM seul (ex. modèle allégé de fast_scorer.py)."""
+    names = list(feature_names)
+
+    # LightGBM garde les catégories des colonnes pandas catégorielles, dans l'ordre de ces colonnes ;
+    # les colonnes concernées sont celles dont les informations de découpage sont des listes de valeurs
+    categorical = {}
+    pandas_categorical = booster.pandas_categorical or []
+    if pandas_categorical:
+        infos = booster.dump_model(num_iteration=1)['feature_infos']
+        positions = [i for i, name in enumerate(names) if infos.get(name, {}).get('values')]
+        categorical = {position: list(categories) for position, categories in zip(positions, pandas_categorical)}
+
+    if reference is not None and [str(column).replace(' ', '_') for column in reference.columns] != names:
+        raise ValueError("Les colonnes du jeu de référence ne sont pas celles du modèle (ou pas dans le même ordre)")
+
+    features = []
+    for i, name in enumerate(names):
+        feature = {"name": name, "source_name": name, "dtype": "float64", "categories": categorical.get(i)}
+        if reference is not None:
+            feature["source_name"] = reference.columns[i]
+            feature["dtype"] = "category" if i in categorical else str(reference.iloc[:, i].dtype)
+        features.append(feature)
+    return {"n_features": len(features), "features": features}
+
+
+def read_reference(path, nrows=1000):
+    """Premières lignes d'un CSV de features (sans SK_ID_CURR), pour relever noms d'origine et types."""
+    return pd.read_csv(path, nrows=nrows).drop(columns=['SK_ID_CURR'], errors='ignore')
+
+
+def save_schema(schema, path):
+    with open(path, 'w') as f:
+        json.dump(schema, f, indent=1)
+
+
+def load_schema(path):
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def check_columns(schema, columns):
+    """Vérifie que les colonnes reçues sont exactement celles du modèle, dans le même ordre."""
+    expected = [feature['name'] for feature in schema['features']]
+    received = [str(column).replace(' ', '_') for column in columns]
+    if received == expected:
+        return
+
+    errors = []
+    expected_set, received_set = set(expected), set(received)
+    missing = [name for name in expected if name not in received_set]
+    unexpected = [name for name in received if name not in expected_set]
+    if missing:
+        errors.append({"loc": ["body", "columns"], "type": "missing",
+                       "msg": f"{len(missing)} colonne(s) manquante(s) : {missing[:MAX_ERRORS]}"})
+    if unexpected:
+        errors.append({"loc": ["body", "columns"], "type": "extra_forbidden",
+                       "msg": f"{len(unexpected)} colonne(s) inattendue(s) : {unexpected[:MAX_ERRORS]}"})
+    if not errors:
+        position = next(i for i, (a, b) in enumerate(zip(received, expected)) if a != b)
+        errors.append({"loc": ["body", "columns", position], "type": "column_order",
+                       "msg": f"Colonne {position} : '{received[position]}' reçue, '{expected[position]}' attendue "
+                              f"(les colonnes doivent suivre l'ordre du modèle)"})
+    raise SchemaError(errors)
+
+
+def _row_errors(schema, i, row):
+    """Localise précisément les valeurs invalides d'une ligne qui n'a pas pu être décodée."""
+    features = schema['features']
+    if not isinstance(row, list):
+        return [{"loc": ["body", "rows", i], "type": "list_type",
+                 "msg": f"Ligne {i} : un tableau de {len(features)} valeurs est attendu"}]
+    if len(row) != len(features):
+        return [{"loc": ["body", "rows", i], "type": "row_length",
+                 "msg": f"Ligne {i} : {len(row)} valeurs reçues, {len(features)} attendues"}]
+    errors = []
+    for j, value in enumerate(row):
+        if value is not None and (isinstance(value, bool) or not isinstance(value, (int, float))):
+            errors.append({"loc": ["body", "rows", i, features[j]['name']], "type": "float_type",
+                           "msg": f"Ligne {i}, colonne '{features[j]['name']}' : {value!r} n'est pas un nombre"})
+    return errors
+
+
+def decode_rows(schema, rows, dtype=np.float64):
+    """
+    Décode des lignes (listes de valeurs dans l'ordre du modèle, null = valeur manquante) dans une matrice
+    préallouée, sans dictionnaire ni DataFrame intermédiaire. Lève SchemaError avec la position des erreurs.
+    """
+    features = schema['features']
+    if not isinstance(rows, list) or not rows:
+        raise SchemaError([{"loc": ["body", "rows"], "type": "list_type", "msg": "'rows' doit être une liste non vide de lignes"}])
+
+    X = np.empty((len(rows), len(features)), dtype=dtype)
+    errors = []
+    for i, row in enumerate(rows):
+        # La forme est vérifiée avant l'affectation : NumPy diffuserait sinon une valeur seule sur toute la ligne
+        if not isinstance(row, list) or len(row) != len(features):
+            errors.extend(_row_errors(schema, i, row))
+        else:
+            try:
+                X[i] = row
+            except (TypeError, ValueError):
+                errors.extend(_row_errors(schema, i, row))
+        if len(errors) >= MAX_ERRORS:
+            break
+    if errors:
+        raise SchemaError(errors[:MAX_ERRORS])
+
+    # Catégories : les valeurs sont les codes (0, 1, ...) des catégories connues du modèle
+    for j, feature in enumerate(features):
+        categories = feature.get('categories')
+        if categories:
+            column = X[:, j]
+            invalid = ~np.isnan(column) & ~np.isin(column, np.arange(len(categories)))
+            for i in np.flatnonzero(invalid)[:MAX_ERRORS]:
+                errors.append({"loc": ["body", "rows", int(i), feature['name']], "type": "enum",
+                               "msg": f"Ligne {i}, colonne '{feature['name']}' : code de catégorie {float(column[i])} inconnu "
+                                      f"({len(categories)} catégories)"})
+    if errors:
+        raise SchemaError(errors[:MAX_ERRORS])
+    return X
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Génère le schéma des features attendues par le modèle.")
+    parser.add_argument('--model', default='credit_scoring_new.joblib', help="pipeline sérialisé")
+    parser.add_argument('--data', help="CSV de features de référence (avec SK_ID_CURR) pour relever les types")
+    parser.add_argument('--output', default='feature_schema.json', help="fichier JSON du schéma")
+    args = parser.parse_args()
+
+    reference = read_reference(args.data) if args.data else None
+    schema = build_schema(joblib.load(args.model), reference)
+    # Empreinte du pipeline : l'API relit ce fichier (FEATURE_SCHEMA_PATH) pour ce modèle seulement
+    if reference is not None:
+        schema['pipeline_fingerprint'] = file_fingerprint(args.model)
+    save_schema(schema, args.output)
+    print(f"Schéma de {schema['n_features']} features écrit dans {args.output}")
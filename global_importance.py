@@ -0,0 +1,196 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Importance globale des features (moyenne des |SHAP|), qui remplace le fichier figé global_feature_importance.csv.
+# L'importance est calculée au fil des lots de clients expliqués : on ne garde que la somme des |SHAP| par feature
+# et le nombre de clients, pour l'ensemble de la population et pour chaque segment (type de contrat, tranche de
+# revenu). Ces sommes s'additionnent : deux calculs faits séparément (par morceaux, par processus, sur deux
+# parties du jeu) se fusionnent exactement, sans revoir les clients.
+#
+# Le résultat est écrit dans global_importance/<empreinte du modèle>.npz : un nouveau modèle a ses propres
+# importances, et l'API sert celles du modèle qu'elle a chargé (route /importance/global).
+#
+# Utilisation :
+#     python global_importance.py reconstituted_test_sampled.csv --segments application_test_sampled.csv
+#     python global_importance.py --store client_store --segments application_test_sampled.csv
+#     python global_importance.py --merge partie_1.npz partie_2.npz --output global_importance/<empreinte>.npz
+
+import argparse
+import os
+import joblib
+import numpy as np
+import pandas as pd
+import client_store
+import parallel_shap
+from result_cache import file_fingerprint
+
+IMPORTANCE_DIR = 'global_importance'
+
+# Segment de toute la population
+ALL = 'all'
+
+# Tranches de revenu (AMT_INCOME_TOTAL) des segments
+INCOME_BANDS = [0, 100000, 150000, 200000, 300000, np.inf]
+INCOME_BAND_LABELS = ['<100k', '100k-150k', '150k-200k', '200k-300k', '>=300k']
+
+
+def segment_labels(raw):
+    """Segments de chaque client (une colonne par découpage) à partir de ses données brutes (format application_test.csv)."""
+    income_band = pd.cut(raw['AMT_INCOME_TOTAL'], INCOME_BANDS, right=False, labels=INCOME_BAND_LABELS)
+    return pd.DataFrame({'NAME_CONTRACT_TYPE': raw['NAME_CONTRACT_TYPE'].astype(object),
+                         'income_band': income_band.astype(object)}, index=raw.index)
+
+
+class ImportanceAccumulator:
+    """Sommes des |SHAP| par feature et nombres de clients, pour toute la population et par segment ('découpage=valeur')."""
+
+    def __init__(self, feature_names):
+        self.feature_names = list(feature_names)
+        self.sums = {}
+        self.counts = {}
+
+    def _add(self, segment, sums, count):
+        if segment in self.sums:
+            self.sums[segment] += sums
+            self.counts[segment] += int(count)
+        else:
+            self.sums[segment] = np.array(sums, dtype=np.float64)
+            self.counts[segment] = int(count)
+
+    def update(self, shap_matrix, segments=None):
+        """
+        Ajoute un lot de clients expliqués.
+
+        shap_matrix : matrice SHAP (clients x features) de la classe positive
+        segments : DataFrame facultatif, une ligne par client et une colonne par découpage (valeur manquante = hors segment)
+        """
+        abs_shap = np.abs(np.asarray(shap_matrix, dtype=np.float64))
+        self._add(ALL, abs_shap.sum(axis=0), len(abs_shap))
+        if segments is not None:
+            for name, labels in segments.items():
+                codes, values = pd.factorize(np.asarray(labels, dtype=object))
+                # Sommes de tous les segments en un seul produit matriciel (indicatrices segments x clients)
+                indicators = (codes == np.arange(len(values))[:, None]).astype(np.float64)
+                for value, sums, count in zip(values, indicators @ abs_shap, indicators.sum(axis=1)):
+                    self._add(f'{name}={value}', sums, count)
+        return self
+
+    def merge(self, other):
+        """Ajoute les sommes d'un autre accumulateur (mêmes features)."""
+        if other.feature_names != self.feature_names:
+            raise ValueError("Les deux accumulateurs n'ont pas les mêmes features")
+        for segment in other.sums:
+            self._add(segment, other.sums[segment], other.counts[segment])
+        return self
+
+    def segments(self):
+        """Nombre de clients de chaque segment."""
+        return dict(self.counts)
+
+    def mean(self, segment=ALL):
+        """Moyenne des |SHAP| de chaque feature sur un segment (Series indexée par les features)."""
+        if segment not in self.sums:
+            raise KeyError(segment)
+        return pd.Series(self.sums[segment] / self.counts[segment], index=self.feature_names, name='MeanAbsSHAP')
+
+    def to_frame(self, segment=ALL):
+        """Même format que global_feature_importance.csv (Feature, MeanAbsSHAP), par importance décroissante."""
+        return self.mean(segment).sort_values(ascending=False).rename_axis('Feature').reset_index()
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        segments = list(self.sums)
+        # Écriture dans un fichier temporaire puis renommage : l'API ne lit jamais un fichier à moitié écrit
+        tmp_path = f'{path}.tmp.npz'
+        np.savez(tmp_path, feature_names=np.array(self.feature_names), segments=np.array(segments, dtype=str),
+                 sums=np.array([self.sums[segment] for segment in segments]),
+                 counts=np.array([self.counts[segment] for segment in segments], dtype=np.int64))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            accumulator = cls(data['feature_names'].tolist())
+            for segment, sums, count in zip(data['segments'].tolist(), data['sums'], data['counts']):
+                accumulator._add(segment, sums, count)
+        return accumulator
+
+
+def importance_path(fingerprint, directory=IMPORTANCE_DIR):
+    return os.path.join(directory, f'{fingerprint}.npz')
+
+
+def accumulate(batches, feature_names, segments=None):
+    """
+    Importance globale d'un flux de lots (ids, matrice SHAP) ; segments est un DataFrame de segment_labels
+    indexé par SK_ID_CURR (les clients absents ne comptent que dans le segment 'all').
+    """
+    accumulator = ImportanceAccumulator(feature_names)
+    for ids, shap_matrix in batches:
+        accumulator.update(shap_matrix, None if segments is None else segments.reindex(ids))
+    return accumulator
+
+
+def explained_batches(data_path, model, chunksize=5000, n_workers=None):
+    """Lots (ids, SHAP) d'un CSV de features, expliqués morceau par morceau (cf. parallel_shap)."""
+    import shap
+    explainer = shap.Explainer(model.named_steps['model'])
+    try:
+        for chunk in pd.read_csv(data_path, chunksize=chunksize):
+            features = chunk.drop(columns=['SK_ID_CURR'])
+            yield chunk['SK_ID_CURR'].to_numpy(), parallel_shap.explain_batch(features, explainer, n_workers=n_workers)
+    finally:
+        parallel_shap.shutdown_pool()
+
+
+def stored_batches(store, chunksize=5000):
+    """Lots (ids, SHAP) relus dans le stock précalculé (client_store.ClientStore), sans recalculer SHAP."""
+    ids = np.fromiter(store.index, dtype=np.int64, count=len(store))
+    for start in range(0, len(ids), chunksize):
+        yield ids[start:start + chunksize], store.shap_values[start:start + chunksize]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Calcule l'importance globale (moyenne des |SHAP|) des features, par segment.")
+    parser.add_argument('input', nargs='?', help="CSV de features (avec SK_ID_CURR) à expliquer")
+    parser.add_argument('--store', help="stock précalculé de client_store.py à relire au lieu d'expliquer un CSV")
+    parser.add_argument('--merge', nargs='+', help="fichiers d'importance à fusionner")
+    parser.add_argument('--segments', help="données brutes des clients (NAME_CONTRACT_TYPE, AMT_INCOME_TOTAL) pour les segments")
+    parser.add_argument('--model', default='credit_scoring_new.joblib', help="pipeline sérialisé")
+    parser.add_argument('--output', help=f"fichier de sortie (par défaut {IMPORTANCE_DIR}/<empreinte du modèle>.npz)")
+    parser.add_argument('--append', action='store_true', help="ajoute les nouveaux lots au fichier de sortie existant")
+    parser.add_argument('--export-csv', help="écrit aussi l'importance globale au format global_feature_importance.csv")
+    parser.add_argument('--chunksize', type=int, default=5000, help="nombre de clients traités à la fois")
+    parser.add_argument('--workers', type=int, default=None, help="taille du pool de processus pour SHAP")
+    args = parser.parse_args()
+
+    # Le stock précalculé porte l'empreinte du pipeline qui l'a produit : ses SHAP sont rangés sous ce modèle-là
+    store = client_store.ClientStore(args.store) if args.store and not args.merge else None
+    if store is not None and store.pipeline_fingerprint is None:
+        parser.error(f"le stock {args.store} n'indique pas son modèle : il est à reconstruire avec client_store.py")
+    fingerprint = store.pipeline_fingerprint if store is not None else file_fingerprint(args.model)
+    output = args.output or importance_path(fingerprint)
+    if args.merge:
+        accumulator = ImportanceAccumulator.load(args.merge[0])
+        for path in args.merge[1:]:
+            accumulator.merge(ImportanceAccumulator.load(path))
+    else:
+        segments = None
+        if args.segments:
+            raw = pd.read_csv(args.segments, usecols=['SK_ID_CURR', 'NAME_CONTRACT_TYPE', 'AMT_INCOME_TOTAL'])
+            segments = segment_labels(raw.set_index('SK_ID_CURR'))
+        if store is not None:
+            accumulator = accumulate(stored_batches(store, args.chunksize), store.feature_names, segments)
+        elif args.input:
+            feature_names = pd.read_csv(args.input, nrows=0).columns.drop('SK_ID_CURR')
+            accumulator = accumulate(explained_batches(args.input, joblib.load(args.model), args.chunksize, args.workers),
+                                     feature_names, segments)
+        else:
+            parser.error("un CSV de features, --store ou --merge est nécessaire")
+        if args.append and os.path.exists(output):
+            accumulator = ImportanceAccumulator.load(output).merge(accumulator)
+
+    accumulator.save(output)
+    print(f"Importance globale écrite dans {output} : {accumulator.counts[ALL]} clients, {len(accumulator.sums) - 1} segments")
+    if args.export_csv:
+        accumulator.to_frame().to_csv(args.export_csv, index=False)
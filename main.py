@@ -1,64 +1,1153 @@
-from fastapi import FastAPI, HTTPException # pour créer l'API web et gérer les erreurs HTTP.
+import time
+IMPORT_START = time.perf_counter() # début du chronométrage du démarrage (cf. route /ready)
+from fastapi import FastAPI, HTTPException, Query, Body, Request # pour créer l'API web et gérer les erreurs HTTP.
+from fastapi.responses import StreamingResponse, PlainTextResponse, JSONResponse
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel # : pour valider les données d'entrée sous forme de modèles.
+from typing import Optional, Literal
+import os
+import json
+import tempfile
 import joblib # pour charger le modèle
 import pandas as pd
 import numpy as np
-import shap
 import lightgbm as lgb
+import threading # pour protéger les chargements partagés (modèles, stock, jeu de features)
+from collections import OrderedDict
+import bulk_scoring
+import parallel_shap
+import client_store
+import result_cache
+import metrics
+import micro_batcher
+import feature_schema
+import online_features
+import dtype_optimizer
+import global_importance
+import threshold_engine
+import drift_monitor
+import model_registry
+import what_if
+# shap n'est pas importé ici : il ne l'est qu'à la construction de l'explainer (premier appel à /explain)
 
-# Chargement du modèle sérialisé
-model = joblib.load('credit_scoring_new.joblib')
+# Durées du démarrage, renvoyées par /ready : imports, chargement du modèle, import de shap
+startup_timings = {"import_seconds": round(time.perf_counter() - IMPORT_START, 3)}
 
-# Chargement du seuil optimal
-with open('optimal_threshold.txt', 'r') as f:
-    optimal_threshold = float(f.read())
+MODEL_PATH = 'credit_scoring_new.joblib'
+THRESHOLD_PATH = 'optimal_threshold.txt'
+
+# Contrat des features (GET /schema, validation des requêtes) : relevé sur le jeu de features des clients (types et
+# noms d'origine) au premier chargement d'un modèle, puis enregistré avec l'empreinte du pipeline et relu tel quel
+FEATURE_SCHEMA_PATH = os.environ.get('FEATURE_SCHEMA_PATH', 'feature_schema.json')
+CLIENT_DATA_PATH = os.environ.get('CLIENT_DATA_PATH', 'reconstituted_test_sampled.csv')
+
+# Modèle allégé exporté par fast_scorer.py (Booster LightGBM natif + prétraitements en JSON). S'il a été exporté
+# depuis le credit_scoring_new.joblib courant, il est chargé à la place du pipeline, bien plus long à désérialiser
+# (toutes les routes de scoring l'utilisent ; le pipeline n'est chargé que sans modèle allégé à jour)
+SLIM_MODEL_DIR = os.environ.get('SLIM_MODEL_DIR', 'fast_model')
+
+# Démarrage rapide (FAST_STARTUP=1) : le serveur répond dès le lancement et le modèle est chargé en arrière-plan ;
+# /health indique que le processus tourne, /ready que le modèle est chargé (les autres routes répondent 503 d'ici là)
+FAST_STARTUP = os.environ.get('FAST_STARTUP', '0') == '1'
+model_ready = threading.Event()
+
+# Le scorer rapide (Booster LightGBM appelé directement, cf. fast_scorer.py) peut être désactivé avec USE_FAST_SCORER=0
+USE_FAST_SCORER = os.environ.get('USE_FAST_SCORER', '1') != '0'
+
+# Caches des résultats par ligne de /predict et /explain (taille et durée de vie réglables par variables d'environnement)
+CACHE_TTL_SECONDS = float(os.environ.get('CACHE_TTL_SECONDS', 3600))
+predict_cache = result_cache.ResultCache(int(os.environ.get('PREDICT_CACHE_SIZE', 10000)), CACHE_TTL_SECONDS)
+explain_cache = result_cache.ResultCache(int(os.environ.get('EXPLAIN_CACHE_SIZE', 2000)), CACHE_TTL_SECONDS)
+
+# Date de modification et taille des fichiers du modèle, pour détecter leur remplacement sans les relire
+# (None pour un fichier absent, ex. API qui ne sert que des versions du registre)
+def get_artifacts_signature():
+    return tuple((os.stat(path).st_mtime_ns, os.stat(path).st_size) if os.path.exists(path) else None
+                 for path in (MODEL_PATH, THRESHOLD_PATH))
+
+# Registre des modèles (cf. model_registry.py) : si MODEL_REGISTRY_DIR contient un pointeur 'active', l'API sert
+# cette version au lieu de credit_scoring_new.joblib. Une requête peut demander une autre version du registre
+# (?model_version=...) : les MODEL_VERSIONS_LOADED dernières versions demandées restent chargées.
+MODEL_REGISTRY_DIR = os.environ.get('MODEL_REGISTRY_DIR', model_registry.REGISTRY_DIR)
+MODEL_VERSIONS_LOADED = int(os.environ.get('MODEL_VERSIONS_LOADED', 3))
+
+# Modèle servi (model_registry.ModelVersion). Il n'est jamais modifié en place : un nouveau modèle ou un nouveau
+# seuil donne un nouvel objet, mis en place d'une seule affectation. Seuil, contrat des features, empreintes et
+# explainer SHAP sont des attributs de la version : chaque route la prend une fois au début de la requête, qui se
+# termine donc avec le modèle qu'elle a commencé à utiliser, sans jamais mélanger deux modèles.
+active_model = None
+
+# LightGBM remplace les espaces des noms de colonnes par des '_' (cf. test_variable_names)
+def model_column(name):
+    return name.replace(' ', '_')
+
+# Surveillance de la dérive (cf. drift_monitor.py) : les lignes reçues par les routes de scoring sont comptées
+# dans les classes des histogrammes de référence (DRIFT_REFERENCE_PATH, construit sur les features de la
+# population d'entraînement). Le comptage est différé dans un thread : le scoring ne fait que mettre la matrice
+# en file. Sans fichier de référence, ou s'il ne décrit pas les features du modèle, la surveillance est désactivée.
+DRIFT_REFERENCE_PATH = os.environ.get('DRIFT_REFERENCE_PATH', 'drift_reference.json')
+drift_reference = None
+drift_recorder = None
+drift_features = None
+
+def load_drift_monitor():
+    global drift_reference, drift_recorder, drift_features
+    feature_names = active_model.feature_names
+    # Même features qu'avant (nouveau seuil ou nouveau modèle) : les comptages en cours sont gardés
+    if drift_reference is not None and drift_features == feature_names:
+        return
+    drift_reference, drift_recorder, drift_features = None, None, None
+    if os.path.exists(DRIFT_REFERENCE_PATH):
+        reference = drift_monitor.DriftSketch.load(DRIFT_REFERENCE_PATH)
+        if [model_column(f) for f in reference.features] == feature_names:
+            drift_reference = reference
+            drift_recorder = drift_monitor.DriftRecorder(reference.empty_like())
+            drift_features = feature_names
+
+# Lignes scorées par une version du modèle ; une version demandée par ?model_version qui a d'autres features n'est pas comptée
+def observe_drift(X, version):
+    if drift_recorder is not None and (version.feature_names is drift_features or version.feature_names == drift_features):
+        drift_recorder.observe(X)
+
+# Chargement du modèle servi : version active du registre, sinon credit_scoring_new.joblib et optimal_threshold.txt
+# (ou le modèle allégé de SLIM_MODEL_DIR s'il a été exporté depuis ce pipeline)
+def load_active_model():
+    version = model_registry.read_pointer(model_registry.ACTIVE, MODEL_REGISTRY_DIR)
+    if version is not None:
+        return model_registry.load_version(version, MODEL_REGISTRY_DIR, USE_FAST_SCORER, CLIENT_DATA_PATH), True
+    return model_registry.load_files(MODEL_PATH, THRESHOLD_PATH, SLIM_MODEL_DIR, USE_FAST_SCORER,
+                                     schema_path=FEATURE_SCHEMA_PATH, reference_path=CLIENT_DATA_PATH), False
+
+# Mise en place d'un modèle chargé (et préchauffé) : une seule affectation pour toutes les routes
+def install_model(version):
+    global active_model
+    active_model = version
+    # Les clés des caches contiennent l'empreinte (modèle + seuil) : les anciennes entrées ne seraient plus relues
+    predict_cache.clear()
+    explain_cache.clear()
+    startup_timings["artifact"] = version.artifact
+    startup_timings["model_version"] = version.name
+    load_drift_monitor()
+
+# Avec warm_up, le nouveau modèle est préchauffé avant d'être mis en place (changement de modèle en cours de service)
+def load_model_artifacts(warm_up=False):
+    global artifacts_signature
+    start = time.perf_counter()
+    signature = get_artifacts_signature()
+    version, from_registry = load_active_model()
+    if warm_up:
+        version.warm_up()
+    install_model(version)
+    # Modèle du registre : les fichiers locaux seront comparés au modèle servi si le pointeur disparaît
+    artifacts_signature = None if from_registry else signature
+    startup_timings["load_seconds"] = round(time.perf_counter() - start, 3)
+
+# Nouveau seuil pour le même modèle : seul le seuil est relu, le modèle et son explainer sont repris tels quels
+def reload_threshold(signature):
+    global artifacts_signature
+    threshold = model_registry.read_threshold(THRESHOLD_PATH)
+    install_model(active_model.with_threshold(threshold, result_cache.file_fingerprint(MODEL_PATH, THRESHOLD_PATH)))
+    artifacts_signature = signature
+
+if not FAST_STARTUP:
+    load_model_artifacts()
+    model_ready.set()
+
+# Chargements de modèles en arrière-plan, par rôle ('active' : modèle servi, 'challenger' : mode shadow).
+# Les requêtes continuent d'être servies par le modèle courant pendant le chargement et le préchauffage.
+model_loading = {}
+model_errors = {}
+loading_lock = threading.Lock()
+
+def load_in_background_thread(role, target, task):
+    with loading_lock:
+        if role in model_loading:
+            return
+        model_loading[role] = target
+
+    def run():
+        try:
+            task()
+            model_errors.pop(role, None)
+        except Exception as e:
+            # Version illisible ou incomplète : on garde le modèle courant et on réessaiera plus tard
+            model_errors[role] = f"{target} : {e}"
+        finally:
+            with loading_lock:
+                model_loading.pop(role, None)
+
+    threading.Thread(target=run, daemon=True).start()
+
+# Comparaison du modèle servi et du challenger du registre sur le trafic réel (cf. model_registry.ShadowScorer)
+shadow = model_registry.ShadowScorer(int(os.environ.get('SHADOW_MAX_PENDING', 256)))
+
+def refresh_challenger():
+    version = model_registry.read_pointer(model_registry.CHALLENGER, MODEL_REGISTRY_DIR)
+    current = shadow.challenger.name if shadow.challenger is not None else None
+    if version == current:
+        return
+    if version is None:
+        shadow.reset(None)
+    else:
+        load_in_background_thread('challenger', version, lambda: shadow.reset(get_model_version(version)))
+
+# Vérification (au plus toutes les ARTIFACTS_CHECK_INTERVAL secondes) que le modèle servi est toujours le bon :
+# pointeurs du registre, ou fichiers du modèle hors registre
+ARTIFACTS_CHECK_INTERVAL = float(os.environ.get('ARTIFACTS_CHECK_INTERVAL', 5))
+last_artifacts_check = time.monotonic()
+reload_lock = threading.Lock()
+
+def refresh_model_if_changed():
+    global last_artifacts_check, artifacts_signature
+    if time.monotonic() - last_artifacts_check < ARTIFACTS_CHECK_INTERVAL:
+        return
+    with reload_lock:
+        if time.monotonic() - last_artifacts_check < ARTIFACTS_CHECK_INTERVAL:
+            return
+        last_artifacts_check = time.monotonic()
+        try:
+            refresh_challenger()
+            version = model_registry.read_pointer(model_registry.ACTIVE, MODEL_REGISTRY_DIR)
+            if version is not None:
+                if version != active_model.name or artifacts_signature is not None:
+                    load_in_background_thread('active', version, lambda: load_model_artifacts(warm_up=True))
+                return
+            signature = get_artifacts_signature()
+            if signature == artifacts_signature:
+                return
+            # Un simple changement de date ne suffit pas : on ne recharge que si le contenu a changé
+            if result_cache.file_fingerprint(MODEL_PATH, THRESHOLD_PATH) == active_model.fingerprint:
+                artifacts_signature = signature
+                return
+            if artifacts_signature is not None and result_cache.file_fingerprint(MODEL_PATH) == active_model.pipeline_fingerprint:
+                reload_threshold(signature)
+            else:
+                load_in_background_thread('active', MODEL_PATH, lambda: load_model_artifacts(warm_up=True))
+        except Exception:
+            # Fichier en cours de copie ou illisible : on garde le modèle courant et on réessaiera plus tard
+            pass
+
+# Même vérification depuis une route async : elle peut hacher les fichiers du modèle (SHA-256) et relire le seuil,
+# elle passe donc par le pool de threads pour ne jamais bloquer la boucle d'événements (ni le micro-batcher) ;
+# entre deux vérifications, il n'y a rien à faire et aucun thread n'est sollicité
+async def refresh_model_in_threadpool():
+    if time.monotonic() - last_artifacts_check >= ARTIFACTS_CHECK_INTERVAL:
+        await run_in_threadpool(refresh_model_if_changed)
+
+# Version du modèle demandée par une requête (?model_version=...) : le modèle servi par défaut, sinon une version du
+# registre, chargée et préchauffée au premier appel puis gardée parmi les MODEL_VERSIONS_LOADED dernières utilisées
+loaded_versions = OrderedDict()
+versions_lock = threading.Lock()
+
+def get_model_version(name=None):
+    version = active_model
+    if name is None or name == version.name:
+        return version
+    challenger = shadow.challenger
+    if challenger is not None and challenger.name == name:
+        return challenger
+    with versions_lock:
+        if name in loaded_versions:
+            loaded_versions.move_to_end(name)
+            return loaded_versions[name]
+    try:
+        version = model_registry.load_version(name, MODEL_REGISTRY_DIR, USE_FAST_SCORER, CLIENT_DATA_PATH).warm_up()
+    except (FileNotFoundError, ValueError) as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    with versions_lock:
+        loaded_versions[name] = version
+        while len(loaded_versions) > MODEL_VERSIONS_LOADED:
+            loaded_versions.popitem(last=False)
+    return version
+
+# Assemble une matrice NumPy (lignes x features) dans l'ordre des colonnes attendu par le modèle.
+# get_column(i) renvoie les valeurs de la i-ème colonne reçue ; les colonnes en trop (ex. SK_ID_CURR) sont ignorées.
+def columns_to_matrix(columns, get_column, names=None):
+    names = active_model.feature_names if names is None else names
+    positions = {model_column(name): i for i, name in enumerate(columns)}
+    missing = [name for name in names if name not in positions]
+    if missing:
+        raise ValueError(f"Colonnes manquantes : {missing}")
+
+    n_rows = len(get_column(positions[names[0]]))
+    X = np.empty((n_rows, len(names)), dtype=np.float64)
+    for j, name in enumerate(names):
+        X[:, j] = get_column(positions[name])
+    return X
+
+# Probabilités de la classe positive pour un DataFrame de features : scorer rapide si disponible,
+# pipeline complet sinon. Comme le pipeline, le scorer rapide lit les colonnes dans l'ordre reçu.
+def predict_probabilities(df, version=None):
+    version = version or active_model
+    if version.fast_model is not None:
+        with metrics.stage('preprocessing'):
+            X = df.to_numpy(dtype=np.float64)
+        with metrics.stage('inference'):
+            return version.fast_model.predict_proba(X)
+    # Avec le pipeline complet, prétraitement et inférence ne sont pas séparables
+    with metrics.stage('inference'):
+        return version.model.predict_proba(df)[:, 1]
+
+# Probabilités et décisions (seuil de la version) pour une matrice déjà ordonnée
+def score_matrix(X, version=None):
+    version = version or active_model
+    with metrics.stage('inference'):
+        y_pred_proba = version.predict_proba(X)
+    with metrics.stage('threshold'):
+        y_pred = (y_pred_proba >= version.threshold).astype(int)
+    return y_pred_proba, y_pred
+
+# Les requêtes /predict d'une seule ligne arrivant dans la même fenêtre sont scorées ensemble (cf. micro_batcher.py),
+# chaque ligne avec la version du modèle prise par sa requête
+PREDICT_BATCH_WAIT_MS = float(os.environ.get('PREDICT_BATCH_WAIT_MS', 3))
+PREDICT_BATCH_MAX_ROWS = int(os.environ.get('PREDICT_BATCH_MAX_ROWS', 64))
+predict_batcher = None
+if PREDICT_BATCH_WAIT_MS > 0:
+    predict_batcher = micro_batcher.MicroBatcher(lambda X: score_matrix(X)[0], PREDICT_BATCH_WAIT_MS / 1000, PREDICT_BATCH_MAX_ROWS)
+
+# L'explainer SHAP de chaque version est construit une seule fois par worker puis partagé par toutes les requêtes
+# (cf. ModelVersion.get_explainer) ; la durée de l'import de shap, au premier explainer, est renvoyée par /ready
+def get_explainer(version):
+    if version.explainer is None and "shap_import_seconds" not in startup_timings:
+        start = time.perf_counter()
+        import shap
+        startup_timings["shap_import_seconds"] = round(time.perf_counter() - start, 3)
+    return version.get_explainer()
+
+# Valeur de base (prédiction moyenne en log-odds) de la classe positive pour une version
+def get_expected_value(version):
+    get_explainer(version)
+    return version.expected_value()
+
+# Construction d'une explication SHAP compacte : la valeur de base (expected_value, en log-odds) et les noms des
+# features ne sont envoyés qu'une seule fois par réponse. Si top_k est précisé, seules les k contributions les plus
+# fortes en valeur absolue sont gardées pour chaque ligne, le reste étant cumulé dans un seau "other".
+def compact_explanation(shap_matrix, columns, expected_value, top_k=None):
+    response = {"expected_value": expected_value}
+
+    # Sans top_k (ou si k couvre toutes les features), on renvoie la matrice complète
+    if top_k is None or top_k >= shap_matrix.shape[1]:
+        response["feature_names"] = list(columns)
+        response["shap_values"] = shap_matrix.tolist()
+        return response
+
+    # Indices des k plus grandes |SHAP| de chaque ligne (argpartition évite un tri complet)
+    abs_shap = np.abs(shap_matrix)
+    top_idx = np.argpartition(-abs_shap, top_k - 1, axis=1)[:, :top_k]
+
+    # Tri par |SHAP| décroissante à l'intérieur du top-k
+    order = np.argsort(-np.take_along_axis(abs_shap, top_idx, axis=1), axis=1)
+    top_idx = np.take_along_axis(top_idx, order, axis=1)
+    top_values = np.take_along_axis(shap_matrix, top_idx, axis=1)
+
+    # La somme des contributions restantes garantit que base + top-k + other = log-odds prédit
+    other = shap_matrix.sum(axis=1) - top_values.sum(axis=1)
+
+    # Seules les features apparaissant dans au moins un top-k sont nommées ; les lignes y font référence par indice
+    used, local_idx = np.unique(top_idx, return_inverse=True)
+    local_idx = local_idx.reshape(top_idx.shape)
+    response["feature_names"] = [columns[i] for i in used]
+    response["explanations"] = [
+        {"features": local_idx[i].tolist(), "values": top_values[i].tolist(), "other": float(other[i])}
+        for i in range(shap_matrix.shape[0])
+    ]
+    return response
+
+# Stock précalculé des scores et SHAP par client (cf. client_store.py), et jeu de features
+# utilisé pour calculer en direct les clients absents du stock. Le jeu est chargé avec des types réduits
+# (cf. dtype_optimizer.py) : le schéma est choisi au premier chargement avec les seuils du modèle, enregistré
+# par empreinte du pipeline à côté de FEATURE_DTYPES_PATH, puis réappliqué tel quel ; les features sont repassées
+# en float64 pour le scoring. Après un changement de modèle, le jeu est rechargé avec le schéma du nouveau pipeline.
+CLIENT_STORE_DIR = os.environ.get('CLIENT_STORE_DIR', 'client_store')
+FEATURE_DTYPES_PATH = os.environ.get('FEATURE_DTYPES_PATH', 'feature_dtypes.json')
+store_cache = {}
+client_data = (None, None)
+client_data_memory = None
+client_lock = threading.Lock()
+
+# Le stock est relu si meta.json change (nouveau précalcul), et ignoré s'il a été calculé avec un autre pipeline
+# que celui de la version demandée : les clients sont alors calculés en direct avec le modèle servi
+def get_client_store(version=None):
+    version = version or active_model
+    path = os.path.join(CLIENT_STORE_DIR, 'meta.json')
+    if not os.path.exists(path):
+        return None
+    key = os.stat(path).st_mtime_ns
+    if store_cache.get('key') != key:
+        with client_lock:
+            if store_cache.get('key') != key:
+                store_cache.update(key=key, store=client_store.ClientStore(CLIENT_STORE_DIR))
+    store = store_cache['store']
+    return store if store.pipeline_fingerprint == version.pipeline_fingerprint else None
+
+# Features d'un client pour le calcul en direct (le jeu de données est chargé une fois par pipeline, indexé par SK_ID_CURR)
+def get_client_features(client_id, version=None):
+    global client_data, client_data_memory
+    version = version or active_model
+    fingerprint = version.pipeline_fingerprint
+    data_fingerprint, data = client_data
+    if data_fingerprint != fingerprint:
+        with client_lock:
+            data_fingerprint, data = client_data
+            if data_fingerprint != fingerprint:
+                path = dtype_optimizer.dtypes_path(FEATURE_DTYPES_PATH, fingerprint)
+                data, client_data_memory = dtype_optimizer.optimize(pd.read_csv(CLIENT_DATA_PATH), path,
+                                                                    lambda: dtype_optimizer.split_thresholds(version.booster))
+                data = data.set_index('SK_ID_CURR')
+                # (empreinte, jeu) remplacés en une seule affectation
+                client_data = (fingerprint, data)
+    if client_id not in data.index:
+        raise HTTPException(status_code=404, detail=f"Client {client_id} inconnu.")
+    return data.loc[[client_id]]
+
+# Calcul en ligne des features d'un nouveau demandeur (cf. online_features.py) : plan des agrégats écrit par
+# feature_engineering.py et préparation ajustée pour le modèle, chargés au premier appel
+FEATURE_PLAN_PATH = os.environ.get('FEATURE_PLAN_PATH', 'feature_plan.json')
+MODEL_PREPARATION_PATH = os.environ.get('MODEL_PREPARATION_PATH', online_features.PREPARATION_PATH)
+online_builder = None
+online_preparation = None
+online_lock = threading.Lock()
+
+def get_online_features():
+    global online_builder
+    if online_builder is None:
+        with online_lock:
+            if online_builder is None:
+                if not os.path.exists(FEATURE_PLAN_PATH):
+                    raise HTTPException(status_code=503, detail=f"Calcul en ligne des features indisponible : {FEATURE_PLAN_PATH} absent.")
+                online_builder = online_features.OnlineFeatureBuilder.from_file(FEATURE_PLAN_PATH)
+    return online_builder, get_model_preparation()
+
+# Préparation ajustée seule (imputation et mise à l'échelle), utilisée aussi par les scénarios what-if relatifs
+def get_model_preparation():
+    global online_preparation
+    if online_preparation is None:
+        with online_lock:
+            if online_preparation is None:
+                if not os.path.exists(MODEL_PREPARATION_PATH):
+                    raise HTTPException(status_code=503, detail=f"Préparation des features indisponible : {MODEL_PREPARATION_PATH} absent.")
+                online_preparation = joblib.load(MODEL_PREPARATION_PATH)
+    return online_preparation
 
 # Initialisation de FastAPI
 app = FastAPI() # Une instance de l'application FastAPI est créée 
 
+# Chronométrage de chaque requête (cf. metrics.py) : le middleware mesure la durée totale, la lecture/validation
+# de l'entrée et la sérialisation de la réponse ; les routes ajoutent la durée de leurs propres étapes
+@app.middleware("http")
+async def collect_metrics(request: Request, call_next):
+    timings = metrics.start_request()
+    status_code = 500
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+        return response
+    finally:
+        # Le modèle de chemin de la route (ex. /clients/{client_id}/score) évite une série par client
+        route = request.scope.get("route")
+        path = route.path if route is not None else "unmatched"
+        if path != "/metrics":
+            metrics.finish_request(timings, path, status_code)
+
+# Tant que le modèle n'est pas chargé (démarrage rapide), seules les routes de supervision répondent
+@app.middleware("http")
+async def wait_for_model(request: Request, call_next):
+    if not model_ready.is_set() and request.url.path not in ("/", "/health", "/ready", "/metrics"):
+        return JSONResponse({"detail": "Modèle en cours de chargement."}, status_code=503, headers={"Retry-After": "5"})
+    return await call_next(request)
+
+# Passage d'une ligne factice dans le modèle (et dans SHAP, hors démarrage rapide) pour que la première vraie
+# requête ne paie pas le coût d'initialisation
+def warm_up_model(with_shap):
+    version = active_model
+    dummy = pd.DataFrame(np.zeros((1, len(version.feature_names))), columns=version.feature_names)
+    version.warm_up()
+    if with_shap:
+        get_explainer(version).shap_values(dummy)
+
+def load_in_background():
+    try:
+        load_model_artifacts()
+        warm_up_model(with_shap=False)
+        model_ready.set()
+    except Exception as e:
+        startup_timings["error"] = str(e)
+
+# Au démarrage : préchauffage du modèle et de l'explainer, ou, en démarrage rapide, chargement du modèle dans
+# un thread pour que le serveur réponde tout de suite
+@app.on_event("startup")
+def warm_up():
+    if FAST_STARTUP:
+        threading.Thread(target=load_in_background, daemon=True).start()
+    else:
+        warm_up_model(with_shap=True)
+
+# À l'arrêt, on libère le pool de processus utilisé pour les explications par lots
+@app.on_event("shutdown")
+def close_pools():
+    parallel_shap.shutdown_pool()
+    if predict_batcher is not None:
+        predict_batcher.close()
+
 # Modèle de données pour les prédictions
 class InputData(BaseModel): # La classe InputData est définie pour valider les données d'entrée de l'API. 
     data: list[dict] # Elle attend une liste de dictionnaires qui seront convertis en DataFrame.
 
+# Format colonnaire pour le scoring par lots : la liste des noms de colonnes et un tableau de valeurs par colonne
+# (null est accepté et traité comme une valeur manquante)
+class ColumnarData(BaseModel):
+    columns: list[str]
+    values: list[list[Optional[float]]]
+
+# Données brutes d'un client : sa demande de prêt (format application_test.csv) et ses lignes dans les tables
+# enfants ; bureau_balance contient les lignes des prêts du client dans bureau
+class RawClientData(BaseModel):
+    application: dict
+    bureau: list[dict] = []
+    bureau_balance: list[dict] = []
+    previous: list[dict] = []
+    cash: list[dict] = []
+    credit: list[dict] = []
+    installments: list[dict] = []
+
+# Scénarios what-if d'un client : sa ligne de features (dans l'ordre du modèle, comme pour /predict) et les valeurs
+# à essayer pour quelques features (unités du modèle) ; avec relative=true, ces valeurs sont des facteurs de la
+# valeur d'origine du client (ex. 0.8 : 20 % de moins), avant imputation et mise à l'échelle
+class WhatIfData(BaseModel):
+    row: dict
+    perturbations: dict[str, list[float]]
+    mode: Literal['grid', 'independent'] = 'grid'
+    relative: bool = False
+
 
 # Route pour vérifier si le serveur fonctionne
 @app.get("/")
 def home():
     return {"message": "API de scoring de crédit est en cours d'exécution."}
 
+# Route de vivacité : le processus répond, que le modèle soit chargé ou non
+@app.get("/health")
+def health():
+    return {"status": "up"}
+
+# Route de disponibilité : 200 quand le modèle est chargé, 503 pendant le chargement ; renvoie les durées
+# du démarrage (imports, chargement du modèle, type d'artefact chargé, import de shap s'il a eu lieu)
+@app.get("/ready")
+def ready():
+    if not model_ready.is_set():
+        status = "error" if "error" in startup_timings else "loading"
+        return JSONResponse({"status": status, **startup_timings}, status_code=503)
+    return {"status": "ready", **startup_timings}
+
+# Route de suivi des caches : nombre d'entrées, hits/misses, empreinte du modèle courant et mémoire du jeu
+# de features des clients (octets avant / après réduction des types, None tant qu'il n'est pas chargé)
+@app.get("/cache/stats")
+def cache_stats():
+    return {"model_fingerprint": active_model.fingerprint,
+            "predict": predict_cache.stats(),
+            "explain": explain_cache.stats(),
+            "client_data_memory": client_data_memory}
+
+# Route de supervision au format texte Prometheus : histogrammes des durées par étape et des tailles de lot,
+# nombre de requêtes et d'erreurs par route, état des caches
+@app.get("/metrics", response_class=PlainTextResponse)
+def prometheus_metrics():
+    return metrics.render({"predict": predict_cache.stats(), "explain": explain_cache.stats()})
+
+# Importance globale des features (cf. global_importance.py) du modèle chargé, relue si le fichier change
+GLOBAL_IMPORTANCE_DIR = os.environ.get('GLOBAL_IMPORTANCE_DIR', global_importance.IMPORTANCE_DIR)
+importance_cache = {}
+
+def get_global_importance(version):
+    path = global_importance.importance_path(version.pipeline_fingerprint, GLOBAL_IMPORTANCE_DIR)
+    if not os.path.exists(path):
+        raise HTTPException(status_code=404, detail=f"Pas d'importance globale calculée pour le modèle {version.pipeline_fingerprint}.")
+    key = (path, os.stat(path).st_mtime_ns)
+    if importance_cache.get('key') != key:
+        importance_cache.update(key=key, accumulator=global_importance.ImportanceAccumulator.load(path))
+    return importance_cache['accumulator']
+
+# Route de l'importance globale : moyenne des |SHAP| de chaque feature sur toute la population ou sur un segment
+# ("NAME_CONTRACT_TYPE=Cash loans", "income_band=100k-150k"...), par importance décroissante
+@app.get("/importance/global")
+def importance(segment: str = global_importance.ALL, top_k: Optional[int] = Query(None, ge=1)):
+    version = active_model
+    accumulator = get_global_importance(version)
+    if segment not in accumulator.counts:
+        raise HTTPException(status_code=404, detail=f"Segment {segment} inconnu.")
+    frame = accumulator.to_frame(segment)
+    if top_k is not None:
+        frame = frame.head(top_k)
+    return {"model_fingerprint": version.pipeline_fingerprint,
+            "segment": segment,
+            "n_clients": accumulator.counts[segment],
+            "segments": accumulator.segments(),
+            "feature_names": frame['Feature'].tolist(),
+            "mean_abs_shap": frame['MeanAbsSHAP'].tolist()}
+
+# Versions des seuils calculés par threshold_engine.py (optimum et courbe de coût)
+THRESHOLDS_DIR = os.environ.get('THRESHOLDS_DIR', threshold_engine.THRESHOLDS_DIR)
+threshold_artifact_cache = {}
+
+# Version et calcul du seuil servi : la recherche relit tous les thresholds/*.json, elle n'est donc refaite que si
+# le seuil, le modèle ou le contenu du répertoire (date de modification : version ajoutée ou remplacée) change
+def get_threshold_artifact(model):
+    mtime = os.stat(THRESHOLDS_DIR).st_mtime_ns if os.path.isdir(THRESHOLDS_DIR) else None
+    key = (model.threshold, model.pipeline_fingerprint, THRESHOLDS_DIR, mtime)
+    entry = threshold_artifact_cache.get('entry')
+    if entry is None or entry[0] != key:
+        version = threshold_engine.find_version(model.threshold, model.pipeline_fingerprint, THRESHOLDS_DIR)
+        artifact = threshold_engine.load_artifact(version, THRESHOLDS_DIR) if version is not None else None
+        # (clé, version, calcul) remplacés en une seule affectation
+        entry = threshold_artifact_cache['entry'] = (key, version, artifact)
+    return entry[1], entry[2]
+
+# Route du seuil de décision : valeur utilisée, version du calcul qui l'a produite (None pour un seuil écrit à la
+# main ou par le notebook) et, avec ?curve=true, la courbe coût / faux négatifs / faux positifs de cette version
+@app.get("/threshold")
+def get_threshold(curve: bool = False):
+    model = active_model
+    version, artifact = get_threshold_artifact(model)
+    response = {"threshold": model.threshold, "version": version, "model_fingerprint": model.fingerprint}
+    if version is not None:
+        response.update({key: artifact[key] for key in ['cost', 'cost_fn', 'cost_fp', 'n', 'confusion', 'recall']})
+        if curve:
+            response["curve"] = artifact["curve"]
+    return response
+
+# Route de relecture immédiate de optimal_threshold.txt (et du modèle s'il a changé), sans attendre la
+# vérification périodique ; un fichier illisible laisse le seuil courant en place
+@app.post("/threshold/reload")
+def reload_threshold_now():
+    global last_artifacts_check
+    last_artifacts_check = float('-inf')
+    refresh_model_if_changed()
+    return get_threshold()
+
+# Route du registre des modèles : version servie, challenger, versions enregistrées et chargées, chargements en cours
+@app.get("/models")
+def get_models():
+    return {"active": active_model.name,
+            "artifact": active_model.artifact,
+            "threshold": active_model.threshold,
+            "challenger": shadow.challenger.name if shadow.challenger is not None else None,
+            "loaded": list(loaded_versions),
+            "loading": dict(model_loading),
+            "errors": dict(model_errors),
+            "registry": model_registry.list_versions(MODEL_REGISTRY_DIR)}
+
+def registered_version(version):
+    try:
+        model_registry.version_dir(version, MODEL_REGISTRY_DIR)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    if not any(meta['version'] == version for meta in model_registry.list_versions(MODEL_REGISTRY_DIR)):
+        raise HTTPException(status_code=404, detail=f"Version {version} absente du registre.")
+    return version
+
+# Route d'activation d'une version : le pointeur du registre est mis à jour (les autres workers suivent à leur
+# prochaine vérification), puis la version est chargée et préchauffée en arrière-plan avant de remplacer le
+# modèle servi ; les requêtes en cours se terminent avec l'ancien modèle. Réponse 202 tant que le chargement dure.
+@app.post("/models/{version}/activate")
+def activate_model(version: str):
+    registered_version(version)
+    model_registry.set_pointer(model_registry.ACTIVE, version, MODEL_REGISTRY_DIR)
+    if version == active_model.name and artifacts_signature is None:
+        return {"status": "active", "version": version}
+    load_in_background_thread('active', version, lambda: load_model_artifacts(warm_up=True))
+    return JSONResponse({"status": "loading", "version": version}, status_code=202)
+
+# Route du mode shadow : la version devient le challenger, qui score en arrière-plan les mêmes lignes que le
+# modèle servi ; DELETE /models/challenger arrête la comparaison
+@app.post("/models/{version}/challenger")
+def set_challenger(version: str):
+    registered_version(version)
+    model_registry.set_pointer(model_registry.CHALLENGER, version, MODEL_REGISTRY_DIR)
+    refresh_challenger()
+    return JSONResponse({"status": "loading", "version": version}, status_code=202)
+
+@app.delete("/models/challenger")
+def clear_challenger():
+    model_registry.set_pointer(model_registry.CHALLENGER, None, MODEL_REGISTRY_DIR)
+    shadow.reset(None)
+    return {"status": "cleared"}
+
+# Route de la comparaison champion / challenger : écart moyen et maximal des probabilités, taux d'accord des
+# décisions et décisions qui changeraient (accord -> refus, refus -> accord), sur les lignes comparées
+@app.get("/models/shadow")
+def shadow_stats():
+    return shadow.stats()
+
+# Route de la dérive des données : PSI et KS de chaque feature entre la population de référence et les lignes
+# reçues depuis le démarrage (ou la dernière remise à zéro), par PSI décroissant
+@app.get("/drift")
+def get_drift(top_k: Optional[int] = Query(None, ge=1)):
+    if drift_recorder is None:
+        raise HTTPException(status_code=404, detail=f"Surveillance de la dérive désactivée ({DRIFT_REFERENCE_PATH} absent ou d'autres features).")
+    current = drift_recorder.flush()
+    report = drift_monitor.drift_report(drift_reference, current)
+    status_counts = report['status'].value_counts().to_dict()
+    if top_k is not None:
+        report = report.head(top_k)
+    return {"n_reference": drift_reference.n_rows,
+            "n_current": current.n_rows,
+            "status_counts": status_counts,
+            "features": json.loads(report.to_json(orient='records'))}
+
+# Route de remise à zéro des comptages (ex. après un changement de modèle ou de population)
+@app.post("/drift/reset")
+def reset_drift():
+    if drift_recorder is not None:
+        drift_recorder.reset()
+    return {"status": "reset"}
+
+# Route du contrat des features : noms dans l'ordre du modèle, types et catégories autorisées
+# (?model_version=... pour le contrat d'une version précise du registre)
+@app.get("/schema")
+def get_schema(model_version: Optional[str] = None):
+    return get_model_version(model_version).schema
+
 # Route pour prédire la classe d'un client
+# Les requêtes d'une seule ligne (cas du dashboard) passent par le micro-batching ; les lots sont traités
+# dans le pool de threads pour ne pas bloquer la boucle d'événements
+# Paramètre optionnel : model_version=... score avec une version précise du registre au lieu du modèle servi
+# (les réponses indiquent toujours la version utilisée) ; sans lui, les lignes sont aussi comparées au challenger
 @app.post("/predict")
-def predict(input_data: InputData):
+@metrics.instrumented
+async def predict(input_data: InputData, model_version: Optional[str] = None):
+    await refresh_model_in_threadpool()
+    version = active_model if model_version is None else await run_in_threadpool(get_model_version, model_version)
+    if predict_batcher is not None and len(input_data.data) == 1:
+        try:
+            return await predict_single_row(input_data.data[0], version, model_version is None)
+        except feature_schema.SchemaError as e:
+            raise HTTPException(status_code=422, detail=e.errors)
+        except Exception as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    return await run_in_threadpool(predict_rows, input_data, version, model_version is None)
+
+# Prédiction d'une seule ligne : la ligne est convertie en vecteur sans passer par un DataFrame,
+# puis envoyée au micro-batcher si elle n'est pas déjà dans le cache
+async def predict_single_row(row, version, with_shadow):
+    metrics.set_batch_size(1)
+
+    # Les colonnes sont vérifiées avant le scoring ; la ligne est alors déjà dans l'ordre du modèle
+    with metrics.stage('preprocessing'):
+        columns = list(row)
+        feature_schema.check_columns(version.schema, columns)
+        X = feature_schema.decode_rows(version.schema, [list(row.values())])
+    observe_drift(X, version)
+
+    with metrics.stage('cache'):
+        key = result_cache.matrix_keys(X, columns, version.fingerprint)[0]
+        probability = predict_cache.get(key)
+    if probability is None:
+        with metrics.stage('micro-batch'):
+            probability = await predict_batcher.submit(X[0], version.predict_proba)
+        predict_cache.put(key, probability)
+    if with_shadow:
+        shadow.submit(version, X, [probability])
+
+    with metrics.stage('threshold'):
+        prediction = int(probability >= version.threshold)
+    return {"prediction": [prediction], "probability": [probability], "model_version": version.name}
+
+def predict_rows(input_data, version, with_shadow):
     try:
         # La route prend des données en entrée et les convertit en DataFrame
-        df = pd.DataFrame(input_data.data)
+        with metrics.stage('dataframe'):
+            df = pd.DataFrame(input_data.data)
+            feature_schema.check_columns(version.schema, df.columns)
+        metrics.set_batch_size(len(df))
+        X = df.to_numpy(dtype=np.float64)
+        observe_drift(X, version)
         
-        # Elle prédit des probabilités
-        y_pred_proba = model.predict_proba(df)[:, 1]
+        # Elle relit dans le cache les lignes déjà scorées avec ce modèle et ne prédit que les autres
+        with metrics.stage('cache'):
+            keys = result_cache.row_keys(df, version.fingerprint)
+            probabilities = [predict_cache.get(key) for key in keys]
+        missing = [i for i, probability in enumerate(probabilities) if probability is None]
+        if missing:
+            computed = predict_probabilities(df.iloc[missing], version)
+            for i, probability in zip(missing, computed):
+                probabilities[i] = float(probability)
+                predict_cache.put(keys[i], float(probability))
+        y_pred_proba = np.array(probabilities, dtype=np.float64)
+        if with_shadow:
+            shadow.submit(version, X, y_pred_proba)
         
         # Elle applique le seuil optimal
-        y_pred = (y_pred_proba >= optimal_threshold).astype(int)
+        with metrics.stage('threshold'):
+            y_pred = (y_pred_proba >= version.threshold).astype(int)
         
         # Et retourne la prédiction et la probabilité
-        return {"prediction": y_pred.tolist(), "probability": y_pred_proba.tolist()}
+        return {"prediction": y_pred.tolist(), "probability": y_pred_proba.tolist(), "model_version": version.name}
+    except feature_schema.SchemaError as e:
+        raise HTTPException(status_code=422, detail=e.errors)
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 # Route pour obtenir l'explication SHAP des prédictions
+# Paramètres optionnels : compact=true renvoie aussi la valeur de base et les noms des features,
+# top_k=k ne garde que les k contributions les plus fortes (implique le mode compact)
 @app.post("/explain")
-def explain(input_data: InputData):
+@metrics.instrumented
+def explain(input_data: InputData, compact: bool = False, top_k: Optional[int] = Query(None, ge=1), model_version: Optional[str] = None):
+    refresh_model_if_changed()
+    version = get_model_version(model_version)
     try:
         # La route prend des données en entrée et les convertit en DataFrame
-        df = pd.DataFrame(input_data.data)
+        with metrics.stage('dataframe'):
+            df = pd.DataFrame(input_data.data)
+            feature_schema.check_columns(version.schema, df.columns)
+        metrics.set_batch_size(len(df))
         
-        # Elle initialise l'Explainer SHAP
-        explainer = shap.Explainer(model.named_steps['model'])
-        shap_values = explainer.shap_values(df)
+        # Elle relit dans le cache les lignes déjà expliquées et utilise l'explainer SHAP partagé pour les autres
+        with metrics.stage('cache'):
+            keys = result_cache.row_keys(df, version.fingerprint)
+            rows = [explain_cache.get(key) for key in keys]
+        missing = [i for i, row in enumerate(rows) if row is None]
+        if missing:
+            with metrics.stage('shap'):
+                computed = parallel_shap.positive_class_values(get_explainer(version).shap_values(df.iloc[missing]))
+            for i, row in zip(missing, computed):
+                rows[i] = row
+                explain_cache.put(keys[i], row)
+        shap_matrix = np.vstack(rows)
+
+        # En mode compact, elle retourne la valeur de base, les noms des features et les contributions retenues
+        if compact or top_k is not None:
+            response = compact_explanation(shap_matrix, df.columns.tolist(), get_expected_value(version), top_k)
+            response["model_version"] = version.name
+            return response
         
-        # Et retourne les valeurs SHAP pour la classe positive
-        explanation = shap_values[1].tolist()  
+        # Sinon elle retourne les valeurs SHAP pour la classe positive
+        explanation = shap_matrix.tolist()  
         
-        return {"shap_values": explanation}
+        return {"shap_values": explanation, "model_version": version.name}
+    except feature_schema.SchemaError as e:
+        raise HTTPException(status_code=422, detail=e.errors)
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
+
+# Route de scoring d'un nouveau demandeur à partir de ses données brutes : les features du modèle sont
+# calculées pour ce seul client avec les mêmes définitions que le feature engineering par lots
+@app.post("/predict/raw")
+@metrics.instrumented
+def predict_raw(input_data: RawClientData, model_version: Optional[str] = None):
+    refresh_model_if_changed()
+    version = get_model_version(model_version)
+    builder, preparation = get_online_features()
+    try:
+        with metrics.stage('features'):
+            records = input_data.model_dump(exclude={'application'})
+            features = preparation.transform(builder.client_features(input_data.application, records))
+        with metrics.stage('preprocessing'):
+            X = columns_to_matrix(features.columns, lambda i: features.iloc[:, i].to_numpy(), version.feature_names)
+        metrics.set_batch_size(1)
+        observe_drift(X, version)
+        y_pred_proba, y_pred = score_matrix(X, version)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if model_version is None:
+        shadow.submit(version, X, y_pred_proba)
+    return {"SK_ID_CURR": input_data.application.get('SK_ID_CURR'), "prediction": int(y_pred[0]),
+            "probability": float(y_pred_proba[0]), "model_version": version.name}
+
+
+# Route what-if : toutes les variantes de la ligne de base sont scorées en un seul appel au modèle (cf. what_if.py).
+# mode=grid renvoie une surface de probabilités (une dimension par feature, dans l'ordre de "perturbations"),
+# mode=independent une courbe par feature ; flips compte les variantes dont la décision diffère de celle de la base.
+# Les variantes sont des lignes fictives : elles ne sont comptées ni par le suivi de dérive ni par le mode shadow.
+@app.post("/predict/whatif")
+@metrics.instrumented
+def predict_what_if(input_data: WhatIfData, model_version: Optional[str] = None):
+    refresh_model_if_changed()
+    version = get_model_version(model_version)
+    preparation = what_if_preparation(version) if input_data.relative else None
+    try:
+        with metrics.stage('preprocessing'):
+            feature_schema.check_columns(version.schema, list(input_data.row))
+            base = feature_schema.decode_rows(version.schema, [list(input_data.row.values())])[0]
+            names = list(input_data.perturbations)
+            columns = what_if_columns(version.schema, names)
+            values = what_if.perturbation_values(base, columns, list(input_data.perturbations.values()), input_data.relative, preparation)
+            check_what_if_values(version.schema, names, columns, values, input_data.mode)
+            X = what_if.perturbation_matrix(base, columns, values, input_data.mode, with_base=True)
+        metrics.set_batch_size(len(X))
+        y_pred_proba, y_pred = score_matrix(X, version)
+    except feature_schema.SchemaError as e:
+        raise HTTPException(status_code=422, detail=e.errors)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    base_prediction = int(y_pred[0])
+    if input_data.mode == 'grid':
+        shape = [len(v) for v in values]
+        probability = y_pred_proba[1:].reshape(shape).tolist()
+        prediction = y_pred[1:].reshape(shape).tolist()
+        flips = int(np.sum(y_pred[1:] != base_prediction))
+    else:
+        probability = [curve.tolist() for curve in what_if.split_curves(values, y_pred_proba[1:])]
+        prediction = [curve.tolist() for curve in what_if.split_curves(values, y_pred[1:])]
+        flips = [int(np.sum(np.asarray(curve) != base_prediction)) for curve in prediction]
+    response = {"mode": input_data.mode, "features": names, "values": [v.tolist() for v in values],
+                "probability": probability, "prediction": prediction, "flips": flips,
+                "base_probability": float(y_pred_proba[0]), "base_prediction": base_prediction,
+                "threshold": version.threshold, "model_version": version.name}
+    # Facteurs relatifs : valeurs essayées en unités d'origine, et valeur d'origine du client
+    if preparation is not None:
+        response["raw_values"] = [preparation.to_raw(v, j).tolist() for j, v in zip(columns, values)]
+        response["base_raw_values"] = [float(preparation.to_raw(base[j], j)) for j in columns]
+    return response
+
+# Préparation ajustée du modèle (cf. online_features.ModelPreparation), qui doit décrire les mêmes features que la
+# version, dans le même ordre : sans elle, les facteurs relatifs ne peuvent pas être ramenés aux unités d'origine
+def what_if_preparation(version):
+    preparation = get_model_preparation()
+    if [model_column(name) for name in preparation.feature_names] != version.feature_names:
+        raise HTTPException(status_code=503, detail=f"{MODEL_PREPARATION_PATH} ne décrit pas les features du modèle {version.name}.")
+    return preparation
+
+# Positions des features modifiées dans la ligne du modèle
+def what_if_columns(schema, names):
+    positions = {feature['name']: j for j, feature in enumerate(schema['features'])}
+    errors = [{"loc": ["body", "perturbations", name], "type": "missing", "msg": f"Feature '{name}' inconnue du modèle"}
+              for name in names if model_column(name) not in positions]
+    if not names:
+        errors.append({"loc": ["body", "perturbations"], "type": "missing", "msg": "Au moins une feature à faire varier est attendue"})
+    if errors:
+        raise feature_schema.SchemaError(errors[:feature_schema.MAX_ERRORS])
+    return [positions[model_column(name)] for name in names]
+
+# Nombre de variantes borné et, pour une feature catégorielle, codes de catégories connus du modèle
+def check_what_if_values(schema, names, columns, values, mode):
+    errors = []
+    for name, j, v in zip(names, columns, values):
+        categories = schema['features'][j].get('categories')
+        if not len(v):
+            errors.append({"loc": ["body", "perturbations", name], "type": "list_type", "msg": f"Aucune valeur pour '{name}'"})
+        elif categories and not np.isin(v[~np.isnan(v)], np.arange(len(categories))).all():
+            errors.append({"loc": ["body", "perturbations", name], "type": "enum",
+                           "msg": f"'{name}' : codes de catégorie inconnus ({len(categories)} catégories)"})
+    if errors:
+        raise feature_schema.SchemaError(errors)
+    n_rows = what_if.scenario_count(values, mode)
+    if n_rows > what_if.MAX_ROWS:
+        raise feature_schema.SchemaError([{"loc": ["body", "perturbations"], "type": "too_long",
+                                           "msg": f"{n_rows} variantes demandées (au plus {what_if.MAX_ROWS})"}])
+
+
+# Score et valeurs SHAP d'un client connu : lus dans le stock précalculé, ou calculés en direct sinon
+# (les features du client ne sont alors lues qu'une fois). La décision est toujours recalculée avec le seuil courant.
+def client_score_values(client_id, version):
+    store = get_client_store(version)
+    if store is not None and client_id in store:
+        return store.probability_of(client_id), "store"
+    return float(predict_probabilities(get_client_features(client_id, version), version)[0]), "live"
+
+def client_explanation(client_id, version, top_k=None, with_score=False):
+    store = get_client_store(version)
+    if store is not None and client_id in store:
+        shap_matrix = store.shap_values_of(client_id)[np.newaxis, :]
+        columns = store.feature_names
+        probability = store.probability_of(client_id) if with_score else None
+        expected_value = store.expected_value
+        source = "store"
+    else:
+        features = get_client_features(client_id, version)
+        shap_matrix = parallel_shap.positive_class_values(get_explainer(version).shap_values(features))
+        columns = features.columns.tolist()
+        probability = float(predict_probabilities(features, version)[0]) if with_score else None
+        expected_value = get_expected_value(version)
+        source = "live"
+
+    response = compact_explanation(shap_matrix, columns, expected_value, top_k)
+    response["SK_ID_CURR"] = client_id
+    if with_score:
+        response["prediction"] = int(probability >= version.threshold)
+        response["probability"] = probability
+    response["source"] = source
+    response["model_version"] = version.name
+    return response
+
+# Route de score d'un client connu : réponse immédiate depuis le stock précalculé, calcul en direct sinon
+# (?model_version=... sur les routes /clients : version précise du registre, le stock ne sert que pour son modèle)
+@app.get("/clients/{client_id}/score")
+@metrics.instrumented
+def client_score(client_id: int, model_version: Optional[str] = None):
+    version = get_model_version(model_version)
+    probability, source = client_score_values(client_id, version)
+    return {"SK_ID_CURR": client_id, "prediction": int(probability >= version.threshold),
+            "probability": probability, "source": source, "model_version": version.name}
+
+# Route d'explication SHAP d'un client connu (format compact, top_k optionnel), depuis le stock ou en direct
+@app.get("/clients/{client_id}/explain")
+@metrics.instrumented
+def client_explain(client_id: int, top_k: Optional[int] = Query(None, ge=1), model_version: Optional[str] = None):
+    return client_explanation(client_id, get_model_version(model_version), top_k)
+
+# Route combinée pour le dashboard : score, décision et explication SHAP d'un client en un seul aller-retour
+@app.get("/clients/{client_id}/decision")
+@metrics.instrumented
+def client_decision(client_id: int, top_k: Optional[int] = Query(None, ge=1), model_version: Optional[str] = None):
+    return client_explanation(client_id, get_model_version(model_version), top_k, with_score=True)
+
+# Route d'explication SHAP pour les gros lots : le calcul est réparti sur un pool de processus
+# (taille réglable par la variable d'environnement SHAP_WORKERS) et les lignes reviennent dans l'ordre d'entrée
+@app.post("/explain/batch")
+@metrics.instrumented
+def explain_batch(input_data: InputData, compact: bool = False, top_k: Optional[int] = Query(None, ge=1), model_version: Optional[str] = None):
+    refresh_model_if_changed()
+    version = get_model_version(model_version)
+    try:
+        # Mêmes vérifications que /explain : des colonnes manquantes ou dans le désordre donneraient des valeurs
+        # SHAP attribuées aux mauvaises features
+        with metrics.stage('dataframe'):
+            df = pd.DataFrame(input_data.data)
+            feature_schema.check_columns(version.schema, df.columns)
+        metrics.set_batch_size(len(df))
+        with metrics.stage('shap'):
+            shap_matrix = parallel_shap.explain_batch(df, get_explainer(version), model_path=version.source)
+
+        if compact or top_k is not None:
+            response = compact_explanation(shap_matrix, df.columns.tolist(), get_expected_value(version), top_k)
+            response["model_version"] = version.name
+            return response
+        return {"shap_values": shap_matrix.tolist(), "model_version": version.name}
+    except feature_schema.SchemaError as e:
+        raise HTTPException(status_code=422, detail=e.errors)
+    except (TypeError, ValueError) as e:
+        # Valeurs non numériques : erreur de la requête ; les autres erreurs restent des erreurs du serveur (500)
+        raise HTTPException(status_code=400, detail=str(e))
+
+# Route de scoring au format tableau : {"rows": [[v1, v2, ...], ...]}, valeurs dans l'ordre du schéma (GET /schema),
+# null pour une valeur manquante ; "columns" est facultatif et, s'il est fourni, doit reproduire l'ordre du schéma.
+# Le corps est décodé directement dans une matrice NumPy, sans dictionnaires ni DataFrame, et les erreurs
+# (422) indiquent la ligne et la colonne fautives.
+@app.post("/predict/array")
+@metrics.instrumented
+async def predict_array(request: Request, model_version: Optional[str] = None):
+    body = await request.body()
+    return await run_in_threadpool(score_array, body, model_version)
+
+def score_array(body, model_version=None):
+    version = get_model_version(model_version)
+    try:
+        with metrics.stage('decoding'):
+            payload = json.loads(body)
+            if not isinstance(payload, dict):
+                raise feature_schema.SchemaError([{"loc": ["body"], "type": "dict_type", "msg": "Un objet {\"rows\": [...]} est attendu"}])
+            if payload.get('columns') is not None:
+                feature_schema.check_columns(version.schema, payload['columns'])
+            X = feature_schema.decode_rows(version.schema, payload.get('rows'))
+        metrics.set_batch_size(len(X))
+        observe_drift(X, version)
+
+        y_pred_proba, y_pred = score_matrix(X, version)
+        if model_version is None:
+            shadow.submit(version, X, y_pred_proba)
+        return {"prediction": y_pred.tolist(), "probability": y_pred_proba.tolist(), "model_version": version.name}
+    except feature_schema.SchemaError as e:
+        raise HTTPException(status_code=422, detail=e.errors)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+# Route de scoring par lots au format colonnaire (JSON)
+# Exemple : {"columns": ["SK_ID_CURR", "EXT_SOURCE_2", ...], "values": [[100038, 100385], [0.53, 0.12], ...]}
+@app.post("/predict/batch")
+@metrics.instrumented
+def predict_batch(input_data: ColumnarData, model_version: Optional[str] = None):
+    version = get_model_version(model_version)
+    try:
+        if len(input_data.columns) != len(input_data.values):
+            raise ValueError("Il faut exactement un tableau de valeurs par colonne.")
+
+        # Chaque colonne est convertie directement en vecteur NumPy, sans passer par un DataFrame
+        with metrics.stage('preprocessing'):
+            X = columns_to_matrix(input_data.columns, lambda i: np.asarray(input_data.values[i], dtype=np.float64), version.feature_names)
+        metrics.set_batch_size(len(X))
+        observe_drift(X, version)
+        y_pred_proba, y_pred = score_matrix(X, version)
+        if model_version is None:
+            shadow.submit(version, X, y_pred_proba)
+
+        response = {"prediction": y_pred.tolist(), "probability": y_pred_proba.tolist(), "model_version": version.name}
+        # Les identifiants clients sont renvoyés s'ils ont été fournis (un identifiant manquant reste null,
+        # comme avec /predict/batch/arrow)
+        if 'SK_ID_CURR' in input_data.columns:
+            ids = input_data.values[input_data.columns.index('SK_ID_CURR')]
+            response['SK_ID_CURR'] = [None if i is None else int(i) for i in ids]
+        return response
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+# Route de scoring par lots à partir d'octets Arrow IPC (stream ou fichier) ou Parquet
+@app.post("/predict/batch/arrow")
+@metrics.instrumented
+def predict_batch_arrow(body: bytes = Body(..., media_type="application/octet-stream"), model_version: Optional[str] = None):
+    version = get_model_version(model_version)
+    try:
+        import pyarrow as pa # import local : seule cette route en a besoin
+
+        # Le format est reconnu grâce à son en-tête
+        if body[:4] == b'PAR1':
+            import pyarrow.parquet as pq
+            table = pq.read_table(pa.BufferReader(body))
+        elif body[:6] == b'ARROW1':
+            table = pa.ipc.open_file(pa.BufferReader(body)).read_all()
+        else:
+            table = pa.ipc.open_stream(pa.BufferReader(body)).read_all()
+
+        with metrics.stage('preprocessing'):
+            X = columns_to_matrix(table.column_names, lambda i: table.column(i).to_numpy(zero_copy_only=False), version.feature_names)
+        metrics.set_batch_size(len(X))
+        observe_drift(X, version)
+        y_pred_proba, y_pred = score_matrix(X, version)
+        if model_version is None:
+            shadow.submit(version, X, y_pred_proba)
+
+        response = {"prediction": y_pred.tolist(), "probability": y_pred_proba.tolist(), "model_version": version.name}
+        if 'SK_ID_CURR' in table.column_names:
+            response['SK_ID_CURR'] = table.column('SK_ID_CURR').to_pylist()
+        return response
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+# Suppression du fichier temporaire d'une requête de scoring en masse refusée
+def remove_spool(spool):
+    spool.close()
+    os.remove(spool.name)
+
+# Route de scoring en masse d'un fichier CSV envoyé tel quel dans le corps de la requête
+# Le corps est recopié sur disque au fil de l'eau puis scoré par morceaux : la mémoire reste bornée
+# et les résultats (SK_ID_CURR, probability, prediction) sont renvoyés en flux NDJSON ou CSV.
+# Les écritures et lectures du fichier passent par le pool de threads (la boucle d'événements n'attend jamais le
+# disque), et toute la requête est scorée avec la version du modèle servie à son arrivée.
+@app.post("/predict/bulk")
+@metrics.instrumented
+async def predict_bulk(request: Request, output_format: Literal['ndjson', 'csv'] = 'ndjson', chunksize: int = Query(10000, ge=1)):
+    version = active_model
+    spool = await run_in_threadpool(tempfile.NamedTemporaryFile, suffix='.csv', delete=False)
+    try:
+        async for block in request.stream():
+            await run_in_threadpool(spool.write, block)
+        await run_in_threadpool(spool.close)
+
+        # Vérification de l'en-tête avant de commencer le flux, pour pouvoir encore répondre par une erreur 400
+        await run_in_threadpool(bulk_scoring.check_header, spool.name, version.feature_names)
+    except Exception as e:
+        await run_in_threadpool(remove_spool, spool)
+        raise HTTPException(status_code=400, detail=str(e))
+
+    # Générateur synchrone : StreamingResponse le parcourt dans le pool de threads
+    def generate():
+        try:
+            yield from bulk_scoring.score_chunks(spool.name, version, chunksize, output_format)
+        finally:
+            os.remove(spool.name)
+
+    media_type = 'text/csv' if output_format == 'csv' else 'application/x-ndjson'
+    return StreamingResponse(generate(), media_type=media_type)
+
@@ -0,0 +1,191 @@
+# Instrumentation du chemin critique de l'API et export au format texte Prometheus (route /metrics).
+# Chaque requête reçoit un objet de chronométrage (porté par une ContextVar, donc visible depuis le thread
+# qui exécute la route) ; les routes y ajoutent la durée de leurs étapes (construction du DataFrame, inférence,
+# seuil...), et le middleware y ajoute la lecture/validation de l'entrée et la sérialisation de la réponse.
+# Les durées sont agrégées dans des histogrammes à seaux fixes : le coût par requête se limite à quelques
+# appels à perf_counter et à une recherche dichotomique, ce qui permet de laisser l'instrumentation active.
+
+import bisect
+import contextvars
+import functools
+import inspect
+import threading
+import time
+from contextlib import contextmanager
+
+# Seaux des histogrammes (secondes pour les durées, nombre de lignes pour les tailles de lot)
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BATCH_SIZE_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000)
+
+_current_request = contextvars.ContextVar('current_request', default=None)
+
+
+class Histogram:
+    """Histogramme cumulatif à seaux fixes (format Prometheus)."""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # le dernier seau correspond à +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class RequestTimings:
+    __slots__ = ('start', 'handler_start', 'handler_end', 'stages', 'batch_size')
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.handler_start = None
+        self.handler_end = None
+        self.stages = {}
+        self.batch_size = None
+
+
+_lock = threading.Lock()
+_stage_histograms = {}       # (route, étape) -> Histogram
+_batch_histograms = {}       # route -> Histogram
+_requests_total = {}         # (route, code HTTP) -> nombre
+_errors_total = {}           # route -> nombre
+
+
+def start_request():
+    timings = RequestTimings()
+    _current_request.set(timings)
+    return timings
+
+
+@contextmanager
+def stage(name):
+    """Chronomètre une étape de la requête en cours (sans effet en dehors d'une requête)."""
+    timings = _current_request.get()
+    if timings is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.stages[name] = timings.stages.get(name, 0.0) + time.perf_counter() - start
+
+
+def set_batch_size(n_rows):
+    timings = _current_request.get()
+    if timings is not None:
+        timings.batch_size = n_rows
+
+
+def instrumented(handler):
+    """Décorateur de route : marque l'entrée et la sortie du handler pour en déduire la durée
+    de lecture/validation de l'entrée et celle de la sérialisation de la réponse."""
+    if inspect.iscoroutinefunction(handler):
+        @functools.wraps(handler)
+        async def async_wrapper(*args, **kwargs):
+            timings = _current_request.get()
+            if timings is not None:
+                timings.handler_start = time.perf_counter()
+            try:
+                return await handler(*args, **kwargs)
+            finally:
+                if timings is not None:
+                    timings.handler_end = time.perf_counter()
+        return async_wrapper
+
+    @functools.wraps(handler)
+    def wrapper(*args, **kwargs):
+        timings = _current_request.get()
+        if timings is not None:
+            timings.handler_start = time.perf_counter()
+        try:
+            return handler(*args, **kwargs)
+        finally:
+            if timings is not None:
+                timings.handler_end = time.perf_counter()
+    return wrapper
+
+
+def _observe_batch_size(route, n_rows):
+    histogram = _batch_histograms.get(route)
+    if histogram is None:
+        histogram = _batch_histograms[route] = Histogram(BATCH_SIZE_BUCKETS)
+    histogram.observe(n_rows)
+
+
+def observe_batch_size(route, n_rows):
+    """Taille d'un lot traité hors requête (ex. les lots formés par le micro-batching)."""
+    with _lock:
+        _observe_batch_size(route, n_rows)
+
+
+def finish_request(timings, route, status_code):
+    end = time.perf_counter()
+    stages = dict(timings.stages)
+    if timings.handler_start is not None:
+        stages['parse'] = timings.handler_start - timings.start
+        stages['serialization'] = end - timings.handler_end
+    stages['total'] = end - timings.start
+
+    with _lock:
+        for name, duration in stages.items():
+            histogram = _stage_histograms.get((route, name))
+            if histogram is None:
+                histogram = _stage_histograms[(route, name)] = Histogram(LATENCY_BUCKETS)
+            histogram.observe(duration)
+        if timings.batch_size is not None:
+            _observe_batch_size(route, timings.batch_size)
+        _requests_total[(route, status_code)] = _requests_total.get((route, status_code), 0) + 1
+        if status_code >= 400:
+            _errors_total[route] = _errors_total.get(route, 0) + 1
+
+
+def _format_labels(labels):
+    return ','.join(f'{key}="{value}"' for key, value in labels.items())
+
+
+def _render_histogram(lines, name, labels, histogram):
+    cumulative = 0
+    for bound, count in zip(list(histogram.buckets) + ['+Inf'], histogram.counts):
+        cumulative += count
+        lines.append(f'{name}_bucket{{{_format_labels({**labels, "le": bound})}}} {cumulative}')
+    lines.append(f'{name}_sum{{{_format_labels(labels)}}} {histogram.sum}')
+    lines.append(f'{name}_count{{{_format_labels(labels)}}} {histogram.count}')
+
+
+def render(cache_stats=None):
+    """Texte au format d'exposition Prometheus ; cache_stats = {nom du cache: ResultCache.stats()}."""
+    lines = []
+    with _lock:
+        lines.append('# HELP api_stage_seconds Durée de chaque étape du traitement des requêtes.')
+        lines.append('# TYPE api_stage_seconds histogram')
+        for (route, name), histogram in sorted(_stage_histograms.items()):
+            _render_histogram(lines, 'api_stage_seconds', {'route': route, 'stage': name}, histogram)
+
+        lines.append('# HELP api_batch_size Nombre de lignes par requête.')
+        lines.append('# TYPE api_batch_size histogram')
+        for route, histogram in sorted(_batch_histograms.items()):
+            _render_histogram(lines, 'api_batch_size', {'route': route}, histogram)
+
+        lines.append('# HELP api_requests_total Nombre de requêtes par route et code HTTP.')
+        lines.append('# TYPE api_requests_total counter')
+        for (route, status_code), count in sorted(_requests_total.items()):
+            lines.append(f'api_requests_total{{{_format_labels({"route": route, "code": status_code})}}} {count}')
+
+        lines.append('# HELP api_errors_total Nombre de requêtes en erreur (code HTTP >= 400) par route.')
+        lines.append('# TYPE api_errors_total counter')
+        for route, count in sorted(_errors_total.items()):
+            lines.append(f'api_errors_total{{{_format_labels({"route": route})}}} {count}')
+
+    if cache_stats:
+        for metric, key, kind in (('api_cache_hits_total', 'hits', 'counter'),
+                                  ('api_cache_misses_total', 'misses', 'counter'),
+                                  ('api_cache_evictions_total', 'evictions', 'counter'),
+                                  ('api_cache_entries', 'entries', 'gauge')):
+            lines.append(f'# TYPE {metric} {kind}')
+            for cache_name, stats in sorted(cache_stats.items()):
+                lines.append(f'{metric}{{{_format_labels({"cache": cache_name})}}} {stats[key]}')
+
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,91 @@
+# Regroupement (micro-batching) des requêtes de prédiction d'une seule ligne.
+# Les lignes envoyées par des requêtes concurrentes sont mises en file d'attente ; une tâche asyncio les
+# rassemble pendant une courte fenêtre (quelques millisecondes) ou jusqu'à un nombre maximal de lignes,
+# les score en un seul appel vectorisé (dans un thread, pour ne pas bloquer la boucle d'événements),
+# puis rend à chaque appelant son propre résultat.
+#
+# Réglages : PREDICT_BATCH_WAIT_MS (durée de la fenêtre, 0 = pas de regroupement) et PREDICT_BATCH_MAX_ROWS.
+
+import asyncio
+import contextvars
+import numpy as np
+import metrics
+
+
+class MicroBatcher:
+    """File d'attente asyncio qui score ensemble les lignes arrivées dans la même fenêtre."""
+
+    def __init__(self, score, max_wait=0.003, max_rows=64):
+        # score : fonction synchrone qui prend une matrice (lignes x features) et renvoie un vecteur de probabilités
+        self.score = score
+        self.max_wait = max_wait
+        self.max_rows = max_rows
+        self._loop = None
+        self._queue = None
+        self._task = None
+
+    def _ensure_started(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            # Contexte vide : la tâche ne doit pas hériter du chronométrage de la requête qui l'a démarrée
+            self._task = loop.create_task(self._run(), context=contextvars.Context())
+
+    async def submit(self, row, score=None):
+        """
+        Ajoute une ligne (vecteur dans l'ordre des features du modèle) et attend sa probabilité.
+        score : fonction de scoring de cette ligne si ce n'est pas celle du batcher (ex. une version précise du
+        modèle) ; les lignes d'une même fenêtre sont regroupées par fonction de scoring.
+        """
+        self._ensure_started()
+        future = self._loop.create_future()
+        self._queue.put_nowait((row, future, score or self.score))
+        return await future
+
+    async def _collect(self):
+        # La fenêtre s'ouvre à l'arrivée de la première ligne
+        batch = [await self._queue.get()]
+        deadline = self._loop.time() + self.max_wait
+        while len(batch) < self.max_rows:
+            if not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+                continue
+            timeout = deadline - self._loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        while True:
+            batch = await self._collect()
+            # Les appelants qui ont abandonné (déconnexion, timeout) ne sont pas scorés
+            groups = {}
+            for row, future, score in batch:
+                if not future.done():
+                    groups.setdefault(score, []).append((row, future))
+            for score, group in groups.items():
+                await self._score_group(score, group)
+
+    async def _score_group(self, score, group):
+        metrics.observe_batch_size('micro-batch', len(group))
+        try:
+            probabilities = await asyncio.to_thread(score, np.vstack([row for row, _ in group]))
+        except Exception as e:
+            for _, future in group:
+                if not future.done():
+                    future.set_exception(e)
+        else:
+            for (_, future), probability in zip(group, probabilities):
+                if not future.done():
+                    future.set_result(float(probability))
+
+    def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        self._loop = None
@@ -0,0 +1,413 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Registre local des modèles : un répertoire par version, avec tout ce qu'il faut pour la servir.
+#
+#     models/
+#         active                      version servie par l'API (fichier texte)
+#         challenger                  version évaluée en mode shadow (facultatif)
+#         20240601T120000Z/
+#             credit_scoring_new.joblib   pipeline entraîné
+#             optimal_threshold.txt       seuil de décision de cette version
+#             feature_schema.json         contrat des features relevé sur le jeu de référence (cf. feature_schema.py)
+#             fast_model/                 modèle allégé (cf. fast_scorer.py), s'il a pu être exporté
+#             meta.json                   date d'enregistrement, empreinte du pipeline, seuil
+#
+# Une version chargée est un objet ModelVersion qui ne change plus : l'API en prend une au début de chaque
+# requête et la garde jusqu'au bout, si bien qu'activer une autre version (chargée et préchauffée à côté) ne
+# perturbe pas les requêtes en cours. Le challenger est comparé au modèle actif par ShadowScorer, dans un thread,
+# sans allonger la réponse.
+#
+# Utilisation :
+#     python model_registry.py register credit_scoring_new.joblib --threshold optimal_threshold.txt --data reconstituted_test_sampled.csv --activate
+#     python model_registry.py list
+#     python model_registry.py activate 20240601T120000Z
+#     python model_registry.py challenger 20240701T090000Z     (--clear pour arrêter le mode shadow)
+
+import argparse
+import copy
+import json
+import os
+import queue
+import shutil
+import threading
+import time
+import joblib
+import numpy as np
+import pandas as pd
+import fast_scorer
+import feature_schema
+from result_cache import file_fingerprint
+
+REGISTRY_DIR = 'models'
+ACTIVE = 'active'
+CHALLENGER = 'challenger'
+
+MODEL_FILE = 'credit_scoring_new.joblib'
+THRESHOLD_FILE = 'optimal_threshold.txt'
+SCHEMA_FILE = 'feature_schema.json'
+SLIM_DIR = 'fast_model'
+
+
+def read_threshold(path):
+    """Seuil de décision écrit dans un fichier texte (notebook, threshold_engine.py)."""
+    with open(path, 'r') as f:
+        threshold = float(f.read())
+    if not np.isfinite(threshold):
+        raise ValueError(f"Seuil invalide : {threshold}")
+    return threshold
+
+
+class ModelVersion:
+    """
+    Un modèle chargé avec son seuil et son contrat de features.
+
+    name : nom de la version (empreinte du pipeline hors registre)
+    fast_model : scorer rapide (cf. fast_scorer.py), None si le pipeline ne peut pas être gelé
+    model : pipeline complet, None quand le modèle allégé a été chargé à sa place
+    fingerprint : empreinte pipeline + seuil (clé des caches) ; pipeline_fingerprint : empreinte du pipeline seul
+    explainer : explainer SHAP du Booster, construit au premier besoin (cf. get_explainer)
+    """
+
+    def __init__(self, name, model_path, threshold, fingerprint, pipeline_fingerprint, model=None, fast_model=None,
+                 slim_dir=None, schema=None):
+        self.name = name or pipeline_fingerprint
+        self.model_path = model_path
+        self.threshold = threshold
+        self.fingerprint = fingerprint
+        self.pipeline_fingerprint = pipeline_fingerprint
+        self.model = model
+        self.fast_model = fast_model
+        # Booster LightGBM : seuils des arbres (cf. dtype_optimizer.py) et explainer SHAP
+        self.booster = fast_model.booster if fast_model is not None else model.named_steps['model'].booster_
+        # Ordre des colonnes attendu par le modèle
+        self.feature_names = fast_model.feature_names if fast_model is not None else model.named_steps['model'].feature_name_
+        self.schema = schema or feature_schema.booster_schema(self.booster, self.feature_names)
+        # Fichier relu par les processus du pool SHAP (cf. parallel_shap.py)
+        self.source = model_path if model is not None else slim_dir
+        self.artifact = 'slim' if model is None else 'pipeline'
+        self.explainer = None
+        self._lock = threading.Lock()
+
+    def with_threshold(self, threshold, fingerprint):
+        """Même modèle avec un autre seuil (le modèle chargé et l'explainer, s'il est construit, sont partagés)."""
+        version = copy.copy(self)
+        version.threshold = threshold
+        version.fingerprint = fingerprint
+        return version
+
+    def get_explainer(self):
+        """Explainer SHAP de ce modèle, construit une seule fois ; shap n'est importé qu'à ce moment."""
+        if self.explainer is None:
+            with self._lock:
+                if self.explainer is None:
+                    import shap
+                    # Mêmes valeurs SHAP qu'avec le LGBMClassifier du pipeline (cf. unit_testing.py)
+                    self.explainer = shap.Explainer(self.booster)
+        return self.explainer
+
+    def expected_value(self):
+        """Valeur de base de l'explainer (prédiction moyenne en log-odds) pour la classe positive."""
+        return float(np.atleast_1d(self.get_explainer().expected_value)[-1])
+
+    def predict_proba(self, X):
+        """
+        Probabilités de la classe positive pour une matrice déjà ordonnée (lignes x features).
+        Sans scorer rapide, la matrice est enveloppée dans un DataFrame sans copie : le chemin NumPy de LightGBM 4.3
+        appelle check_array(force_all_finite=...), que les versions récentes de scikit-learn n'acceptent plus.
+        """
+        if self.fast_model is not None:
+            return self.fast_model.predict_proba(X)
+        return self.model.predict_proba(pd.DataFrame(X, columns=self.feature_names, copy=False))[:, 1]
+
+    def warm_up(self):
+        """Passage d'une ligne factice, pour que la première vraie requête ne paie pas l'initialisation."""
+        self.predict_proba(np.zeros((1, len(self.feature_names))))
+        return self
+
+
+def load_files(model_path, threshold_path, slim_dir=None, use_fast_scorer=True, name=None, schema_path=None,
+               reference_path=None):
+    """
+    Charge un modèle et son seuil. Le modèle allégé de slim_dir est préféré au pipeline (bien plus long à
+    désérialiser) s'il a été exporté depuis ce pipeline ; sinon le pipeline est chargé puis gelé si possible.
+
+    Le contrat de features est relu dans schema_path s'il a été relevé sur un jeu de référence pour ce pipeline
+    (empreinte enregistrée) ; sinon il est construit à partir du jeu de référence reference_path (types et noms
+    d'origine) et enregistré dans schema_path, ou à défaut à partir du Booster seul.
+    """
+    threshold = read_threshold(threshold_path)
+    pipeline_fingerprint = file_fingerprint(model_path)
+    model, fast_model = None, None
+    if use_fast_scorer and slim_dir is not None and fast_scorer.read_source_fingerprint(slim_dir) == pipeline_fingerprint:
+        fast_model = fast_scorer.FastScorer.load(slim_dir)
+    if fast_model is None:
+        model = joblib.load(model_path)
+        # Pipeline gelé pour l'inférence ; si une étape n'est pas prise en charge, on garde le pipeline complet
+        if use_fast_scorer:
+            try:
+                fast_model = fast_scorer.FastScorer.from_pipeline(model)
+            except NotImplementedError:
+                fast_model = None
+    schema = feature_schema.load_schema(schema_path) if schema_path is not None and os.path.exists(schema_path) else None
+    if schema is not None and schema.get('pipeline_fingerprint') != pipeline_fingerprint:
+        schema = None
+    version = ModelVersion(name, model_path, threshold, file_fingerprint(model_path, threshold_path), pipeline_fingerprint,
+                           model, fast_model, slim_dir, schema)
+    if schema is None and reference_path is not None and os.path.exists(reference_path):
+        try:
+            version.schema = reference_schema(version.booster, version.feature_names, reference_path, pipeline_fingerprint)
+        except ValueError:
+            # Jeu de référence d'un autre modèle : le schéma reste celui du Booster seul
+            return version
+        if schema_path is not None:
+            feature_schema.save_schema(version.schema, schema_path)
+    return version
+
+
+def reference_schema(booster, feature_names, reference_path, pipeline_fingerprint):
+    """Contrat de features relevé sur un jeu de référence, marqué de l'empreinte du pipeline."""
+    schema = feature_schema.booster_schema(booster, feature_names, feature_schema.read_reference(reference_path))
+    schema['pipeline_fingerprint'] = pipeline_fingerprint
+    return schema
+
+
+def version_dir(version, registry=REGISTRY_DIR):
+    # Le nom vient parfois d'une requête : un nom de répertoire simple, jamais un chemin
+    if not version or os.path.basename(version) != version or version.startswith('.'):
+        raise ValueError(f"Nom de version invalide : {version!r}")
+    return os.path.join(registry, version)
+
+
+def load_version(version, registry=REGISTRY_DIR, use_fast_scorer=True, reference_path=None):
+    """
+    Charge une version enregistrée (FileNotFoundError si elle n'existe pas) ; reference_path sert à construire son
+    contrat de features si elle a été enregistrée sans (cf. load_files).
+    """
+    directory = version_dir(version, registry)
+    if not os.path.exists(os.path.join(directory, 'meta.json')):
+        raise FileNotFoundError(f"Version {version} absente du registre {registry}")
+    return load_files(os.path.join(directory, MODEL_FILE), os.path.join(directory, THRESHOLD_FILE),
+                      os.path.join(directory, SLIM_DIR), use_fast_scorer, version, os.path.join(directory, SCHEMA_FILE),
+                      reference_path)
+
+
+def list_versions(registry=REGISTRY_DIR):
+    """Versions enregistrées, de la plus ancienne à la plus récente, avec leurs métadonnées."""
+    if not os.path.isdir(registry):
+        return []
+    versions = []
+    for version in sorted(os.listdir(registry)):
+        # Seuls les répertoires de version complets comptent (ni pointeurs, ni fichiers cachés comme .DS_Store
+        # ou .gitkeep, ni version en cours d'écriture)
+        if version.startswith('.') or version.endswith('.tmp') or not os.path.isdir(os.path.join(registry, version)):
+            continue
+        path = os.path.join(registry, version, 'meta.json')
+        if os.path.exists(path):
+            with open(path, 'r') as f:
+                versions.append(json.load(f))
+    return versions
+
+
+def read_pointer(name, registry=REGISTRY_DIR):
+    """Version désignée par un pointeur (active, challenger), None s'il n'existe pas."""
+    path = os.path.join(registry, name)
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r') as f:
+        return f.read().strip() or None
+
+
+def set_pointer(name, version, registry=REGISTRY_DIR):
+    """Écrit un pointeur (remplacement atomique : l'API ne lit jamais un fichier partiel) ; None le supprime."""
+    path = os.path.join(registry, name)
+    if version is None:
+        if os.path.exists(path):
+            os.remove(path)
+        return
+    if not os.path.exists(os.path.join(version_dir(version, registry), 'meta.json')):
+        raise FileNotFoundError(f"Version {version} absente du registre {registry}")
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w') as f:
+        f.write(version)
+    os.replace(tmp_path, path)
+
+
+def register(model_path, threshold_path, registry=REGISTRY_DIR, version=None, reference_path=None):
+    """
+    Copie un modèle et son seuil dans une nouvelle version du registre, avec son contrat de features (types et
+    noms d'origine relevés sur le jeu de référence reference_path s'il est fourni) et, si le pipeline peut être
+    gelé, son modèle allégé. Renvoie le nom de la version (date UTC par défaut).
+    """
+    version = version or time.strftime('%Y%m%dT%H%M%SZ', time.gmtime())
+    directory = version_dir(version, registry)
+    if os.path.exists(directory):
+        raise FileExistsError(f"La version {version} existe déjà dans {registry}")
+
+    # Écriture dans un répertoire temporaire puis renommage : une version n'apparaît que complète
+    tmp_directory = f'{directory}.tmp'
+    shutil.rmtree(tmp_directory, ignore_errors=True)
+    os.makedirs(tmp_directory)
+    shutil.copyfile(model_path, os.path.join(tmp_directory, MODEL_FILE))
+    shutil.copyfile(threshold_path, os.path.join(tmp_directory, THRESHOLD_FILE))
+    pipeline = joblib.load(model_path)
+    pipeline_fingerprint = file_fingerprint(model_path)
+    try:
+        fast_scorer.FastScorer.from_pipeline(pipeline).export(os.path.join(tmp_directory, SLIM_DIR), pipeline_fingerprint)
+    except NotImplementedError:
+        pass
+    # Sans jeu de référence, le contrat n'est pas marqué : il sera relevé sur celui de l'API au premier chargement
+    if reference_path is not None:
+        schema = feature_schema.build_schema(pipeline, feature_schema.read_reference(reference_path))
+        schema['pipeline_fingerprint'] = pipeline_fingerprint
+    else:
+        schema = feature_schema.build_schema(pipeline)
+    feature_schema.save_schema(schema, os.path.join(tmp_directory, SCHEMA_FILE))
+    with open(os.path.join(tmp_directory, 'meta.json'), 'w') as f:
+        json.dump({'version': version,
+                   'created': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+                   'pipeline_fingerprint': pipeline_fingerprint,
+                   'threshold': read_threshold(threshold_path)}, f)
+    os.replace(tmp_directory, directory)
+    return version
+
+
+class ShadowScorer:
+    """
+    Comparaison du modèle actif (champion) et d'un challenger sur le trafic réel, hors du chemin de latence.
+
+    submit() ne fait que mettre en file la matrice reçue et les probabilités déjà renvoyées par le champion ;
+    un thread score la file avec le challenger et cumule les écarts. La file est bornée (max_pending lots) :
+    quand le thread ne suit pas, les lots en trop sont ignorés et comptés dans 'dropped'.
+    """
+
+    def __init__(self, max_pending=256):
+        self._queue = queue.Queue(max_pending)
+        self._lock = threading.Lock()
+        self._thread = None
+        self.challenger = None
+        self.reset()
+
+    def reset(self, challenger=None):
+        with self._lock:
+            self.challenger = challenger
+            self.champion = None
+            self.n_rows = 0
+            self.dropped = 0
+            self.errors = 0
+            self.sum_abs_difference = 0.0
+            self.max_abs_difference = 0.0
+            self.sum_champion = 0.0
+            self.sum_challenger = 0.0
+            self.agreements = 0
+            # Décisions qui changent : accordé par le champion et refusé par le challenger, et inversement
+            self.flips_to_default = 0
+            self.flips_to_accept = 0
+
+    def submit(self, champion, X, probabilities):
+        challenger = self.challenger
+        if challenger is None or challenger.fingerprint == champion.fingerprint:
+            return
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, daemon=True)
+                    self._thread.start()
+        try:
+            self._queue.put_nowait((champion, challenger, X, np.asarray(probabilities, dtype=np.float64)))
+        except queue.Full:
+            with self._lock:
+                self.dropped += len(X)
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            try:
+                self._compare(*item)
+            finally:
+                self._queue.task_done()
+
+    def _compare(self, champion, challenger, X, champion_proba):
+        try:
+            challenger_proba = challenger.predict_proba(X)
+        except Exception:
+            with self._lock:
+                self.errors += len(X)
+            return
+        champion_pred = champion_proba >= champion.threshold
+        challenger_pred = challenger_proba >= challenger.threshold
+        difference = np.abs(challenger_proba - champion_proba)
+        with self._lock:
+            # Lot mis en file avant un changement de challenger : il n'est pas compté
+            if challenger is not self.challenger:
+                return
+            self.champion = champion.name
+            self.n_rows += len(X)
+            self.sum_abs_difference += float(difference.sum())
+            self.max_abs_difference = max(self.max_abs_difference, float(difference.max(initial=0.0)))
+            self.sum_champion += float(champion_proba.sum())
+            self.sum_challenger += float(challenger_proba.sum())
+            self.agreements += int(np.sum(champion_pred == challenger_pred))
+            self.flips_to_default += int(np.sum(~champion_pred & challenger_pred))
+            self.flips_to_accept += int(np.sum(champion_pred & ~challenger_pred))
+
+    def wait(self, timeout=10.0):
+        """Attend que la file soit vide (tests, fin de comparaison)."""
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.005)
+
+    def stats(self):
+        with self._lock:
+            n = max(self.n_rows, 1)
+            return {"challenger": None if self.challenger is None else self.challenger.name,
+                    "champion": self.champion,
+                    "n_rows": self.n_rows,
+                    "dropped": self.dropped,
+                    "errors": self.errors,
+                    "mean_abs_difference": self.sum_abs_difference / n,
+                    "max_abs_difference": self.max_abs_difference,
+                    "mean_probability_champion": self.sum_champion / n,
+                    "mean_probability_challenger": self.sum_challenger / n,
+                    "agreement_rate": self.agreements / n,
+                    "flips_to_default": self.flips_to_default,
+                    "flips_to_accept": self.flips_to_accept}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Registre local des modèles servis par l'API.")
+    parser.add_argument('--registry', default=REGISTRY_DIR, help="répertoire du registre")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    register_parser = subparsers.add_parser('register', help="enregistre un modèle et son seuil sous une nouvelle version")
+    register_parser.add_argument('model', help="pipeline sérialisé")
+    register_parser.add_argument('--threshold', default=THRESHOLD_FILE, help="fichier du seuil de décision")
+    register_parser.add_argument('--version', help="nom de la version (date UTC par défaut)")
+    register_parser.add_argument('--data', help="CSV de features de référence (avec SK_ID_CURR) pour relever les types du contrat")
+    register_parser.add_argument('--activate', action='store_true', help="sert cette version tout de suite")
+    subparsers.add_parser('list', help="liste les versions enregistrées")
+    activate_parser = subparsers.add_parser('activate', help="sert une version (l'API la charge sans redémarrer)")
+    activate_parser.add_argument('version')
+    challenger_parser = subparsers.add_parser('challenger', help="compare une version au modèle actif (mode shadow)")
+    challenger_parser.add_argument('version', nargs='?')
+    challenger_parser.add_argument('--clear', action='store_true', help="arrête le mode shadow")
+    args = parser.parse_args()
+
+    if args.command == 'register':
+        version = register(args.model, args.threshold, args.registry, args.version, args.data)
+        print(f"Version {version} enregistrée dans {args.registry}")
+        if args.activate:
+            set_pointer(ACTIVE, version, args.registry)
+            print(f"Version {version} activée")
+    elif args.command == 'list':
+        active, challenger = read_pointer(ACTIVE, args.registry), read_pointer(CHALLENGER, args.registry)
+        for meta in list_versions(args.registry):
+            role = ' (active)' if meta['version'] == active else ' (challenger)' if meta['version'] == challenger else ''
+            print(f"{meta['version']}{role} : seuil {meta['threshold']}, pipeline {meta['pipeline_fingerprint']}, enregistrée le {meta['created']}")
+    elif args.command == 'activate':
+        set_pointer(ACTIVE, args.version, args.registry)
+        print(f"Version {args.version} activée")
+    else:
+        if not args.clear and not args.version:
+            parser.error("une version ou --clear est nécessaire")
+        set_pointer(CHALLENGER, None if args.clear else args.version, args.registry)
+        print("Mode shadow arrêté" if args.clear else f"Version {args.version} comparée au modèle actif")
@@ -0,0 +1,307 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Calcul en ligne des features d'un seul client à partir de ses données brutes : la ligne de sa demande de prêt
+# (format application_test.csv) et ses lignes dans les tables enfants (bureau, bureau_balance, previous et, si
+# elles sont disponibles, cash, credit, installments). Un nouveau demandeur peut ainsi être scoré sans relancer
+# le feature engineering par lots.
+#
+# Les définitions sont celles du calcul par lots (feature_engineering.py), appliquées aux seules lignes du client :
+#   1. étapes du notebook 00 (application_domain) ;
+#   2. agrégats du notebook 01 (table_blocks, client_blocks, ratios, fusions dans l'ordre de CLIENT_BLOCKS).
+#      Deux décisions portent sur les tables entières et ne peuvent pas être prises sur un seul client : les
+#      catégories de chaque colonne de texte et les colonnes gardées par la suppression des colonnes redondantes.
+#      Elles sont relues dans feature_plan.json, écrit par build_features ;
+#   3. préparation des notebooks 02 et 05 (ModelPreparation) : indicatrices de get_dummies, noms de colonnes
+#      nettoyés, imputation par la médiane et MinMaxScaler ajustés sur le jeu d'entraînement, enregistrés dans
+#      model_preparation.joblib.
+#
+# Ajustement de la préparation (jeu d'entraînement réduit du notebook 02 et modèle entraîné) :
+#     python online_features.py --train train_reduced.csv --model credit_scoring_new.joblib
+
+import argparse
+import json
+import joblib
+import numpy as np
+import pandas as pd
+from sklearn.impute import SimpleImputer
+from sklearn.model_selection import train_test_split
+from sklearn.preprocessing import MinMaxScaler
+import feature_engineering
+from feature_engineering import CLIENT_BLOCKS, LOAN_TABLES, TABLE_FILES
+
+PREPARATION_PATH = 'model_preparation.joblib'
+
+# Caractères retirés des noms de colonnes dans le notebook 02 (LightGBM les refuse)
+REMOVED_CHARACTERS = '{}:[],"\''
+
+
+def clean_column_name(name):
+    for character in REMOVED_CHARACTERS:
+        name = name.replace(character, '')
+    return name
+
+
+def load_plan(path):
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+# Statistiques de agg_numeric et de agg_categorical, dans l'ordre de leurs colonnes
+NUMERIC_STATS = ['count', 'mean', 'max', 'min', 'sum']
+CATEGORICAL_STATS = ['sum', 'count', 'mean']
+
+
+def group_statistics(values, codes):
+    """
+    count, mean, max, min et sum de chaque colonne de values (lignes x variables) pour chaque groupe, comme
+    groupby(...).agg : valeurs manquantes ignorées, somme nulle et moyenne manquante pour un groupe sans valeur.
+    Les groupes sont les valeurs de codes (entiers), dans l'ordre croissant.
+    """
+    order = np.argsort(codes, kind='stable')
+    codes = codes[order]
+    starts = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]])
+    values = values[order]
+    valid = ~np.isnan(values)
+    count = np.add.reduceat(valid.astype(np.int64), starts, axis=0)
+    total = np.add.reduceat(np.where(valid, values, 0), starts, axis=0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = total / count
+    return {'count': count, 'mean': mean, 'max': np.fmax.reduceat(values, starts, axis=0),
+            'min': np.fmin.reduceat(values, starts, axis=0), 'sum': total}
+
+
+class RawTable:
+    """Lignes brutes d'une table enfant (liste de {colonne: valeur} ou DataFrame), lues colonne par colonne."""
+
+    def __init__(self, records, types):
+        self.records = records if records is not None else []
+        self.types = types
+        self.n_rows = len(self.records)
+        self.cache = {}
+
+    def raw(self, column):
+        if isinstance(self.records, pd.DataFrame):
+            return self.records[column].to_numpy() if column in self.records else np.full(self.n_rows, None)
+        return np.array([record.get(column) for record in self.records], dtype=object)
+
+    def numeric(self, column):
+        """Colonne numérique en flottants ; arrondie en float32 si convert_types l'y convertit dans le calcul par lots."""
+        if column not in self.cache:
+            values = np.asarray(self.raw(column), dtype=np.float64)
+            if self.types.get(column) == 'float32':
+                values = values.astype(np.float32).astype(np.float64)
+            self.cache[column] = values
+        return self.cache[column]
+
+    def indicator(self, column, category):
+        """Indicatrice de get_dummies (1 si la ligne a la catégorie, 0 sinon, y compris pour une valeur manquante)."""
+        return (self.raw(column) == category).astype(np.float64)
+
+
+class OnlineFeatureBuilder:
+    """
+    Features du notebook 01 (table principale + agrégats) pour un client, à partir de ses données brutes.
+    Seules les colonnes gardées par le calcul par lots sont calculées, directement avec NumPy : un client a
+    au plus quelques centaines de lignes, et un groupby pandas coûterait bien plus que le calcul lui-même.
+    """
+
+    def __init__(self, plan):
+        self.blocks = plan['blocks']
+        tables = plan['tables']
+        self.types = {name: tables[name]['types'] for name in TABLE_FILES}
+
+        # Colonnes de la table principale (sans TARGET) : les valeurs numériques sont lues en flottants
+        main = 'test' if 'test' in tables else 'train'
+        self.main_columns = [c for c in tables[main]['dtypes'] if c != 'TARGET']
+        self.main_dtypes = {c: np.float64 for c in self.main_columns if tables[main]['dtypes'][c] in ('int64', 'float64')}
+
+        # Indicatrices de get_dummies de chaque table : nom -> (colonne, catégorie)
+        self.indicators = {name: {f'{c}_{category}': (c, category) for c, kind in types.items() if isinstance(kind, list)
+                                  for category in kind}
+                           for name, types in self.types.items()}
+
+        # Variable et statistique de chaque colonne gardée, d'après les noms '{préfixe}_{variable}_{statistique}'
+        self.statistics = {block: self._parse(block, entry) for block, entry in self.blocks.items()}
+        self.columns = [name for block in CLIENT_BLOCKS for name in self.blocks[block]['names'] if name != 'SK_ID_CURR']
+
+    @classmethod
+    def from_file(cls, path=feature_engineering.PLAN_FILE):
+        return cls(load_plan(path))
+
+    @staticmethod
+    def _parse(block, entry):
+        columns = entry['columns']
+        if len(columns) == 2 and columns[1] == 'count':
+            # agg_categorical sans variable catégorielle : simple décompte des lignes
+            return [('count', None, 'count')] if 'count' in entry['names'] else []
+        prefix = 'client' if block.endswith('_by_client') else block.rsplit('_', 1)[0]
+        if block.endswith('_counts'):
+            stats = CATEGORICAL_STATS
+        else:
+            # Les agrégats numériques commencent par la variable de groupement
+            stats, columns = NUMERIC_STATS, columns[1:]
+        kept = set(entry['names'])
+        return [(name, name[len(prefix) + 1:-len(stats[i % len(stats)]) - 1], stats[i % len(stats)])
+                for i, name in enumerate(columns) if name in kept]
+
+    def _aggregate(self, block, values, codes):
+        """
+        Colonnes gardées d'un agrégat, pour chaque groupe de codes : {nom: tableau}.
+        values(variable) renvoie la colonne de la variable pour chaque ligne.
+        """
+        statistics = self.statistics[block]
+        if not len(codes):
+            return {name: np.empty(0) for name, _, _ in statistics}
+        variables = list(dict.fromkeys(variable for _, variable, _ in statistics if variable is not None))
+        positions = {variable: j for j, variable in enumerate(variables)}
+        results = group_statistics(np.column_stack([values(variable) for variable in variables]), codes) if variables else {}
+        sizes = np.bincount(codes)
+        return {name: sizes if variable is None else results[stat][:, positions[variable]] for name, variable, stat in statistics}
+
+    def _table_values(self, name, table):
+        indicators = self.indicators[name]
+
+        def values(variable):
+            if variable in indicators:
+                return table.indicator(*indicators[variable])
+            return table.numeric(variable)
+        return values
+
+    def _first_level(self, name, table, blocks, codes):
+        values = self._table_values(name, table)
+        return {column: value for block in blocks for column, value in self._aggregate(block, values, codes).items()}
+
+    def _by_client(self, block, loans, rows):
+        """Agrégat par client des statistiques par prêt (loans : {nom: valeur par prêt}), chaque ligne portant son prêt."""
+        def values(variable):
+            by_loan = loans[variable]
+            return np.where(rows >= 0, by_loan[np.maximum(rows, 0)] if len(by_loan) else np.nan, np.nan)
+        return self._aggregate(block, values, np.zeros(len(rows), dtype=np.int64))
+
+    def aggregates(self, records):
+        """Valeurs des agrégats du client ({nom de colonne: valeur}, NaN si le client n'a pas de ligne dans la table)."""
+        tables = {name: RawTable(records.get(name), self.types[name]) for name in TABLE_FILES}
+        result = {}
+
+        # Tables à un niveau : une seule ligne d'agrégat, celle du client
+        for name in ('bureau', 'previous'):
+            codes = np.zeros(tables[name].n_rows, dtype=np.int64)
+            result.update(self._first_level(name, tables[name], [f'{name}_counts', f'{name}_agg'], codes))
+
+        # Tables à deux niveaux : statistiques par prêt, puis par client sur les lignes de la table
+        for name, loan_id, rows_table in [('bureau_balance', 'SK_ID_BUREAU', 'bureau')] + [(name, 'SK_ID_PREV', name) for name in LOAN_TABLES]:
+            table = tables[name]
+            loan_ids, codes = np.unique(table.numeric(loan_id), return_inverse=True)
+            blocks = [block for block in (f'{name}_counts', f'{name}_agg') if block in self.blocks]
+            loans = self._first_level(name, table, blocks, codes.reshape(-1))
+            # Prêt de chaque ligne de la table du client (-1 si le prêt n'a pas de statistiques)
+            row_loans = tables[rows_table].numeric(loan_id)
+            positions = np.minimum(np.searchsorted(loan_ids, row_loans), max(len(loan_ids) - 1, 0))
+            rows = np.where((loan_ids[positions] == row_loans) if len(loan_ids) else False, positions, -1)
+            result.update(self._by_client(f'{name}_by_client', loans, rows))
+
+        return {name: float(value[0]) if len(value) else np.nan for name, value in result.items()}
+
+    def application(self, application):
+        """Ligne de la demande de prêt brute -> ligne de la table principale (app_*_domain.csv)."""
+        df = feature_engineering.application_domain(pd.DataFrame([application]))
+        return df.reindex(columns=self.main_columns).astype(self.main_dtypes)
+
+    def client_features(self, application, records):
+        """
+        Features d'un client, dans l'ordre des colonnes de train_after_fe.csv / test_after_fe.csv (sans TARGET).
+
+        Paramètres
+        --------
+            application (dict) :
+                la ligne brute de la demande de prêt ({colonne: valeur}, format application_test.csv)
+            records (dict) :
+                les lignes du client dans chaque table enfant ({nom de table: liste de {colonne: valeur} ou DataFrame}),
+                bureau_balance contenant les lignes des prêts du client dans bureau ; une table absente est vide
+
+        Retour
+        --------
+            un DataFrame d'une ligne
+        """
+        main = feature_engineering.add_ratio_features(self.application(application))
+        values = self.aggregates(records)
+        aggregates = pd.DataFrame(np.array([[values[name] for name in self.columns]]), columns=self.columns)
+        return pd.concat([main, aggregates], axis=1)
+
+
+class ModelPreparation:
+    """
+    Préparation des features pour le modèle (notebooks 02 et 05) : indicatrices des variables catégorielles,
+    noms nettoyés, colonnes du modèle, imputation par la médiane puis mise à l'échelle [0, 1].
+    """
+
+    def __init__(self, feature_names, imputer, scaler):
+        self.feature_names = list(feature_names)
+        self.imputer = imputer
+        self.scaler = scaler
+
+    @classmethod
+    def fit(cls, X_train):
+        """Ajuste l'imputation et la mise à l'échelle sur les features d'entraînement (déjà encodées, ordre du modèle)."""
+        X = X_train.astype(np.float64)
+        imputer = SimpleImputer(strategy='median')
+        scaler = MinMaxScaler(feature_range=(0, 1))
+        scaler.fit(imputer.fit_transform(X.to_numpy()))
+        return cls(X.columns, imputer, scaler)
+
+    def encode(self, df):
+        """Indicatrices (get_dummies) et colonnes du modèle, avant imputation."""
+        categorical = [c for c in df if df[c].dtype == object]
+        encoded = pd.get_dummies(df)
+        encoded.columns = [clean_column_name(c) for c in encoded.columns]
+        prefixes = tuple(clean_column_name(f'{c}_') for c in categorical)
+        # Une indicatrice absente correspond à une catégorie que le client n'a pas
+        missing = [c for c in self.feature_names if c not in encoded.columns]
+        unknown = [c for c in missing if not c.startswith(prefixes)]
+        if unknown:
+            raise ValueError(f"Colonnes manquantes : {unknown}")
+        return encoded.reindex(columns=self.feature_names, fill_value=0).astype(np.float64)
+
+    def transform(self, df):
+        """Features du modèle (DataFrame, colonnes dans l'ordre du modèle) à partir des lignes de train/test_after_fe."""
+        X = self.scaler.transform(self.imputer.transform(self.encode(df).to_numpy()))
+        return pd.DataFrame(X, columns=self.feature_names, index=df.index)
+
+    def to_raw(self, values, column):
+        """Valeurs d'origine (après imputation) d'une feature du modèle, à partir de ses valeurs mises à l'échelle."""
+        return (np.asarray(values, dtype=np.float64) - self.scaler.min_[column]) / self.scaler.scale_[column]
+
+    def to_model(self, values, column):
+        """Mise à l'échelle [0, 1] de valeurs d'origine d'une feature (inverse de to_raw)."""
+        return np.asarray(values, dtype=np.float64) * self.scaler.scale_[column] + self.scaler.min_[column]
+
+
+def fit_preparation(train, model):
+    """
+    Ajustement de la préparation du notebook 05 : même découpage entraînement / validation, colonnes du modèle.
+
+    Paramètres
+    --------
+        train (DataFrame) :
+            le jeu d'entraînement réduit du notebook 02 (train_reduced.csv, avec SK_ID_CURR et TARGET)
+        model (Pipeline) :
+            le pipeline entraîné (dernière étape : LGBMClassifier)
+    """
+    X_train, _ = train_test_split(train, test_size=0.2, random_state=42)
+    # LightGBM remplace les espaces des noms de colonnes par des '_'
+    positions = {c.replace(' ', '_'): c for c in X_train.columns}
+    columns = [positions[name] for name in model.steps[-1][1].feature_name_]
+    return ModelPreparation.fit(X_train[columns])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Ajustement de la préparation des features pour le calcul en ligne.")
+    parser.add_argument('--train', default='train_reduced.csv', help="jeu d'entraînement réduit du notebook 02")
+    parser.add_argument('--model', default='credit_scoring_new.joblib', help="pipeline entraîné")
+    parser.add_argument('--output', default=PREPARATION_PATH, help="fichier de la préparation ajustée")
+    args = parser.parse_args()
+
+    preparation = fit_preparation(pd.read_csv(args.train), joblib.load(args.model))
+    joblib.dump(preparation, args.output)
+    print(f"{args.output} écrit ({len(preparation.feature_names)} features)")
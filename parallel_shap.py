@@ -0,0 +1,122 @@
+# Calcul des valeurs SHAP en parallèle pour les gros lots de clients.
+# Les lignes sont découpées en blocs contigus répartis sur un pool de processus ; chaque processus charge
+# le modèle et construit son explainer une seule fois, et les blocs sont recollés dans l'ordre d'entrée.
+# Comme chaque ligne est expliquée indépendamment, la propriété d'additivité (base + somme des SHAP = log-odds)
+# est conservée à l'identique. En dessous d'un certain nombre de lignes, ou si le pool n'est pas disponible,
+# le calcul se fait en série dans le processus courant.
+#
+# Taille du pool : variable d'environnement SHAP_WORKERS (par défaut le nombre de cœurs ; 0 ou 1 = série).
+# shap n'est importé que dans les processus du pool : importer ce module ne coûte rien au démarrage de l'API.
+
+import os
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import joblib
+import numpy as np
+import pandas as pd
+
+# Nombre minimal de lignes pour que le découpage vaille le coût d'envoi des données aux processus
+MIN_ROWS_PARALLEL = 256
+
+# Explainer propre à chaque processus du pool
+_worker_explainer = None
+
+# Pool partagé, créé au premier gros lot
+_pool = None
+_pool_workers = None
+_pool_lock = threading.Lock()
+
+
+def default_workers():
+    return int(os.environ.get('SHAP_WORKERS', os.cpu_count() or 1))
+
+
+def positive_class_values(shap_values):
+    """Renvoie la matrice SHAP (lignes x features) de la classe positive, quel que soit le format renvoyé par shap."""
+    if isinstance(shap_values, list):
+        return np.asarray(shap_values[1])
+    return np.asarray(shap_values)
+
+
+def _init_worker(model_path):
+    # Exécuté une seule fois au démarrage de chaque processus du pool ; model_path est le pipeline sérialisé
+    # ou le répertoire du modèle allégé exporté par fast_scorer.py (mêmes valeurs SHAP, cf. unit_testing.py)
+    global _worker_explainer
+    import shap
+    if os.path.isdir(model_path):
+        import fast_scorer
+        _worker_explainer = shap.Explainer(fast_scorer.FastScorer.load(model_path).booster)
+    else:
+        model = joblib.load(model_path)
+        _worker_explainer = shap.Explainer(model.named_steps['model'])
+
+
+def _explain_block(block):
+    values, columns = block
+    return positive_class_values(_worker_explainer.shap_values(pd.DataFrame(values, columns=columns)))
+
+
+def get_pool(n_workers, model_path):
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is None or _pool_workers != n_workers:
+            if _pool is not None:
+                _pool.shutdown(wait=False)
+            # 'spawn' évite de dupliquer par fork un processus dont les threads OpenMP de LightGBM sont actifs
+            _pool = ProcessPoolExecutor(max_workers=n_workers,
+                                        mp_context=multiprocessing.get_context('spawn'),
+                                        initializer=_init_worker,
+                                        initargs=(model_path,))
+            _pool_workers = n_workers
+        return _pool
+
+
+def shutdown_pool():
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=True)
+        _pool = None
+        _pool_workers = None
+
+
+def explain_batch(df, serial_explainer, n_workers=None, model_path='credit_scoring_new.joblib', min_rows=MIN_ROWS_PARALLEL):
+    """
+    Calcule les valeurs SHAP de la classe positive pour un lot de lignes, en parallèle si le lot est assez gros.
+
+    Paramètres
+    --------
+        df (dataframe) :
+            les lignes à expliquer, dans l'ordre des colonnes du modèle
+        serial_explainer :
+            l'explainer du processus courant, utilisé pour le calcul en série
+        n_workers (int) :
+            taille du pool (par défaut SHAP_WORKERS ou le nombre de cœurs) ; 0 ou 1 force le calcul en série
+        model_path (str) :
+            le pipeline sérialisé (ou le répertoire du modèle allégé) chargé par chaque processus du pool
+        min_rows (int) :
+            nombre de lignes en dessous duquel le calcul reste en série
+
+    Retour
+    --------
+        une matrice NumPy (lignes x features) dans l'ordre des lignes d'entrée
+    """
+    if n_workers is None:
+        n_workers = default_workers()
+
+    if n_workers > 1 and len(df) >= max(min_rows, 2):
+        # Quelques blocs par processus pour lisser les écarts de durée entre blocs
+        values = df.to_numpy()
+        blocks = np.array_split(values, min(len(df), n_workers * 4))
+        columns = df.columns.tolist()
+        try:
+            pool = get_pool(n_workers, model_path)
+            # map renvoie les résultats dans l'ordre des blocs, donc dans l'ordre d'entrée
+            return np.vstack(list(pool.map(_explain_block, [(block, columns) for block in blocks])))
+        except (BrokenProcessPool, OSError):
+            # Pool indisponible (processus tué, environnement sans fork/spawn) : repli sur le calcul en série
+            shutdown_pool()
+
+    return positive_class_values(serial_explainer.shap_values(df))
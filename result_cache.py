@@ -0,0 +1,93 @@
+# Cache des résultats de /predict et /explain.
+# Chaque ligne envoyée est identifiée par une empreinte stable de son vecteur de features, combinée à l'empreinte
+# du modèle (contenu de credit_scoring_new.joblib et de optimal_threshold.txt) : un changement de modèle
+# rend automatiquement les anciennes entrées inaccessibles. Le cache est borné en nombre d'entrées (LRU)
+# et en durée de vie (TTL), et compte ses hits/misses pour pouvoir être surveillé.
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+
+
+def file_fingerprint(*paths):
+    """Empreinte SHA-256 (tronquée) du contenu d'un ou plusieurs fichiers, lus par blocs."""
+    digest = hashlib.sha256()
+    for path in paths:
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+    return digest.hexdigest()[:16]
+
+
+def columns_hash(columns):
+    return hashlib.sha256('\x1f'.join(map(str, columns)).encode()).hexdigest()[:16]
+
+
+def matrix_keys(X, columns, fingerprint):
+    """Clés des lignes d'une matrice float64 (lignes x colonnes) : empreinte des octets de chaque ligne."""
+    # -0.0 devient 0.0 et tous les NaN ont la même représentation, pour que des valeurs égales aient la même clé
+    X = np.ascontiguousarray(X, dtype=np.float64) + 0.0
+    X[np.isnan(X)] = np.nan
+    names_hash = columns_hash(columns)
+    return [(fingerprint, names_hash, hashlib.blake2b(row.tobytes(), digest_size=8).hexdigest()) for row in X]
+
+
+def row_keys(df, fingerprint):
+    """Une clé par ligne : (empreinte du modèle, empreinte des noms de colonnes, empreinte des valeurs de la ligne)."""
+    # Colonnes numériques : on hache directement les lignes de la matrice, ce qui évite le coût par colonne
+    # de hash_pandas_object (plusieurs dizaines de millisecondes pour une seule ligne de ~340 colonnes)
+    if all(pd.api.types.is_numeric_dtype(dtype) or pd.api.types.is_bool_dtype(dtype) for dtype in df.dtypes):
+        return matrix_keys(df.to_numpy(dtype=np.float64), df.columns, fingerprint)
+    # hash_pandas_object est vectorisé et utilise une clé fixe : l'empreinte est la même d'un processus à l'autre
+    row_hashes = pd.util.hash_pandas_object(df, index=False).to_numpy()
+    return [(fingerprint, columns_hash(df.columns), int(row_hash)) for row_hash in row_hashes]
+
+
+class ResultCache:
+    """Cache LRU borné avec durée de vie des entrées, partagé entre les threads d'un worker."""
+
+    def __init__(self, max_entries=10000, ttl=3600):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            item = self._entries.get(key)
+            if item is not None:
+                value, expires_at = item
+                if expires_at >= time.monotonic():
+                    # L'entrée devient la plus récemment utilisée
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            # Éviction des entrées les moins récemment utilisées au-delà de la taille maximale
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {"entries": len(self._entries), "max_entries": self.max_entries, "ttl_seconds": self.ttl,
+                    "hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                    "hit_rate": self.hits / lookups if lookups else 0.0}
@@ -1,11 +1,13 @@
 import streamlit as st
 import pandas as pd
-import requests
+import api_client
 import plotly.graph_objects as go
 import matplotlib.pyplot as plt
 import shap
 import streamlit.components.v1 as components
 import numpy as np 
+import dashboard_data
+import chart_cache
 
 # Définition de la langue de la page en utilisant une balise HTML (utile si le contenu est multilingue ou pour certaines balises)
 st.markdown("""
@@ -13,46 +15,36 @@ st.markdown("""
     </html>
     """, unsafe_allow_html=True)
 
-# Chargement des données de test reconstituées (dataset avec des données test échantillonnées)
-data_path = 'reconstituted_test_sampled.csv'
-test_data = pd.read_csv(data_path, index_col=False)
+# Chargement des jeux de données : test reconstitué (features du modèle), vue réduite du jeu initial
+# (informations client affichées) et importances globales des features.
+# Les CSV sont convertis une seule fois en fichiers colonnaires typés (cf. dashboard_data.py) et le résultat est
+# gardé en mémoire par st.cache_resource : les relances du script à chaque interaction et les autres sessions
+# réutilisent les mêmes DataFrames au lieu de reparser les fichiers.
+# L'index SK_ID_CURR -> ligne, commun aux deux jeux, est construit une seule fois avec eux.
+@st.cache_resource
+def load_datasets():
+    test_data, initial_test_data_reduced, global_importance = dashboard_data.load_datasets()
+    client_index = dashboard_data.ClientIndex(test_data, initial_test_data_reduced)
+    return test_data, initial_test_data_reduced, global_importance, client_index
+
+test_data, initial_test_data_reduced, global_importance, client_index = load_datasets()
+
+# Agrégats des distributions de la population pour les graphiques de la page 2 (cf. chart_cache.py),
+# calculés une seule fois : à chaque affichage, seul le point du client sélectionné est ajouté
+@st.cache_resource
+def load_chart_cache():
+    return chart_cache.ChartCache(initial_test_data_reduced)
+
+charts = load_chart_cache()
 list_id_client = test_data.SK_ID_CURR.to_list()
 
-# Chargement du dataset initial (données de test initiales échantillonnées)
-initial_data_path = 'application_test_sampled.csv'
-initial_test_data = pd.read_csv(initial_data_path)
-
-# Réduction du dataset initial aux colonnes pertinentes pour l'affichage
-initial_test_data_reduced = initial_test_data[['SK_ID_CURR',
-    'CODE_GENDER',
-    'DAYS_BIRTH',
-    'NAME_FAMILY_STATUS',
-    'CNT_CHILDREN',
-    'CNT_FAM_MEMBERS',
-    'NAME_HOUSING_TYPE',
-    'DAYS_EMPLOYED',
-    'AMT_INCOME_TOTAL',
-    'AMT_CREDIT',
-    'AMT_ANNUITY',
-    'AMT_GOODS_PRICE']]
-
-# Transformation des jours en années pour l'âge et la durée d'emploi
-initial_test_data_reduced['AGE'] = round(initial_test_data_reduced['DAYS_BIRTH'] / -365, 2)
-initial_test_data_reduced['EMPLOYMENT_LENGTH'] = round(initial_test_data_reduced['DAYS_EMPLOYED'] / -365, 2)
-
-# Suppression des colonnes non nécessaires après la transformation
-initial_test_data_reduced = initial_test_data_reduced.drop(['DAYS_BIRTH', 'DAYS_EMPLOYED'], axis=1)
-
-# Chargement des importances globales des features (données sur l'importance moyenne des features globalement)
-global_importance = pd.read_csv('global_feature_importance.csv')
-
 # Fonction pour comparer les importances locales (SHAP values pour un client) et globales, limitée aux 10 variables les plus importantes
 def compare_global_local(selected_data, shap_values_local):
     # Extraction des valeurs SHAP locales (seules les valeurs absolues sont utilisées)
     local_shap_values = np.abs(np.array(shap_values_local[0]))
 
     # Tri des importances globales (valeurs déjà absolues)
-    global_importance_sorted = global_importance.set_index('Feature').reindex(selected_data.columns).reset_index()
+    global_importance_sorted = load_global_importance().set_index('Feature').reindex(selected_data.columns).reset_index()
 
     # Création d'un DataFrame pour la comparaison des importances locales et globales
     feature_importance_df = pd.DataFrame({
@@ -108,29 +100,49 @@ def compare_global_local(selected_data, shap_values_local):
     </p>
     """, unsafe_allow_html=True)
 
-# Fonction pour interroger l'API et obtenir les prédictions
-def get_predictions_from_api(input_data, api_url="https://scorecredit-93521a3704b4.herokuapp.com/predict"):
-    response = requests.post(api_url, json={"data": input_data})
-    if response.status_code == 200:
-        return response.json()
-    else:
-        st.error(f"Erreur lors de la requête API: {response.status_code}")
+# Client de l'API de scoring (cf. api_client.py) : une session persistante partagée par toutes les relances
+# du script, avec délais maximaux et nouvelles tentatives. L'adresse se règle avec la variable SCORING_API_URL.
+@st.cache_resource
+def get_api_client():
+    return api_client.ScoringClient()
+
+# Importance globale des features du modèle servi par l'API (un vecteur précalculé, cf. global_importance.py),
+# relue au plus une fois par heure ; si l'API ne la fournit pas, on garde global_feature_importance.csv
+@st.cache_data(ttl=3600)
+def load_global_importance():
+    try:
+        response = get_api_client().global_importance()
+    except api_client.APIError:
+        return global_importance
+    return pd.DataFrame({'Feature': response['feature_names'], 'MeanAbsSHAP': response['mean_abs_shap']})
+
+# Fonction pour interroger l'API et obtenir, en un seul appel, la prédiction d'un client et ses valeurs SHAP
+# (réponse lue dans le stock précalculé de l'API, sans renvoyer les features du client).
+# La réponse contient aussi la valeur de base du modèle (expected_value) et les noms des features.
+def get_decision_from_api(client_id):
+    try:
+        return get_api_client().score_and_explain(client_id)
+    except api_client.APIError as e:
+        st.error(f"Erreur lors de la requête API: {e}")
         return None
 
-# Fonction pour obtenir les valeurs SHAP locales depuis l'API
-def get_shap_values_from_api(input_data, api_url="https://scorecredit-93521a3704b4.herokuapp.com/explain"):
-    response = requests.post(api_url, json={"data": input_data})
-    if response.status_code == 200:
-        return response.json()['shap_values']
-    else:
-        st.error(f"Erreur lors de la requête API: {response.status_code}")
+# Courbes de sensibilité d'un client : chaque feature choisie varie seule, et toutes les variantes sont scorées par
+# l'API en une seule requête (route /predict/whatif). Les features du modèle sont mises à l'échelle [0, 1] : les
+# facteurs sont appliqués par l'API aux valeurs d'origine du client, puis remis à l'échelle. Si l'API n'a pas la
+# préparation du modèle pour le faire, les features parcourent [0, 1] en unités du modèle (cf. api_client.sensitivity).
+def get_what_if_from_api(input_data, features, factors):
+    row = {column: float(value) for column, value in input_data.iloc[0].items()}
+    try:
+        return get_api_client().sensitivity(row, features, factors)
+    except api_client.APIError as e:
+        st.error(f"Erreur lors de la requête API: {e}")
         return None
 
 # Fonction pour afficher les valeurs SHAP locales sous forme de graphique waterfall pour un client spécifique
-def display_shap_values(input_data, shap_values):
+def display_shap_values(input_data, shap_values, base_value=0):
     plt.figure(figsize=(25, 10))
     shap.waterfall_plot(shap.Explanation(values=np.array(shap_values[0]),
-                                         base_values=0,  # Valeur de base par défaut
+                                         base_values=base_value,  # Valeur de base renvoyée par l'API
                                          data=input_data.iloc[0],
                                          feature_names=input_data.columns.tolist()), show=False)
     st.pyplot(plt, clear_figure=True)
@@ -259,8 +271,8 @@ with st.sidebar:
         if selected_id:
             if selected_id.isdigit():  
                 selected_id = int(selected_id)
-                if selected_id in test_data['SK_ID_CURR'].values:
-                    valid_id = True  # L'ID est valide s'il est dans le dataset
+                if selected_id in client_index:
+                    valid_id = True  # L'ID est valide s'il est dans le dataset (recherche en temps constant)
                 else:
                     st.markdown("<p style='color:red;'>Please enter a valid ID from the dataset.</p>", unsafe_allow_html=True)
             else:
@@ -277,6 +289,7 @@ with st.sidebar:
     show_page1 = st.checkbox("Customer Information", value=True)
     show_page2 = st.checkbox("Feature Visualization")
     show_page3 = st.checkbox("Decision")
+    show_page4 = st.checkbox("What-if Analysis")
 
 # Si l'ID est valide, exécuter le reste du code en fonction des cases cochées
 if valid_id:
@@ -285,12 +298,11 @@ if valid_id:
     st.markdown(f'<p style="text-align:center; font-size:16px; color:#555;">Customer ID: {selected_id}</p>', unsafe_allow_html=True)
 
     # Toujours récupérer les données sélectionnées indépendamment des pages cochées
-    selected_data = test_data[test_data['SK_ID_CURR'] == selected_id].iloc[:, 1:].copy()
-    selected_data.reset_index(drop=True, inplace=True)
+    # (une seule ligne lue via l'index des clients, sans parcourir ni copier tout le jeu de données)
+    selected_data = client_index.features(selected_id)
 
-    # Filtrer les données du dataset initial pour l'ID client sélectionné
-    selected_initial_data = initial_test_data_reduced[initial_test_data_reduced['SK_ID_CURR'] == selected_id]
-    selected_initial_data.reset_index(drop=True, inplace=True)
+    # Données du dataset initial pour l'ID client sélectionné
+    selected_initial_data = client_index.initial_info(selected_id)
 
     # Page 1 : Afficher les informations du client si "Customer Information" est coché
     if show_page1:
@@ -335,10 +347,11 @@ if valid_id:
 
         if not selected_initial_data.empty:
             # Vérification si la variable sélectionnée est numérique ou catégorielle
-            if pd.api.types.is_numeric_dtype(initial_test_data_reduced[selected_variable]):
-                # Graphique pour les variables numériques (histogramme)
+            if selected_variable in charts.numeric:
+                # Graphique pour les variables numériques (histogramme précalculé)
                 fig, ax = plt.subplots(figsize=(10, 6))
-                ax.hist(initial_test_data_reduced[selected_variable], bins=30, color='#ff8c00', alpha=0.7, label='All Customers')
+                counts, edges = charts.histogram(selected_variable)
+                ax.stairs(counts, edges, fill=True, color='#ff8c00', alpha=0.7, label='All Customers')
 
                 # Ajout de la position du client sélectionné
                 client_value = selected_initial_data[selected_variable].values[0]
@@ -355,11 +368,11 @@ if valid_id:
                 # Graphique pour les variables catégorielles (diagramme à barres)
                 fig, ax = plt.subplots(figsize=(10, 6))
 
-                # Comptage des occurrences de chaque catégorie
-                value_counts = initial_test_data_reduced[selected_variable].value_counts()
+                # Occurrences de chaque catégorie (précalculées)
+                value_counts = charts.counts(selected_variable)
 
                 # Affichage du diagramme à barres pour toutes les catégories
-                ax.bar(value_counts.index, value_counts.values, color='#ff8c00', alpha=0.7)
+                ax.bar(value_counts.index.astype(str), value_counts.values, color='#ff8c00', alpha=0.7)
 
                 ax.set_title(f'Distribution of {selected_variable}')
                 ax.set_xlabel(selected_variable)
@@ -385,10 +398,12 @@ if valid_id:
         st.markdown(f"<p style='color: grey;'>The following graph shows the relationship between {variable1} and {variable2} for all customers.</p>", unsafe_allow_html=True)
 
         # Vérification des types des variables sélectionnées
-        if pd.api.types.is_numeric_dtype(initial_test_data_reduced[variable1]) and pd.api.types.is_numeric_dtype(initial_test_data_reduced[variable2]):
-            # Graphique de dispersion pour deux variables numériques
+        if variable1 in charts.numeric and variable2 in charts.numeric:
+            # Densité des clients sur une grille 2D précalculée (au lieu d'un nuage de tous les points)
             fig, ax = plt.subplots(figsize=(10, 6))
-            ax.scatter(initial_test_data_reduced[variable1], initial_test_data_reduced[variable2], color='#ff8c00', alpha=0.6, label='All Customers')
+            counts, x_edges, y_edges = charts.grid(variable1, variable2)
+            mesh = ax.pcolormesh(x_edges, y_edges, np.ma.masked_equal(counts.T, 0), cmap='Oranges', alpha=0.8)
+            fig.colorbar(mesh, ax=ax, label='Number of customers')
 
             # Ajout de la position du client sélectionné
             client_value1 = selected_initial_data[variable1].values[0]
@@ -402,22 +417,26 @@ if valid_id:
 
             st.pyplot(fig)
 
-        elif pd.api.types.is_numeric_dtype(initial_test_data_reduced[variable1]) and not pd.api.types.is_numeric_dtype(initial_test_data_reduced[variable2]):
-            # Boxplot pour une variable numérique et une variable catégorielle
+        elif variable1 in charts.numeric or variable2 in charts.numeric:
+            # Boxplot pour une variable numérique et une variable catégorielle (statistiques précalculées) ;
+            # les rôles sont inversés si la deuxième variable est la variable numérique
+            numeric_variable, category_variable = (variable1, variable2) if variable1 in charts.numeric else (variable2, variable1)
             fig, ax = plt.subplots(figsize=(10, 6))
-            initial_test_data_reduced.boxplot(column=variable1, by=variable2, ax=ax, grid=False)
-            ax.set_title(f'{variable1} distribution by {variable2}')
-            ax.set_xlabel(variable2)
-            ax.set_ylabel(variable1)
-            st.pyplot(fig)
+            boxes = charts.boxes(numeric_variable, category_variable)
+            ax.bxp(boxes)
+
+            # Ajout de la valeur du client sélectionné dans la boîte de sa catégorie
+            client_category = str(selected_initial_data[category_variable].values[0])
+            client_value = selected_initial_data[numeric_variable].values[0]
+            labels = [box['label'] for box in boxes]
+            if client_category in labels:
+                ax.scatter(labels.index(client_category) + 1, client_value, color='green', s=100, zorder=3,
+                           label=f'Selected Customer ({client_value})')
+                ax.legend()
 
-        elif pd.api.types.is_numeric_dtype(initial_test_data_reduced[variable2]) and not pd.api.types.is_numeric_dtype(initial_test_data_reduced[variable1]):
-            # Inverser les rôles des variables si la deuxième est numérique et la première catégorielle
-            fig, ax = plt.subplots(figsize=(10, 6))
-            initial_test_data_reduced.boxplot(column=variable2, by=variable1, ax=ax, grid=False)
-            ax.set_title(f'{variable2} distribution by {variable1}')
-            ax.set_xlabel(variable1)
-            ax.set_ylabel(variable2)
+            ax.set_title(f'{numeric_variable} distribution by {category_variable}')
+            ax.set_xlabel(category_variable)
+            ax.set_ylabel(numeric_variable)
             st.pyplot(fig)
 
         else:
@@ -428,12 +447,12 @@ if valid_id:
         st.markdown('<h2 class="section-title">Decision :</h2>', unsafe_allow_html=True)
 
         if not selected_data.empty:
-            # Interroger l'API pour obtenir la prédiction et la probabilité
-            api_response = get_predictions_from_api(selected_data.to_dict(orient='records'))
+            # Interroger l'API pour obtenir la prédiction, la probabilité et les valeurs SHAP
+            api_response = get_decision_from_api(selected_id)
 
             if api_response is not None:
-                prediction_proba = api_response['probability'][0]
-                prediction = api_response['prediction'][0]
+                prediction_proba = api_response['probability']
+                prediction = api_response['prediction']
 
                 # Affichage du texte coloré en fonction de la prédiction
                 if prediction == 0:
@@ -468,17 +487,55 @@ if valid_id:
                 # Séparation par une ligne
                 st.markdown("---")
 
-                # Obtenir et afficher les valeurs SHAP depuis l'API
-                shap_values = get_shap_values_from_api(selected_data.to_dict(orient='records'))
-                if shap_values is not None:
-                    st.markdown("<h3 class='centered-text'>Feature Importance for this prediction :</h3>", unsafe_allow_html=True)
-                    display_shap_values(selected_data, shap_values)
+                # Afficher les valeurs SHAP reçues avec la prédiction
+                shap_values = api_response['shap_values']
+                st.markdown("<h3 class='centered-text'>Feature Importance for this prediction :</h3>", unsafe_allow_html=True)
+                display_shap_values(selected_data, shap_values, api_response['expected_value'])
 
-                    # Comparaison des importances locales et globales
-                    compare_global_local(selected_data, shap_values)
-                else:
-                    st.write("Error when retrieving SHAP values.")
+                # Comparaison des importances locales et globales
+                compare_global_local(selected_data, shap_values)
             else:
                 st.write("Error when retrieving predictions.")
         else:
             st.markdown("<p style='color:red;'>Please select a valid customer ID before proceeding with the decision analysis.</p>", unsafe_allow_html=True)
+
+    # Page 4 : Courbes de sensibilité si "What-if Analysis" est coché
+    if show_page4:
+        st.markdown('<h2 class="section-title">What-if Analysis :</h2>', unsafe_allow_html=True)
+
+        if not selected_data.empty:
+            # Par défaut, les features les plus importantes du modèle (importance globale)
+            model_features = selected_data.columns.tolist()
+            ranked = load_global_importance().sort_values('MeanAbsSHAP', ascending=False)['Feature']
+            default_features = [feature for feature in ranked if feature in model_features][:3]
+            what_if_features = st.multiselect("Select the variables to vary", options=model_features, default=default_features, max_selections=5)
+            change_range = st.slider("Range of change (%)", min_value=-90, max_value=200, value=(-50, 50), step=5)
+
+            st.markdown("<p style='color: grey;'>Each curve shows the default probability when only this variable changes (in its original units, e.g. -20% of the credit amount), all the others keeping the customer's values. The red line is the decision threshold.</p>", unsafe_allow_html=True)
+
+            if what_if_features:
+                changes = np.linspace(change_range[0], change_range[1], 21)
+                what_if_response = get_what_if_from_api(selected_data, what_if_features, (1 + changes / 100).tolist())
+
+                if what_if_response is not None:
+                    relative = what_if_response['relative']
+                    if not relative:
+                        st.warning("The API cannot convert changes to original units (model preparation not deployed): "
+                                   "each variable instead goes over its scaled range, from 0 (minimum) to 1 (maximum).")
+                    fig, ax = plt.subplots(figsize=(10, 6))
+                    for feature, values, probability, flips in zip(what_if_response['features'], what_if_response['values'],
+                                                                  what_if_response['probability'], what_if_response['flips']):
+                        line, = ax.plot(changes if relative else values, probability, marker='o', markersize=3, label=f'{feature} ({flips} decision changes)')
+                        if not relative:
+                            # Valeur actuelle du client, sur la courbe de sa variable
+                            ax.scatter(selected_data[feature].iloc[0], what_if_response['base_probability'], color=line.get_color(), s=100, zorder=3)
+                    ax.axhline(what_if_response['threshold'], color='red', linestyle='dashed', linewidth=2, label='Decision threshold')
+                    if relative:
+                        ax.scatter(0, what_if_response['base_probability'], color='green', s=100, zorder=3, label='Selected Customer')
+                    ax.set_title('Sensitivity of the default probability')
+                    ax.set_xlabel('Change of the variable (%)' if relative else 'Value of the variable (scaled to [0, 1])')
+                    ax.set_ylabel('Default probability')
+                    ax.legend()
+                    st.pyplot(fig)
+        else:
+            st.markdown("<p style='color:red;'>Please select a valid customer ID before proceeding with the what-if analysis.</p>", unsafe_allow_html=True)
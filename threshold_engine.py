@@ -0,0 +1,187 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Recalcul du seuil de décision (optimal_threshold.txt) et de la courbe de coût métier.
+# Le coût est celui des notebooks : coût = 10 x faux négatifs + 1 x faux positifs (un client prédit en défaut
+# dès que sa probabilité est >= au seuil). Au lieu de reprédire pour chaque seuil d'une grille, les probabilités
+# sont triées une seule fois : en les parcourant par ordre décroissant, les sommes cumulées des étiquettes donnent
+# les vrais / faux positifs de tous les seuils possibles (chaque probabilité distincte) en O(n log n).
+#
+# Chaque calcul est écrit dans thresholds/<version>.json (optimum, matrice de confusion, courbe) ; avec --activate,
+# le seuil est aussi écrit dans optimal_threshold.txt, que l'API relit sans redémarrer.
+#
+# Utilisation (CSV avec TARGET et soit une colonne probability, soit les features du modèle) :
+#     python threshold_engine.py valeurs_labellisees.csv --activate
+#     python threshold_engine.py --activate-version 20240601T120000Z
+
+import argparse
+import glob
+import json
+import os
+import time
+import joblib
+import numpy as np
+import pandas as pd
+from result_cache import file_fingerprint
+
+THRESHOLDS_DIR = 'thresholds'
+THRESHOLD_PATH = 'optimal_threshold.txt'
+
+# Coûts des erreurs (notebook 05 : calculate_cost_threshold(..., cost_fn=10, cost_fp=1))
+COST_FN = 10
+COST_FP = 1
+
+
+def cost_curve(y_true, probability, cost_fn=COST_FN, cost_fp=COST_FP):
+    """
+    Matrice de confusion et coût de tous les seuils utiles, par seuil décroissant.
+
+    Les seuils candidats sont les probabilités distinctes (prédiction = probabilité >= seuil), précédées d'un
+    seuil juste au-dessus de la plus grande probabilité (aucun client prédit en défaut).
+
+    Retour : DataFrame (threshold, tp, fp, fn, tn, cost)
+    """
+    y_true = np.asarray(y_true, dtype=np.int64)
+    probability = np.asarray(probability, dtype=np.float64)
+    order = np.argsort(-probability, kind='stable')
+    sorted_probability = probability[order]
+    sorted_true = y_true[order]
+
+    # Dernière position de chaque probabilité distincte : les clients à égalité changent de classe ensemble
+    last = np.flatnonzero(np.diff(sorted_probability, append=-np.inf) != 0)
+    tp = np.concatenate([[0], np.cumsum(sorted_true)[last]])
+    fp = np.concatenate([[0], last + 1 - tp[1:]])
+    positives = int(sorted_true.sum())
+    negatives = len(y_true) - positives
+    fn = positives - tp
+    tn = negatives - fp
+    above_max = np.nextafter(sorted_probability[0], np.inf) if len(probability) else 1.0
+    return pd.DataFrame({'threshold': np.concatenate([[above_max], sorted_probability[last]]),
+                         'tp': tp, 'fp': fp, 'fn': fn, 'tn': tn,
+                         'cost': cost_fn * fn + cost_fp * fp})
+
+
+def optimal_point(curve):
+    """Ligne de coût minimal ; à coût égal, le seuil le plus bas (comme la recherche sur grille du notebook)."""
+    return curve.iloc[len(curve) - 1 - int(np.argmin(curve['cost'].to_numpy()[::-1]))]
+
+
+def sample_curve(curve, optimum_index, max_points=1000):
+    """Courbe réduite à max_points seuils répartis régulièrement (l'optimum est toujours gardé)."""
+    if len(curve) <= max_points:
+        return curve
+    rows = np.unique(np.concatenate([np.linspace(0, len(curve) - 1, max_points).round().astype(int), [optimum_index]]))
+    return curve.iloc[rows]
+
+
+def optimize_threshold(y_true, probability, cost_fn=COST_FN, cost_fp=COST_FP, max_points=1000):
+    """Seuil optimal et courbe de coût (dictionnaire prêt à être écrit en JSON)."""
+    curve = cost_curve(y_true, probability, cost_fn, cost_fp)
+    best = optimal_point(curve)
+    positives = int(best['tp'] + best['fn'])
+    return {
+        'threshold': float(best['threshold']),
+        'cost': float(best['cost']),
+        'cost_fn': cost_fn,
+        'cost_fp': cost_fp,
+        'n': int(len(y_true)),
+        'confusion': {key: int(best[key]) for key in ['tp', 'fp', 'fn', 'tn']},
+        'recall': float(best['tp'] / positives) if positives else None,
+        'curve': sample_curve(curve, best.name, max_points).to_dict(orient='list'),
+    }
+
+
+def artifact_path(version, directory=THRESHOLDS_DIR):
+    return os.path.join(directory, f'{version}.json')
+
+
+def write_json(data, path):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+
+def save_artifact(result, model_fingerprint=None, directory=THRESHOLDS_DIR):
+    """Écrit un calcul de seuil sous une nouvelle version (date UTC) et renvoie cette version."""
+    version = time.strftime('%Y%m%dT%H%M%SZ', time.gmtime())
+    while os.path.exists(artifact_path(version, directory)):
+        version = f'{version}-1'
+    write_json({'version': version, 'model_fingerprint': model_fingerprint, **result}, artifact_path(version, directory))
+    return version
+
+
+def load_artifact(version, directory=THRESHOLDS_DIR):
+    with open(artifact_path(version, directory), 'r') as f:
+        return json.load(f)
+
+
+def list_versions(directory=THRESHOLDS_DIR):
+    """Versions enregistrées, de la plus ancienne à la plus récente."""
+    return sorted(os.path.splitext(os.path.basename(path))[0] for path in glob.glob(os.path.join(directory, '*.json')))
+
+
+def find_version(threshold, model_fingerprint=None, directory=THRESHOLDS_DIR):
+    """Version la plus récente qui a produit ce seuil (pour ce modèle si son empreinte est donnée), None sinon."""
+    for version in reversed(list_versions(directory)):
+        artifact = load_artifact(version, directory)
+        if artifact['threshold'] == threshold and model_fingerprint in (None, artifact.get('model_fingerprint')):
+            return version
+    return None
+
+
+def activate(threshold, path=THRESHOLD_PATH):
+    """Écrit le seuil dans optimal_threshold.txt (remplacement atomique : l'API ne lit jamais un fichier partiel)."""
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w') as f:
+        f.write(repr(float(threshold)))
+    os.replace(tmp_path, path)
+
+
+def labeled_probabilities(path, model_path, chunksize=100000):
+    """(TARGET, probabilité) d'un CSV : colonne probability si elle existe, sinon scoring des features par morceaux."""
+    columns = pd.read_csv(path, nrows=0).columns
+    if 'probability' in columns:
+        data = pd.read_csv(path, usecols=['TARGET', 'probability'])
+        return data['TARGET'].to_numpy(), data['probability'].to_numpy()
+
+    import fast_scorer
+    scorer = fast_scorer.FastScorer.from_pipeline(joblib.load(model_path))
+    targets, probabilities = [], []
+    for chunk in pd.read_csv(path, chunksize=chunksize):
+        targets.append(chunk['TARGET'].to_numpy())
+        probabilities.append(scorer.predict_proba(scorer.to_matrix(chunk.drop(columns=['TARGET']))))
+    return np.concatenate(targets), np.concatenate(probabilities)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Recalcule le seuil de décision qui minimise le coût métier.")
+    parser.add_argument('input', nargs='?', help="CSV labellisé (TARGET + probability, ou TARGET + features du modèle)")
+    parser.add_argument('--model', default='credit_scoring_new.joblib', help="pipeline sérialisé")
+    parser.add_argument('--cost-fn', type=float, default=COST_FN, help="coût d'un faux négatif")
+    parser.add_argument('--cost-fp', type=float, default=COST_FP, help="coût d'un faux positif")
+    parser.add_argument('--dir', default=THRESHOLDS_DIR, help="répertoire des versions")
+    parser.add_argument('--activate', action='store_true', help="écrit le nouveau seuil dans optimal_threshold.txt")
+    parser.add_argument('--activate-version', help="réactive le seuil d'une version enregistrée")
+    parser.add_argument('--threshold-path', default=THRESHOLD_PATH, help="fichier du seuil lu par l'API")
+    args = parser.parse_args()
+
+    if args.activate_version:
+        artifact = load_artifact(args.activate_version, args.dir)
+        activate(artifact['threshold'], args.threshold_path)
+        print(f"Seuil {artifact['threshold']} (version {args.activate_version}) écrit dans {args.threshold_path}")
+        raise SystemExit
+
+    if not args.input:
+        parser.error("un CSV labellisé ou --activate-version est nécessaire")
+    start = time.perf_counter()
+    y_true, probability = labeled_probabilities(args.input, args.model)
+    result = optimize_threshold(y_true, probability, args.cost_fn, args.cost_fp)
+    fingerprint = file_fingerprint(args.model) if os.path.exists(args.model) else None
+    version = save_artifact(result, fingerprint, args.dir)
+    print(f"Seuil optimal {result['threshold']:.6f} (coût {result['cost']:.0f}, rappel {result['recall']}) "
+          f"sur {len(y_true)} clients en {time.perf_counter() - start:.2f} s : version {version}")
+    if args.activate:
+        activate(result['threshold'], args.threshold_path)
+        print(f"Seuil écrit dans {args.threshold_path}")
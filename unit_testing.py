@@ -10,6 +10,41 @@ import joblib
 import shap
 import numpy as np
 from scipy.special import expit
+import parallel_shap
+import fast_scorer
+import tempfile
+import io
+import asyncio
+import contextvars
+import micro_batcher
+import feature_schema
+import feature_engineering
+import online_features
+import dtype_optimizer
+import global_importance
+import threshold_engine
+import drift_monitor
+import model_registry
+import what_if
+import bulk_scoring
+import client_store
+import result_cache
+import metrics
+import chart_cache
+import api_client
+import http.server
+import threading
+import os
+
+# Les fichiers que l'API écrit au chargement (contrat des features, schémas de types) vont dans un répertoire
+# temporaire, pas dans le dépôt ; les variables sont lues à l'import de main
+generated_dir = tempfile.TemporaryDirectory()
+os.environ['FEATURE_SCHEMA_PATH'] = os.path.join(generated_dir.name, 'feature_schema.json')
+os.environ['FEATURE_DTYPES_PATH'] = os.path.join(generated_dir.name, 'feature_dtypes.json')
+
+import main
+from fastapi.testclient import TestClient
+from unittest import mock
 
 # Rappel sur les notions de classe et d'instance :  
 # class Voiture:  
@@ -75,6 +110,43 @@ def generate_predictions(input_data, threshold):
     return prediction_proba, prediction
 
 
+# Petites tables brutes (mêmes colonnes clés que les fichiers Kaggle) pour tester le feature engineering
+def write_raw_tables(directory, n_clients=60, seed=0):
+    rng = np.random.default_rng(seed)
+    ids = rng.permutation(np.arange(100002, 100002 + 2 * n_clients, 2))
+    for name, main_ids in [('train', ids[:n_clients // 2]), ('test', ids[n_clients // 2:])]:
+        n = len(main_ids)
+        application = pd.DataFrame({'SK_ID_CURR': main_ids, 'AMT_INCOME_TOTAL': rng.integers(2, 40, n) * 1e4, 'AMT_CREDIT': rng.random(n) * 1e6,
+                                    'AMT_ANNUITY': np.where(rng.random(n) < .1, np.nan, rng.random(n) * 3e4),
+                                    'DAYS_EMPLOYED': np.where(rng.random(n) < .2, 365243, -rng.integers(0, 9000, n)),
+                                    'DAYS_BIRTH': -rng.integers(7000, 25000, n), 'CNT_FAM_MEMBERS': rng.integers(1, 5, n).astype(float),
+                                    'NAME_CONTRACT_TYPE': rng.choice(['Cash loans', 'Revolving loans'], n)})
+        # Demande de prêt brute (application_*.csv) et table principale du notebook 01 (app_*_domain.csv)
+        application.to_csv(os.path.join(directory, f'application_{name}.csv'), index=False)
+        feature_engineering.application_domain(application).to_csv(os.path.join(directory, feature_engineering.MAIN_FILES[name]), index=False)
+
+    clients = np.concatenate([ids, [900000, 900002]])
+    n = 3 * n_clients
+    bureau = pd.DataFrame({'SK_ID_CURR': rng.choice(clients, n), 'SK_ID_BUREAU': rng.permutation(np.arange(5000000, 5000000 + n)),
+                           'CREDIT_ACTIVE': rng.choice(['Active', 'Closed', 'Sold'], n), 'DAYS_CREDIT': -rng.integers(0, 3000, n),
+                           'AMT_CREDIT_SUM': np.where(rng.random(n) < .1, np.nan, rng.random(n) * 1e6)})
+    loans = np.repeat(np.concatenate([bureau['SK_ID_BUREAU'][:n - 20], [6000000]]), 4)
+    bureau_balance = pd.DataFrame({'SK_ID_BUREAU': loans, 'MONTHS_BALANCE': -rng.integers(0, 12, len(loans)),
+                                   'STATUS': rng.choice(['0', '1', 'C', 'X'], len(loans))})
+    previous = pd.DataFrame({'SK_ID_PREV': np.arange(1000000, 1000000 + n), 'SK_ID_CURR': rng.choice(clients, n),
+                             'NAME_CONTRACT_TYPE': rng.choice(['Cash loans', 'Consumer loans'], n), 'AMT_APPLICATION': rng.random(n) * 1e5,
+                             'NFLAG_LAST_APPL_IN_DAY': np.where(np.arange(n) % 10 == 0, 0, 1), 'DAYS_DECISION': -rng.integers(1, 3000, n)})
+    rows = rng.integers(0, n, 8 * n_clients)
+    monthly = pd.DataFrame({'SK_ID_PREV': previous['SK_ID_PREV'].to_numpy()[rows], 'SK_ID_CURR': previous['SK_ID_CURR'].to_numpy()[rows],
+                            'MONTHS_BALANCE': -rng.integers(0, 24, len(rows)), 'SK_DPD': np.where(rng.random(len(rows)) < .9, 0, 5),
+                            'AMT_PAYMENT': np.where(rng.random(len(rows)) < .05, np.nan, rng.random(len(rows)) * 1e4),
+                            'NAME_CONTRACT_STATUS': rng.choice(['Active', 'Completed'], len(rows))})
+    tables = {'bureau': bureau, 'bureau_balance': bureau_balance, 'previous': previous, 'cash': monthly,
+              'credit': monthly.drop(columns=['SK_DPD']), 'installments': monthly.drop(columns=['NAME_CONTRACT_STATUS'])}
+    for name, df in tables.items():
+        df.to_csv(os.path.join(directory, feature_engineering.TABLE_FILES[name]), index=False)
+
+
 # Création d'une nouvelle classe appelée TestCreditScoringModel qui hérite de unittest.TestCase, ce qui signifie que notre classe TestCreditScoringModel peut utiliser toutes les méthodes fournies par  unittest.TestCase (assertEqual, assertTrue, assertIn, setUp, etc.).
 # 
 # Cette classe va contenir les tests unitaires que nous allons faire pour notre modèle de scoring de crédit.
@@ -231,6 +303,864 @@ class TestCreditScoringModel(unittest.TestCase):
 
 
 
+    
+    ######################################################################################################################################################
+    # Vérification que le calcul SHAP parallèle donne les mêmes valeurs, dans le même ordre, que le calcul en série
+    ######################################################################################################################################################
+
+    def test_parallel_shap_values(self):
+        batch = self.test_data.iloc[:40, 1:]
+        serial_values = parallel_shap.explain_batch(batch, self.explainer, n_workers=1)
+        parallel_values = parallel_shap.explain_batch(batch, self.explainer, n_workers=2, min_rows=0)
+        np.testing.assert_allclose(parallel_values, serial_values, rtol=0, atol=1e-12)
+
+        # L'additivité est conservée ligne par ligne
+        prediction_proba, _ = generate_predictions(batch, self.optimal_threshold)
+        base_value = self.explainer.expected_value[1]
+        np.testing.assert_allclose(expit(base_value + parallel_values.sum(axis=1)), prediction_proba, atol=1e-5)
+        parallel_shap.shutdown_pool()
+
+
+
+    
+    ######################################################################################################################################################
+    # Vérification que le scorer rapide (Booster LightGBM direct) donne les mêmes probabilités que le pipeline à 1e-9 près
+    ######################################################################################################################################################
+
+    def test_fast_scorer_probabilities(self):
+        features = self.test_data.iloc[:, 1:]
+        scorer = fast_scorer.FastScorer.from_pipeline(model_pipeline)
+        self.assertLessEqual(fast_scorer.max_abs_difference(model_pipeline, scorer, features), 1e-9)
+
+        # Le scorer exporté puis rechargé (format natif LightGBM + JSON) donne les mêmes probabilités
+        with tempfile.TemporaryDirectory() as directory:
+            scorer.export(directory)
+            reloaded = fast_scorer.FastScorer.load(directory)
+            self.assertLessEqual(fast_scorer.max_abs_difference(model_pipeline, reloaded, features), 1e-9)
+
+
+
+
+    ######################################################################################################################################################
+    # Vérification que le modèle allégé (export natif LightGBM relu sans le pipeline) donne le même schéma et les mêmes valeurs SHAP que le pipeline
+    ######################################################################################################################################################
+
+    def test_slim_model_artifact(self):
+        with tempfile.TemporaryDirectory() as directory:
+            fast_scorer.FastScorer.from_pipeline(model_pipeline).export(directory, 'abc')
+            self.assertEqual(fast_scorer.read_source_fingerprint(directory), 'abc')
+            slim = fast_scorer.FastScorer.load(directory)
+
+        self.assertEqual(feature_schema.booster_schema(slim.booster, slim.feature_names), feature_schema.build_schema(model_pipeline))
+        slim_shap = parallel_shap.positive_class_values(shap.Explainer(slim.booster).shap_values(self.selected_data))
+        np.testing.assert_array_equal(slim_shap, parallel_shap.positive_class_values(self.shap_values))
+
+
+
+
+    ######################################################################################################################################################
+    # Vérification que le micro-batching rend à chaque requête concurrente sa propre probabilité, en un seul appel au modèle
+    ######################################################################################################################################################
+
+    def test_micro_batcher_results(self):
+        features = self.test_data.iloc[:20, 1:].to_numpy(dtype=np.float64)
+        scorer = fast_scorer.FastScorer.from_pipeline(model_pipeline)
+        calls = []
+
+        def score(X):
+            calls.append(len(X))
+            return scorer.predict_proba(X)
+
+        async def run():
+            batcher = micro_batcher.MicroBatcher(score, max_wait=0.05, max_rows=64)
+            results = await asyncio.gather(*(batcher.submit(row) for row in features))
+            batcher.close()
+            return results
+
+        results = asyncio.run(run())
+        np.testing.assert_allclose(results, scorer.predict_proba(features), rtol=0, atol=1e-12)
+        self.assertEqual(calls, [len(features)])
+
+
+
+
+    ######################################################################################################################################################
+    # Vérification que le schéma généré depuis le modèle reprend le contrat des colonnes, et que le décodage signale précisément les erreurs
+    ######################################################################################################################################################
+
+    def test_feature_schema(self):
+        features = self.test_data.iloc[:5, 1:]
+        schema = feature_schema.build_schema(model_pipeline, features)
+        self.assertListEqual([feature['name'] for feature in schema['features']], model_pipeline.named_steps['model'].feature_name_)
+        self.assertListEqual([feature['source_name'] for feature in schema['features']], features.columns.tolist())
+        feature_schema.check_columns(schema, features.columns)
+
+        rows = features.astype(object).where(features.notna(), None).values.tolist()
+        np.testing.assert_array_equal(feature_schema.decode_rows(schema, rows), features.to_numpy(dtype=np.float64))
+
+        rows[1][3] = 'abc'
+        rows[2] = rows[2][:-1]
+        with self.assertRaises(feature_schema.SchemaError) as error:
+            feature_schema.decode_rows(schema, rows)
+        self.assertEqual([e['loc'] for e in error.exception.errors],
+                         [['body', 'rows', 1, schema['features'][3]['name']], ['body', 'rows', 2]])
+
+        # Une valeur seule ou une ligne trop courte n'est jamais diffusée sur toutes les features
+        for rows, error_type in [([0.5], 'list_type'), ([[0.5]], 'row_length')]:
+            with self.assertRaises(feature_schema.SchemaError) as error:
+                feature_schema.decode_rows(schema, rows)
+            self.assertEqual([(e['loc'], e['type']) for e in error.exception.errors], [(['body', 'rows', 0], error_type)])
+            response = TestClient(main.app).post('/predict/array', json={'rows': rows})
+            self.assertEqual(response.status_code, 422)
+            self.assertEqual(response.json()['detail'][0]['loc'], ['body', 'rows', 0])
+
+
+
+
+    ######################################################################################################################################################
+    # Vérification que le feature engineering par partitions produit exactement les fichiers du calcul en mémoire (notebook)
+    ######################################################################################################################################################
+
+    def test_feature_engineering_partitions(self):
+        with tempfile.TemporaryDirectory() as directory:
+            write_raw_tables(directory)
+            feature_engineering.build_features(directory, n_partitions=3, workers=2, chunksize=50)
+            tables = feature_engineering.load_tables(directory)
+            for main in ['train', 'test']:
+                expected = feature_engineering.engineer_features(pd.read_csv(os.path.join(directory, feature_engineering.MAIN_FILES[main])), tables)
+                with open(os.path.join(directory, feature_engineering.OUTPUT_FILES[main])) as f:
+                    self.assertEqual(f.read(), expected.to_csv(index=False))
+
+    ##### Test de parité du calcul en ligne (un client à partir de ses données brutes) avec le calcul par lots
+    def test_online_features_parity(self):
+        with tempfile.TemporaryDirectory() as directory:
+            write_raw_tables(directory)
+            plan = feature_engineering.build_features(directory, n_partitions=3, workers=2, chunksize=50)
+            builder = online_features.OnlineFeatureBuilder(plan)
+            tables = {name: pd.read_csv(os.path.join(directory, file)) for name, file in feature_engineering.TABLE_FILES.items()}
+            batch = {main: pd.read_csv(os.path.join(directory, file)) for main, file in feature_engineering.OUTPUT_FILES.items()}
+
+            online = []
+            for application in pd.read_csv(os.path.join(directory, 'application_test.csv')).to_dict('records'):
+                records = {name: df[df['SK_ID_CURR'] == application['SK_ID_CURR']].to_dict('records')
+                           for name, df in tables.items() if name != 'bureau_balance'}
+                loans = [record['SK_ID_BUREAU'] for record in records['bureau']]
+                records['bureau_balance'] = tables['bureau_balance'][tables['bureau_balance']['SK_ID_BUREAU'].isin(loans)]
+                online.append(builder.client_features(application, records))
+            online = pd.concat(online, ignore_index=True)
+            pd.testing.assert_frame_equal(online, batch['test'], check_dtype=False, rtol=1e-6)
+
+            # Préparation pour le modèle : identique à get_dummies + imputation + mise à l'échelle du notebook 05
+            X_train = pd.get_dummies(batch['train'].drop(columns=['SK_ID_CURR']))
+            X_test = pd.get_dummies(batch['test'].drop(columns=['SK_ID_CURR']))
+            X_train, X_test = X_train.align(X_test, join='inner', axis=1)
+            preparation = online_features.ModelPreparation.fit(X_train)
+            expected = preparation.scaler.transform(preparation.imputer.transform(X_test.to_numpy(dtype=float)))
+            np.testing.assert_allclose(preparation.transform(online).to_numpy(), expected, rtol=1e-6)
+
+
+
+
+    ######################################################################################################################################################
+    # Vérification que les types réduits diminuent la mémoire sans changer les prédictions, et que le schéma enregistré est réappliqué tel quel
+    ######################################################################################################################################################
+
+    def test_dtype_optimizer(self):
+        thresholds = dtype_optimizer.model_thresholds(model_pipeline)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'feature_dtypes.json')
+            optimized, report = dtype_optimizer.optimize(self.test_data.copy(), path, thresholds)
+            self.assertLess(report['after'], report['before'])
+
+            columns = model_pipeline.named_steps['model'].feature_name_
+            def probabilities(df):
+                return model_pipeline.predict_proba(pd.DataFrame(df.iloc[:, 1:].to_numpy(dtype=np.float64), columns=columns))[:, 1]
+            np.testing.assert_array_equal(probabilities(optimized), probabilities(self.test_data))
+
+            # Deuxième chargement : le schéma est relu, pas recalculé (les seuils ne sont pas demandés)
+            reloaded, _ = dtype_optimizer.optimize(self.test_data.copy(), path, lambda: self.fail("schéma recalculé"))
+            pd.testing.assert_series_equal(reloaded.dtypes, optimized.dtypes)
+
+        # 0.1 arrondi en float32 passe au-dessus du seuil 0.1 : la colonne doit rester en float64
+        df = pd.DataFrame({'A': [0.1, 0.5], 'B': [0.1, 0.5]})
+        dtypes = dtype_optimizer.infer_dtypes(df, {'A': np.array([0.1])})
+        self.assertEqual(dtypes['A']['dtype'], 'float64')
+        self.assertEqual(dtypes['B']['dtype'], 'float32')
+
+        # Valeurs manquantes dans des colonnes int32 / bool du schéma : aucune valeur inventée (ni 0, ni True)
+        df = pd.DataFrame({'SK_ID_CURR': [100001.0, np.nan], 'FLAG': [1.0, np.nan]})
+        applied = dtype_optimizer.apply_dtypes(df.copy(), {'SK_ID_CURR': {'dtype': 'int32'}, 'FLAG': {'dtype': 'bool'}})
+        pd.testing.assert_frame_equal(applied, df)
+
+        # Un schéma par pipeline
+        self.assertNotEqual(dtype_optimizer.dtypes_path('feature_dtypes.json', 'a'), dtype_optimizer.dtypes_path('feature_dtypes.json', 'b'))
+
+
+
+
+    ######################################################################################################################################################
+    # Vérification que l'importance globale calculée par lots (puis fusionnée) est la moyenne des |SHAP|, globale et par segment
+    ######################################################################################################################################################
+
+    def test_global_importance(self):
+        features = self.test_data.iloc[:300, 1:]
+        shap_matrix = parallel_shap.positive_class_values(self.explainer.shap_values(features))
+        raw = pd.read_csv('application_test_sampled.csv').set_index('SK_ID_CURR')
+        segments = global_importance.segment_labels(raw)
+        ids = self.test_data['SK_ID_CURR'].iloc[:300].to_numpy()
+
+        # Deux parties calculées séparément puis fusionnées
+        first = global_importance.accumulate([(ids[:100], shap_matrix[:100]), (ids[100:200], shap_matrix[100:200])], features.columns, segments)
+        second = global_importance.accumulate([(ids[200:], shap_matrix[200:])], features.columns, segments)
+        merged = first.merge(second)
+        np.testing.assert_allclose(merged.mean().values, np.abs(shap_matrix).mean(axis=0), rtol=1e-12)
+
+        bands = segments.reindex(ids)['income_band']
+        for band in bands.dropna().unique():
+            expected = np.abs(shap_matrix[(bands == band).to_numpy()]).mean(axis=0)
+            np.testing.assert_allclose(merged.mean(f'income_band={band}').values, expected, rtol=1e-12)
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = global_importance.importance_path('abc', directory)
+            merged.save(path)
+            reloaded = global_importance.ImportanceAccumulator.load(path)
+        self.assertEqual(reloaded.segments(), merged.segments())
+        pd.testing.assert_frame_equal(reloaded.to_frame(), merged.to_frame())
+
+
+
+
+    ######################################################################################################################################################
+    # Vérification que la courbe de coût calculée par sommes cumulées est celle de la recherche seuil par seuil, et que les versions se relisent
+    ######################################################################################################################################################
+
+    def test_threshold_engine(self):
+        probability = model_pipeline.predict_proba(self.test_data.iloc[:500, 1:])[:, 1]
+        y_true = (np.random.default_rng(0).random(len(probability)) < probability).astype(int)
+
+        curve = threshold_engine.cost_curve(y_true, probability)
+        for threshold, cost in zip(curve['threshold'], curve['cost']):
+            y_pred = probability >= threshold
+            self.assertEqual(cost, 10 * np.sum((y_true == 1) & ~y_pred) + np.sum((y_true == 0) & y_pred))
+
+        # L'optimum est au moins aussi bon que la grille de 100 seuils du notebook
+        result = threshold_engine.optimize_threshold(y_true, probability)
+        grid_costs = [10 * np.sum((y_true == 1) & (probability < t)) + np.sum((y_true == 0) & (probability >= t)) for t in np.linspace(0, 1, 100)]
+        self.assertLessEqual(result['cost'], min(grid_costs))
+
+        with tempfile.TemporaryDirectory() as directory:
+            version = threshold_engine.save_artifact(result, 'abc', directory)
+            threshold_path = os.path.join(directory, 'optimal_threshold.txt')
+            threshold_engine.activate(threshold_engine.load_artifact(version, directory)['threshold'], threshold_path)
+            with open(threshold_path) as f:
+                threshold = float(f.read())
+            self.assertEqual(threshold, result['threshold'])
+            self.assertEqual(threshold_engine.find_version(threshold, 'abc', directory), version)
+            self.assertIsNone(threshold_engine.find_version(threshold, 'autre modèle', directory))
+
+
+
+
+    ######################################################################################################################################################
+    # Vérification que le moniteur de dérive repère les features modifiées d'une copie perturbée de application_test_sampled.csv, et elles seules
+    ######################################################################################################################################################
+
+    def test_drift_monitor(self):
+        raw = pd.read_csv('application_test_sampled.csv')
+        reference = drift_monitor.DriftSketch.from_reference(raw)
+
+        perturbed = raw.copy()
+        perturbed['AMT_INCOME_TOTAL'] = perturbed['AMT_INCOME_TOTAL'] * 1.5
+        perturbed.loc[perturbed.index[::3], 'NAME_CONTRACT_TYPE'] = 'Revolving loans'
+
+        # Comptage par morceaux, comme une suite de requêtes : mêmes histogrammes qu'en une seule fois
+        current = reference.empty_like()
+        for start in range(0, len(perturbed), 1000):
+            current.update_frame(perturbed.iloc[start:start + 1000])
+        np.testing.assert_array_equal(current.counts, reference.empty_like().update_frame(perturbed).counts)
+
+        report = drift_monitor.drift_report(reference, current).set_index('feature')
+        self.assertEqual(report.loc['AMT_INCOME_TOTAL', 'status'], 'significant')
+        self.assertEqual(report.loc['NAME_CONTRACT_TYPE', 'status'], 'significant')
+        self.assertGreater(report.loc['AMT_INCOME_TOTAL', 'ks'], 0.2)
+        unchanged = report.drop(index=['AMT_INCOME_TOTAL', 'NAME_CONTRACT_TYPE'])
+        self.assertTrue((unchanged['psi'] < 1e-12).all())
+        self.assertTrue((unchanged['status'] == 'stable').all())
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'drift_reference.json')
+            reference.save(path)
+            reloaded = drift_monitor.DriftSketch.load(path)
+        np.testing.assert_array_equal(reloaded.counts, reference.counts)
+        np.testing.assert_array_equal(reloaded.encode(perturbed), reference.encode(perturbed))
+
+
+
+
+    ######################################################################################################################################################
+    # Vérification que les versions du registre se rechargent à l'identique et que le mode shadow compte les décisions qui changent entre deux versions
+    ######################################################################################################################################################
+
+    def test_model_registry(self):
+        features = self.test_data.iloc[:200, 1:]
+        expected = model_pipeline.predict_proba(features)[:, 1]
+
+        with tempfile.TemporaryDirectory() as directory:
+            reference_path = os.path.join(directory, 'reference.csv')
+            self.test_data.head(20).to_csv(reference_path, index=False)
+            thresholds = []
+            # v1 enregistrée avec son jeu de référence, v2 sans
+            for name, threshold, reference in [('v1', 0.5, reference_path), ('v2', 0.3, None)]:
+                threshold_path = os.path.join(directory, f'{name}.txt')
+                with open(threshold_path, 'w') as f:
+                    f.write(str(threshold))
+                model_registry.register('credit_scoring_new.joblib', threshold_path, directory, name, reference)
+                thresholds.append(threshold)
+            model_registry.set_pointer(model_registry.ACTIVE, 'v1', directory)
+            self.assertEqual(model_registry.read_pointer(model_registry.ACTIVE, directory), 'v1')
+            self.assertEqual([meta['version'] for meta in model_registry.list_versions(directory)], ['v1', 'v2'])
+            # Fichiers et répertoires qui ne sont pas des versions : ignorés
+            for name in ('.DS_Store', '.gitkeep'):
+                open(os.path.join(directory, name), 'w').close()
+            os.makedirs(os.path.join(directory, 'notes'))
+            os.makedirs(os.path.join(directory, '.cache'))
+            self.assertEqual([meta['version'] for meta in model_registry.list_versions(directory)], ['v1', 'v2'])
+            with self.assertRaises(ValueError):
+                model_registry.load_version('../v1', directory)
+
+            champion = model_registry.load_version('v1', directory)
+            challenger = model_registry.load_version('v2', directory, reference_path=reference_path)
+            # Le contrat relevé au chargement de v2 est enregistré avec la version
+            saved = feature_schema.load_schema(os.path.join(directory, 'v2', model_registry.SCHEMA_FILE))
+        self.assertEqual(champion.artifact, 'slim')
+        expected_schema = feature_schema.build_schema(model_pipeline, self.test_data.iloc[:20, 1:])
+        expected_schema['pipeline_fingerprint'] = champion.pipeline_fingerprint
+        self.assertEqual(champion.schema, expected_schema)
+        self.assertEqual(challenger.schema, expected_schema)
+        self.assertEqual(saved, expected_schema)
+        self.assertEqual([feature['source_name'] for feature in champion.schema['features']], self.test_data.columns[1:].tolist())
+        X = features.to_numpy(dtype=np.float64)
+        np.testing.assert_allclose(champion.predict_proba(X), expected, rtol=0, atol=1e-12)
+
+        # Même modèle, seuils différents : les probabilités sont identiques et seules les décisions entre les deux seuils changent
+        shadow = model_registry.ShadowScorer()
+        shadow.reset(challenger)
+        for start in range(0, len(X), 50):
+            shadow.submit(champion, X[start:start + 50], expected[start:start + 50])
+        shadow.wait()
+        stats = shadow.stats()
+        self.assertEqual(stats['n_rows'], len(X))
+        self.assertEqual(stats['max_abs_difference'], 0.0)
+        self.assertEqual(stats['flips_to_default'], int(np.sum((expected >= thresholds[1]) & (expected < thresholds[0]))))
+        self.assertEqual(stats['flips_to_accept'], 0)
+
+
+
+
+    ######################################################################################################################################################
+    # Vérification que les variantes what-if, construites à partir d'une seule ligne de base, donnent les mêmes probabilités que les lignes modifiées une à une
+    ######################################################################################################################################################
+
+    def test_what_if(self):
+        features = self.test_data.iloc[:1, 1:]
+        base = features.to_numpy(dtype=np.float64)[0]
+        columns = [0, 2]
+        tried_values = [[0.5, 1.0, 1.5], [0.8, 1.2]]
+        values = what_if.perturbation_values(base, columns, tried_values)
+        scorer = fast_scorer.FastScorer.from_pipeline(model_pipeline)
+
+        for mode in what_if.MODES:
+            X = what_if.perturbation_matrix(base, columns, values, mode, with_base=True)
+            self.assertEqual(X.shape, (what_if.scenario_count(values, mode) + 1, len(base)))
+            if mode == 'grid':
+                variants = [(a, b) for a in values[0] for b in values[1]]
+            else:
+                variants = [(a, base[columns[1]]) for a in values[0]] + [(base[columns[0]], b) for b in values[1]]
+
+            # Référence : une copie de la ligne de base par variante, scorée par le pipeline complet
+            rows = [features.copy()]
+            for a, b in variants:
+                row = features.copy()
+                row.iloc[0, columns[0]], row.iloc[0, columns[1]] = a, b
+                rows.append(row)
+            expected = model_pipeline.predict_proba(pd.concat(rows, ignore_index=True))[:, 1]
+            np.testing.assert_allclose(scorer.predict_proba(X), expected, rtol=0, atol=1e-12)
+
+        # Facteurs relatifs : appliqués à la valeur d'origine, pas à la valeur mise à l'échelle [0, 1]
+        rng = np.random.default_rng(0)
+        raw = pd.DataFrame({'DAYS_BIRTH': -rng.integers(7000, 25000, 200).astype(float), 'AMT_CREDIT': rng.random(200) * 1e6 + 5e4})
+        preparation = online_features.ModelPreparation.fit(raw)
+        scaled = preparation.scaler.transform(raw.to_numpy())[0]
+        relative = what_if.perturbation_values(scaled, [0, 1], [[0.8, 1.2], [0.5]], relative=True, preparation=preparation)
+        expected = preparation.scaler.transform(np.column_stack([raw.iloc[0, 0] * np.array([0.8, 1.2]), [raw.iloc[0, 1]] * 2]))[:, 0]
+        np.testing.assert_allclose(relative[0], expected, rtol=1e-12)
+        np.testing.assert_allclose(preparation.to_raw(relative[1], 1), [raw.iloc[0, 1] * 0.5], rtol=1e-12)
+        with self.assertRaises(ValueError):
+            what_if.perturbation_values(scaled, [0], [[0.8]], relative=True)
+
+        curves = what_if.split_curves(values, np.arange(5))
+        self.assertEqual([curve.tolist() for curve in curves], [[0, 1, 2], [3, 4]])
+        with self.assertRaises(ValueError):
+            what_if.perturbation_matrix(base, columns, values, 'random')
+
+
+
+
+    ######################################################################################################################################################
+    # Vérification que le stock précalculé n'est servi que pour le modèle qui l'a calculé, sans construire l'explainer SHAP de l'API
+    ######################################################################################################################################################
+
+    def test_client_store(self):
+        client = TestClient(main.app)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'features.csv')
+            self.test_data.iloc[:30].to_csv(path, index=False)
+            client_store.build_store(path, model_pipeline, directory, n_workers=1, pipeline_fingerprint=main.active_model.pipeline_fingerprint)
+            store = client_store.ClientStore(directory)
+            self.assertEqual(store.pipeline_fingerprint, main.active_model.pipeline_fingerprint)
+            np.testing.assert_allclose(store.probability_of(int(self.selected_id)), model_pipeline.predict_proba(self.selected_data)[:, 1][0])
+
+            # Client du stock : la valeur de base est celle du stock, l'explainer de l'API n'est pas construit
+            with mock.patch.object(main, 'CLIENT_STORE_DIR', directory), mock.patch.object(main, 'get_explainer', side_effect=AssertionError):
+                response = client.get(f'/clients/{self.selected_id}/decision', params={'top_k': 5})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json()['source'], 'store')
+            self.assertAlmostEqual(response.json()['expected_value'], store.expected_value)
+
+            # Stock calculé avec un autre modèle : il est ignoré et le client est calculé en direct
+            with mock.patch.object(main, 'CLIENT_STORE_DIR', directory), mock.patch.object(main.active_model, 'pipeline_fingerprint', 'autre'), \
+                    mock.patch.object(main, 'FEATURE_DTYPES_PATH', os.path.join(directory, 'feature_dtypes.json')):
+                self.assertIsNone(main.get_client_store())
+                response = client.get(f'/clients/{self.selected_id}/score')
+            self.assertEqual(response.json()['source'], 'live')
+
+
+
+
+    ######################################################################################################################################################
+    # Vérification que les routes d'explication utilisent le seuil et l'explainer de la version prise en début de requête
+    ######################################################################################################################################################
+
+    def test_explain_routes_version(self):
+        client = TestClient(main.app)
+        version = main.active_model
+        response = client.post('/explain', params={'top_k': 3}, json={'data': self.selected_data.to_dict('records')})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['model_version'], version.name)
+        self.assertAlmostEqual(response.json()['expected_value'], version.expected_value())
+        self.assertEqual(client.post('/explain', params={'model_version': 'absente'}, json={'data': []}).status_code, 404)
+
+        # Nouveau seuil pour le même modèle : l'explainer est repris, les décisions suivent le seuil de la nouvelle version
+        try:
+            main.install_model(version.with_threshold(1.0, 'seuil-1'))
+            self.assertIs(main.active_model.explainer, version.explainer)
+            response = client.get(f'/clients/{self.selected_id}/decision', params={'top_k': 3})
+            self.assertEqual(response.json()['prediction'], 0)
+        finally:
+            main.install_model(version)
+
+
+
+
+    ######################################################################################################################################################
+    # Vérification que /predict (route async) vérifie les fichiers du modèle dans le pool de threads, hors de la boucle d'événements
+    ######################################################################################################################################################
+
+    def test_predict_refresh_off_event_loop(self):
+        calls = []
+
+        def refresh():
+            try:
+                asyncio.get_running_loop()
+                calls.append('event loop')
+            except RuntimeError:
+                calls.append('thread')
+
+        client = TestClient(main.app)
+        with mock.patch.object(main, 'refresh_model_if_changed', refresh), mock.patch.object(main, 'last_artifacts_check', float('-inf')):
+            response = client.post('/predict', json={'data': self.selected_data.to_dict('records')})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(calls, ['thread'])
+
+
+
+
+    ######################################################################################################################################################
+    # Vérification du scoring en masse par morceaux : NDJSON et CSV, script et route /predict/bulk
+    ######################################################################################################################################################
+
+    def test_bulk_scoring(self):
+        version = main.active_model
+        data = self.test_data.rename(columns=lambda col: col.replace(' ', '_'))
+        expected = version.predict_proba(data[version.feature_names].to_numpy(dtype=np.float64))
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'clients.csv')
+            self.test_data.head(25).to_csv(path, index=False)
+
+            # 25 lignes par morceaux de 7 : 4 blocs, en-tête CSV écrit une seule fois
+            blocks = list(bulk_scoring.score_chunks(path, version, chunksize=7, output_format='csv'))
+            self.assertEqual(len(blocks), 4)
+            scores = pd.read_csv(io.StringIO(''.join(blocks)))
+            self.assertEqual(scores['SK_ID_CURR'].tolist(), self.test_data['SK_ID_CURR'].head(25).tolist())
+            np.testing.assert_allclose(scores['probability'], expected[:25])
+            self.assertEqual(scores['prediction'].tolist(), (expected[:25] >= version.threshold).astype(int).tolist())
+
+            ndjson = pd.read_json(io.StringIO(''.join(bulk_scoring.score_chunks(path, version, 7))), lines=True)
+            pd.testing.assert_frame_equal(ndjson, scores)
+
+            # Même résultat par l'API ; colonne manquante : 400 avant le début du flux
+            client = TestClient(main.app)
+            with open(path, 'rb') as f:
+                response = client.post('/predict/bulk', params={'chunksize': 7}, content=f.read())
+            self.assertEqual(response.status_code, 200)
+            pd.testing.assert_frame_equal(pd.read_json(io.StringIO(response.text), lines=True), scores)
+            response = client.post('/predict/bulk', content=data.head(3).drop(columns=version.feature_names[0]).to_csv(index=False))
+            self.assertEqual(response.status_code, 400)
+
+
+
+
+    ######################################################################################################################################################
+    # Vérification des routes de scoring par lots (JSON colonnaire, Arrow IPC et Parquet) contre le modèle servi
+    ######################################################################################################################################################
+
+    def test_predict_batch_routes(self):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        version = main.active_model
+        data = self.test_data.head(5).rename(columns=lambda col: col.replace(' ', '_'))
+        expected = version.predict_proba(data[version.feature_names].to_numpy(dtype=np.float64))
+        client = TestClient(main.app)
+
+        # Un identifiant manquant est renvoyé tel quel (null) au lieu de faire échouer le lot
+        ids = data['SK_ID_CURR'].tolist()
+        ids[1] = None
+        payload = {'columns': ['SK_ID_CURR'] + version.feature_names,
+                   'values': [ids] + [[None if pd.isna(v) else float(v) for v in data[col]] for col in version.feature_names]}
+        response = client.post('/predict/batch', json=payload)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['SK_ID_CURR'], [int(ids[0]), None] + [int(i) for i in ids[2:]])
+        np.testing.assert_allclose(response.json()['probability'], expected)
+        self.assertEqual(response.json()['prediction'], (expected >= version.threshold).astype(int).tolist())
+
+        table = pa.Table.from_pandas(data, preserve_index=False)
+        stream = pa.BufferOutputStream()
+        with pa.ipc.new_stream(stream, table.schema) as writer:
+            writer.write_table(table)
+        parquet = pa.BufferOutputStream()
+        pq.write_table(table, parquet)
+        for body in (stream.getvalue().to_pybytes(), parquet.getvalue().to_pybytes()):
+            response = client.post('/predict/batch/arrow', content=body, headers={'Content-Type': 'application/octet-stream'})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json()['SK_ID_CURR'], data['SK_ID_CURR'].tolist())
+            np.testing.assert_allclose(response.json()['probability'], expected)
+
+        # Colonne du modèle manquante
+        payload = {'columns': payload['columns'][:-1], 'values': payload['values'][:-1]}
+        self.assertEqual(client.post('/predict/batch', json=payload).status_code, 400)
+
+
+
+
+    ######################################################################################################################################################
+    # Vérification du cache des résultats : éviction LRU, durée de vie, clés par modèle et vidage au changement de modèle
+    ######################################################################################################################################################
+
+    def test_result_cache(self):
+        cache = result_cache.ResultCache(max_entries=2, ttl=10)
+        with mock.patch.object(result_cache.time, 'monotonic', return_value=100.0) as monotonic:
+            cache.put('a', 1)
+            cache.put('b', 2)
+            self.assertEqual(cache.get('a'), 1)
+            # 'b' est la moins récemment utilisée : c'est elle qui sort
+            cache.put('c', 3)
+            self.assertIsNone(cache.get('b'))
+            self.assertEqual(cache.get('c'), 3)
+
+            monotonic.return_value = 110.5
+            self.assertIsNone(cache.get('a'))
+        self.assertEqual({key: cache.stats()[key] for key in ('entries', 'hits', 'misses', 'evictions')},
+                         {'entries': 1, 'hits': 2, 'misses': 2, 'evictions': 1})
+
+        # Mêmes valeurs (-0.0 / 0.0, NaN) : même clé ; autre modèle ou autres colonnes : autre clé
+        X = np.array([[0.0, np.nan]])
+        key = result_cache.matrix_keys(X, ['A', 'B'], 'm1')[0]
+        self.assertEqual(result_cache.matrix_keys(np.array([[-0.0, np.nan]]), ['A', 'B'], 'm1')[0], key)
+        self.assertNotEqual(result_cache.matrix_keys(X, ['A', 'B'], 'm2')[0], key)
+        self.assertNotEqual(result_cache.matrix_keys(X, ['A', 'C'], 'm1')[0], key)
+
+        # Route /predict : la même requête est relue dans le cache, qui est vidé quand un autre modèle est installé
+        client = TestClient(main.app)
+        rows = self.test_data.iloc[:3, 1:]
+        payload = {'data': rows.astype(object).where(rows.notna(), None).to_dict('records')}
+        version = main.active_model
+        main.predict_cache.clear()
+        try:
+            response = client.post('/predict', json=payload)
+            self.assertEqual(response.status_code, 200)
+            first = response.json()
+            hits = main.predict_cache.stats()['hits']
+            self.assertEqual(client.post('/predict', json=payload).json(), first)
+            self.assertEqual(main.predict_cache.stats()['hits'], hits + 3)
+            main.install_model(version.with_threshold(version.threshold, 'autre'))
+            self.assertEqual(main.predict_cache.stats()['entries'], 0)
+        finally:
+            main.install_model(version)
+
+
+
+
+    ######################################################################################################################################################
+    # Vérification des durées par étape et de l'export au format Prometheus (/metrics)
+    ######################################################################################################################################################
+
+    def test_metrics(self):
+        def request(status_code):
+            timings = metrics.start_request()
+            handler = metrics.instrumented(lambda: 'ok')
+            with metrics.stage('inference'):
+                self.assertEqual(handler(), 'ok')
+            metrics.set_batch_size(7)
+            metrics.finish_request(timings, '/test/metrics', status_code)
+            return timings
+
+        # Chaque requête a son propre chronométrage (ContextVar) : les deux sont isolées dans leur contexte
+        timings = contextvars.copy_context().run(request, 200)
+        contextvars.copy_context().run(request, 503)
+        self.assertLessEqual(timings.start, timings.handler_start)
+        self.assertLessEqual(timings.handler_start, timings.handler_end)
+        self.assertGreater(timings.stages['inference'], 0)
+
+        text = metrics.render({'predict': {'hits': 4, 'misses': 1, 'evictions': 0, 'entries': 5}})
+        for line in ['api_stage_seconds_count{route="/test/metrics",stage="inference"} 2',
+                     'api_stage_seconds_count{route="/test/metrics",stage="parse"} 2',
+                     'api_stage_seconds_bucket{route="/test/metrics",stage="total",le="+Inf"} 2',
+                     'api_batch_size_bucket{route="/test/metrics",le="5"} 0',
+                     'api_batch_size_bucket{route="/test/metrics",le="10"} 2',
+                     'api_requests_total{route="/test/metrics",code="200"} 1',
+                     'api_requests_total{route="/test/metrics",code="503"} 1',
+                     'api_errors_total{route="/test/metrics"} 1',
+                     'api_cache_hits_total{cache="predict"} 4',
+                     'api_cache_entries{cache="predict"} 5']:
+            self.assertIn(line, text.splitlines())
+
+        # Route /metrics : étapes de /predict, avec le modèle de chemin comme libellé
+        client = TestClient(main.app)
+        self.assertEqual(client.post('/predict', json={'data': self.selected_data.to_dict('records')}).status_code, 200)
+        text = client.get('/metrics').text
+        self.assertIn('stage="threshold"', text)
+        self.assertIn('route="/predict"', text)
+        self.assertNotIn('route="/metrics"', text)
+
+
+
+
+    ######################################################################################################################################################
+    # Vérification des agrégats précalculés des graphiques de population du dashboard
+    ######################################################################################################################################################
+
+    def test_chart_cache(self):
+        rng = np.random.default_rng(0)
+        df = pd.DataFrame({'SK_ID_CURR': np.arange(200),
+                           'A': np.append(rng.normal(size=190), [np.nan] * 5 + [50.0] * 5),
+                           'B': rng.uniform(size=200),
+                           'G': np.where(np.arange(200) % 4 == 0, 'x', 'y')})
+        cache = chart_cache.ChartCache(df, bins=10, grid_size=5, max_fliers=3)
+        self.assertEqual(cache.numeric, ['A', 'B'])
+        self.assertEqual(cache.categorical, ['G'])
+
+        counts, edges = cache.histogram('A')
+        self.assertEqual(counts.sum(), 195)
+        np.testing.assert_array_equal(counts, np.histogram(df['A'].dropna(), bins=10)[0])
+        self.assertEqual(cache.counts('G').to_dict(), {'y': 150, 'x': 50})
+
+        # Une boîte par catégorie, valeurs manquantes ignorées et valeurs extrêmes limitées à max_fliers
+        boxes = cache.boxes('A', 'G')
+        self.assertEqual([box['label'] for box in boxes], ['x', 'y'])
+        for box in boxes:
+            group = df.loc[df['G'] == box['label'], 'A'].dropna()
+            self.assertAlmostEqual(box['med'], group.median())
+            self.assertLessEqual(len(box['fliers']), 3)
+
+        # Un couple n'est calculé qu'une fois : l'ordre inverse est la grille transposée
+        grid, x_edges, y_edges = cache.grid('A', 'B')
+        self.assertEqual(grid.shape, (5, 5))
+        self.assertEqual(grid.sum(), 195)
+        transposed, y_edges_2, x_edges_2 = cache.grid('B', 'A')
+        np.testing.assert_array_equal(transposed, grid.T)
+        np.testing.assert_array_equal(x_edges_2, x_edges)
+
+
+
+
+    ######################################################################################################################################################
+    # Vérification du client HTTP du dashboard : connexion réutilisée, nouvelles tentatives sur 503 et erreurs remontées
+    ######################################################################################################################################################
+
+    def test_api_client(self):
+        requests_seen = []
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                requests_seen.append((self.path, self.client_address[1]))
+                # Client 1 : deux erreurs passagères puis la réponse ; client 2 : toujours indisponible
+                attempts = sum(path == self.path for path, _ in requests_seen)
+                if self.path.startswith('/clients/2') or attempts <= 2:
+                    status, body = 503, b'{"detail": "indisponible"}'
+                else:
+                    status, body = 200, b'{"probability": 0.25, "prediction": 0}'
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        client = api_client.ScoringClient(f'http://127.0.0.1:{server.server_address[1]}', retries=3, backoff_factor=0)
+        try:
+            self.assertEqual(client.score(1), {'probability': 0.25, 'prediction': 0})
+            self.assertEqual(len(requests_seen), 3)
+            with self.assertRaises(api_client.APIError) as error:
+                client.score(2)
+            self.assertEqual(error.exception.status_code, 503)
+            self.assertIn('indisponible', str(error.exception))
+            # 1 essai + 3 nouvelles tentatives, toutes sur la même connexion (session persistante)
+            self.assertEqual(len(requests_seen), 3 + 4)
+            self.assertEqual(len({port for _, port in requests_seen}), 1)
+        finally:
+            client.close()
+            server.shutdown()
+            server.server_close()
+
+        # API injoignable : pas de code HTTP
+        with self.assertRaises(api_client.APIError) as error:
+            api_client.ScoringClient(f'http://127.0.0.1:{server.server_address[1]}', retries=0).score(1)
+        self.assertIsNone(error.exception.status_code)
+
+
+
+
+    ######################################################################################################################################################
+    # Vérification que /explain/batch valide les colonnes comme /explain (422 si elles sont dans le désordre)
+    ######################################################################################################################################################
+
+    def test_explain_batch_columns(self):
+        client = TestClient(main.app)
+        rows = self.test_data.iloc[:3, 1:]
+        payload = {'data': rows.astype(object).where(rows.notna(), None).to_dict('records')}
+        response = client.post('/explain/batch', json=payload)
+        self.assertEqual(response.status_code, 200)
+        np.testing.assert_allclose(response.json()['shap_values'], client.post('/explain', json=payload).json()['shap_values'], atol=1e-9)
+
+        shuffled = rows[rows.columns[::-1]]
+        payload = {'data': shuffled.astype(object).where(shuffled.notna(), None).to_dict('records')}
+        for route in ('/explain', '/explain/batch'):
+            response = client.post(route, json=payload)
+            self.assertEqual(response.status_code, 422)
+            self.assertEqual(response.json()['detail'][0]['type'], 'column_order')
+
+
+
+
+    ######################################################################################################################################################
+    # Vérification du repli des courbes what-if du dashboard quand l'API ne peut pas appliquer de facteurs relatifs (503)
+    ######################################################################################################################################################
+
+    def test_what_if_fallback(self):
+        api = TestClient(main.app)
+        calls = []
+
+        def request(method, path, **kwargs):
+            calls.append(kwargs['json']['relative'])
+            response = api.request(method, path, **kwargs)
+            if response.status_code != 200:
+                raise api_client.APIError(str(response.json()), response.status_code)
+            return response.json()
+
+        client = api_client.ScoringClient('http://api')
+        row = self.selected_data.iloc[0].to_dict()
+        features = list(row)[:2]
+        with mock.patch.object(client, '_request', request), mock.patch.object(main, 'online_preparation', None), \
+                mock.patch.object(main, 'MODEL_PREPARATION_PATH', os.path.join(generated_dir.name, 'absent.joblib')):
+            response = client.sensitivity(row, features, [0.5, 1.0, 1.5])
+            # 503 pour les facteurs relatifs, puis les features parcourent [0, 1] en unités du modèle
+            self.assertEqual(calls, [True, False])
+            self.assertFalse(response['relative'])
+            self.assertEqual(response['values'], [[0.0, 0.5, 1.0]] * 2)
+            self.assertEqual(len(response['probability']), 2)
+            # Le repli est gardé : plus de tentative relative
+            client.sensitivity(row, features, [0.5, 1.0, 1.5])
+            self.assertEqual(calls, [True, False, False])
+
+        # Une autre erreur n'est pas masquée par le repli
+        client = api_client.ScoringClient('http://api')
+        with mock.patch.object(client, '_request', side_effect=api_client.APIError('Erreur 422', 422)):
+            with self.assertRaises(api_client.APIError):
+                client.sensitivity(row, features, [0.5, 1.0])
+
+
+
+
+    ######################################################################################################################################################
+    # Vérification que l'explainer SHAP est construit une seule fois, au démarrage, puis réutilisé par toutes les requêtes
+    ######################################################################################################################################################
+
+    def test_explainer_built_once(self):
+        version = main.active_model
+        fresh = version.with_threshold(version.threshold, version.fingerprint)
+        fresh.explainer = None
+        client = TestClient(main.app)
+        rows = self.test_data.iloc[:3, 1:]
+        try:
+            with mock.patch.object(shap, 'Explainer', wraps=shap.Explainer) as explainer:
+                main.install_model(fresh)
+                main.warm_up()
+                self.assertEqual(explainer.call_count, 1)
+                self.assertIsNotNone(fresh.explainer)
+
+                # Une ligne différente par appel : le cache des explications ne sert pas, chaque appel passe par l'explainer
+                for i in range(3):
+                    response = client.post('/explain', json={'data': rows.iloc[[i]].astype(object).where(rows.iloc[[i]].notna(), None).to_dict('records')})
+                    self.assertEqual(response.status_code, 200)
+                self.assertEqual(explainer.call_count, 1)
+        finally:
+            main.install_model(version)
+
+
+
+
+    ######################################################################################################################################################
+    # Vérification que GET /threshold ne relit les versions des seuils que lorsque le répertoire ou le seuil changent
+    ######################################################################################################################################################
+
+    def test_threshold_version_cache(self):
+        model = main.active_model
+        rng = np.random.default_rng(0)
+        result = threshold_engine.optimize_threshold(rng.integers(0, 2, 200), rng.uniform(size=200))
+        result['threshold'] = model.threshold
+        client = TestClient(main.app)
+        with tempfile.TemporaryDirectory() as directory, mock.patch.object(main, 'THRESHOLDS_DIR', directory), \
+                mock.patch.object(threshold_engine, 'find_version', wraps=threshold_engine.find_version) as find_version:
+            first = threshold_engine.save_artifact(result, model.pipeline_fingerprint, directory)
+            for _ in range(3):
+                self.assertEqual(client.get('/threshold').json()['version'], first)
+            self.assertEqual(find_version.call_count, 1)
+
+            # Nouvelle version enregistrée : le répertoire a changé, la recherche est refaite
+            second = threshold_engine.save_artifact(result, model.pipeline_fingerprint, directory)
+            self.assertEqual(client.get('/threshold').json()['version'], second)
+            self.assertEqual(find_version.call_count, 2)
+
+
+
 
 if __name__ == '__main__':
     unittest.main()
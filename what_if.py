@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Scénarios "what-if" d'un client : sa ligne de features sert de base, et quelques features seulement prennent
+# une série de valeurs (ex. AMT_CREDIT réduit de 10 %, 20 %, 30 %). Toutes les variantes sont scorées en un seul
+# appel au modèle, au lieu d'une requête /predict par variante avec la ligne complète.
+#
+# La ligne de base est en unités du modèle : imputée par la médiane puis mise à l'échelle [0, 1] (notebook 05).
+# Un facteur (ex. 0.8 pour "20 % de moins") s'applique donc à la valeur d'origine : elle est retrouvée avec la
+# préparation ajustée (online_features.ModelPreparation), multipliée, puis remise à l'échelle.
+#
+# La matrice des variantes est remplie en une fois à partir de la ligne de base diffusée (np.broadcast_to, sans
+# liste de lignes ni DataFrame intermédiaire), puis seules les colonnes modifiées sont réécrites. Deux modes :
+#     grid        : produit cartésien des valeurs des features (surface de probabilité, une dimension par feature)
+#     independent : chaque feature varie seule, les autres restent à la valeur de base (courbes de sensibilité)
+
+import numpy as np
+
+MODES = ('grid', 'independent')
+
+# Nombre maximal de variantes scorées par requête (borne la mémoire de la matrice)
+MAX_ROWS = 10000
+
+
+def perturbation_values(base, columns, values, relative=False, preparation=None):
+    """
+    Valeurs (unités du modèle) de chaque feature modifiée. Avec relative=True, les valeurs sont des facteurs de la
+    valeur d'origine du client, convertis avec la préparation ajustée (mêmes positions de features que le modèle).
+    """
+    values = [np.asarray(v, dtype=np.float64) for v in values]
+    if relative:
+        if preparation is None:
+            raise ValueError("Des facteurs relatifs demandent la préparation ajustée du modèle (valeurs d'origine)")
+        values = [preparation.to_model(preparation.to_raw(base[j], j) * v, j) for j, v in zip(columns, values)]
+    return values
+
+
+def scenario_count(values, mode='grid'):
+    if mode == 'grid':
+        return int(np.prod([len(v) for v in values]))
+    return int(sum(len(v) for v in values))
+
+
+def perturbation_matrix(base, columns, values, mode='grid', with_base=False):
+    """
+    Matrice des variantes (lignes x features) d'une ligne de base.
+
+    Paramètres
+    --------
+        base (ndarray) :
+            la ligne de base, dans l'ordre des colonnes du modèle
+        columns (list[int]) :
+            positions des features modifiées
+        values (list[ndarray]) :
+            valeurs prises par chacune de ces features
+        mode (str) :
+            'grid' (produit cartésien, ordre de np.meshgrid(..., indexing='ij')) ou 'independent'
+            (les variantes de chaque feature à la suite, dans l'ordre de columns)
+        with_base (bool) :
+            ajoute la ligne de base en première ligne (scorée dans le même appel que les variantes)
+
+    Retour : ndarray contigu, prêt pour le modèle
+    """
+    if mode not in MODES:
+        raise ValueError(f"Mode '{mode}' inconnu ({', '.join(MODES)})")
+    base = np.asarray(base, dtype=np.float64)
+    n_rows = scenario_count(values, mode) + int(with_base)
+
+    # Une seule allocation, remplie à partir de la ligne de base diffusée
+    X = np.empty((n_rows, len(base)), dtype=np.float64)
+    X[:] = np.broadcast_to(base, X.shape)
+    start = int(with_base)
+    if mode == 'grid':
+        for j, grid in zip(columns, np.meshgrid(*values, indexing='ij')):
+            X[start:, j] = grid.ravel()
+    else:
+        for j, v in zip(columns, values):
+            X[start:start + len(v), j] = v
+            start += len(v)
+    return X
+
+
+def split_curves(values, probabilities):
+    """Découpe les probabilités du mode 'independent' en une courbe par feature."""
+    bounds = np.cumsum([len(v) for v in values])[:-1]
+    return np.split(np.asarray(probabilities), bounds)